@@ -7,10 +7,71 @@ For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+# Typeahead requests are abandoned constantly, and change feed long-polls
+# and large exports outlive many clients; stop working on them as soon as
+# the client goes away instead of finishing queries nobody will read.
+CANCELLABLE_PATH_PREFIXES = (
+    '/api/search/async/', '/api/documents/changes/async/', '/api/documents/export/async/',
+)
+
+
+class DisconnectCancellationMiddleware:
+    """
+    Cancel the wrapped application when the client disconnects.
+
+    Django 4.2 only reads ``receive`` until the request body is complete, so
+    it never notices a disconnect. This buffers the body, replays it to
+    Django and keeps listening on the real channel; an ``http.disconnect``
+    cancels the in-flight request task.
+    """
+
+    def __init__(self, app, path_prefixes):
+        self.app = app
+        self.path_prefixes = tuple(path_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(self.path_prefixes):
+            return await self.app(scope, receive, send)
+
+        body_messages = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body_messages.append(message)
+            if not message.get('more_body', False):
+                break
+
+        disconnected = asyncio.Event()
+
+        async def replay_receive():
+            if body_messages:
+                return body_messages.pop(0)
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        app_task = asyncio.ensure_future(self.app(scope, replay_receive, send))
+        disconnect_task = asyncio.ensure_future(receive())
+
+        done, _ = await asyncio.wait({app_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+
+        if app_task in done:
+            disconnect_task.cancel()
+            return app_task.result()
+
+        disconnected.set()
+        app_task.cancel()
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            pass
+
+
+application = DisconnectCancellationMiddleware(get_asgi_application(), CANCELLABLE_PATH_PREFIXES)
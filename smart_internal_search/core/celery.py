@@ -1,8 +1,39 @@
 import os
 from celery import Celery
+from kombu import Queue
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 app = Celery('core')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+
+# Ingestion queues (see core/scheduling.py). Give small uploads their own
+# workers so they never wait behind OCR. Ingestion workers use the threads
+# pool, so concurrent tasks share completion batches (documents/batching.py):
+#   celery -A core worker -Q interactive -P threads -c 8
+#   celery -A core worker -Q interactive,ingest,heavy -P threads -c 8
+#   celery -A core worker -Q heavy,maintenance -c 2
+app.conf.task_queues = [
+    Queue(name, queue_arguments={'x-max-priority': 10})
+    for name in ('interactive', 'ingest', 'heavy', 'maintenance')
+]
+app.conf.task_default_queue = 'ingest'
+app.conf.task_default_priority = 5
+app.conf.task_routes = [
+    'core.scheduling.route_ingestion',
+    {
+        'documents.tasks.reindex_all_documents_task': {'queue': 'maintenance'},
+        'search.tasks.prewarm_search_cache_task': {'queue': 'maintenance'},
+        'documents.tasks.prune_change_events_task': {'queue': 'maintenance'},
+    },
+]
+# Periodic tasks, for a "celery -A core beat" process
+app.conf.beat_schedule = {
+    'prune-change-events': {'task': 'documents.tasks.prune_change_events_task', 'schedule': 3600},
+}
+# Fetch one message at a time so priorities and fair share decide what runs
+# next, and requeue the task if a worker dies while running it
+app.conf.worker_prefetch_multiplier = 1
+app.conf.task_acks_late = True
+
+app.autodiscover_tasks()
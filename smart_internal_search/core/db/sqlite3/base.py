@@ -0,0 +1,46 @@
+"""
+SQLite backend with connection-initialization pragmas.
+
+Extra keys understood in DATABASES[...]['OPTIONS']:
+
+* ``pragmas``: mapping of PRAGMA name to value, run on every new connection
+  (e.g. WAL journal mode, mmap_size, cache_size, busy_timeout).
+* ``transaction_mode``: ``DEFERRED`` (SQLite default), ``IMMEDIATE`` or
+  ``EXCLUSIVE``. ``IMMEDIATE`` takes the write lock when a transaction
+  starts, so concurrent writers queue on busy_timeout instead of failing
+  with "database is locked" when a read transaction is upgraded.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = dict(options.get('pragmas', {}))
+        self.transaction_mode = (options.get('transaction_mode') or 'DEFERRED').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                "settings.DATABASES['%s']['OPTIONS']['transaction_mode'] must be one of %s."
+                % (self.alias, ', '.join(TRANSACTION_MODES))
+            )
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute('PRAGMA %s = %s' % (name, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN %s' % self.transaction_mode)
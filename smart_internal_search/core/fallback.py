@@ -0,0 +1,252 @@
+"""
+Local fallback for Celery tasks when the broker is unreachable.
+
+``submit_task`` publishes a task to Celery without retrying the broker
+connection. If publishing fails, the job is written to a persistent queue
+(one JSON file per job in TASK_FALLBACK['QUEUE_DIR']) and the caller returns
+immediately. A dispatcher thread then works through the queue:
+
+* while the broker is down, jobs run in a bounded local thread pool;
+* once the broker answers again, jobs that have not started are handed
+  over to Celery.
+
+After a broker failure, submissions skip the publish attempt until the
+dispatcher sees the broker again, so uploads never wait on connection
+timeouts. Job files survive restarts. While a job runs, the dispatcher of
+the process running it refreshes the claim file's modification time on
+every pass, so only claims of a process that died go STALE_AFTER seconds
+without an update and are returned to the queue.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_FALLBACK_CONFIG = {
+    'QUEUE_DIR': os.path.join(str(settings.BASE_DIR), 'task_queue'),
+    'MAX_WORKERS': 2,
+    'CONNECT_TIMEOUT': 2,
+    'RETRY_INTERVAL': 10,
+    'STALE_AFTER': 3600,
+}
+
+PENDING_SUFFIX = '.job'
+RUNNING_SUFFIX = '.running'
+
+
+class FallbackExecutor:
+    """Persistent, bounded local executor for tasks the broker could not take"""
+
+    def __init__(self, config=None):
+        self.config = {
+            **DEFAULT_FALLBACK_CONFIG,
+            **getattr(settings, 'TASK_FALLBACK', {}),
+            **(config or {}),
+        }
+        self.directory = str(self.config['QUEUE_DIR'])
+        self._broker_down = False
+        self._running = 0
+        # Jobs this process is running, whose claims it keeps fresh
+        self._claimed = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pool = None
+        self._dispatcher = None
+
+    def submit(self, task, *args, headers=None):
+        """Publish a task to Celery, queueing it locally if the broker is down"""
+        # The dispatcher also picks up jobs left over from a previous run
+        self._start()
+        if not self._broker_down:
+            try:
+                self._publish(task, args, headers)
+                return 'celery'
+            except Exception as e:
+                logger.warning('Celery broker unavailable, queueing %s locally: %s', task.name, e)
+                self._broker_down = True
+
+        self.enqueue(task.name, args, headers)
+        return 'local'
+
+    def enqueue(self, task_name, args, headers=None):
+        os.makedirs(self.directory, exist_ok=True)
+        job = {'task': task_name, 'args': list(args), 'headers': headers, 'queued_at': time.time()}
+        name = f'{time.time_ns():020d}-{uuid.uuid4().hex}'
+        temp_path = os.path.join(self.directory, name + '.tmp')
+        with open(temp_path, 'w') as file:
+            json.dump(job, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, os.path.join(self.directory, name + PENDING_SUFFIX))
+        self._wakeup.set()
+
+    def pending(self):
+        """Names of queued jobs, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len(PENDING_SUFFIX)] for name in names if name.endswith(PENDING_SUFFIX))
+
+    def drain(self):
+        """Hand queued jobs to Celery, or run them locally while the broker is down"""
+        self._refresh_claims()
+        self._requeue_stale()
+        names = self.pending()
+        if self._broker_down and self._broker_available():
+            self._broker_down = False
+
+        for name in names:
+            if not self._broker_down:
+                if self._hand_over(name):
+                    continue
+                self._broker_down = True
+            with self._lock:
+                if self._running >= self.config['MAX_WORKERS']:
+                    return
+                job = self._claim(name)
+                if job is None:
+                    continue
+                self._running += 1
+                self._claimed.add(name)
+            self.pool.submit(self._run, name, job)
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.config['MAX_WORKERS'], thread_name_prefix='task-fallback'
+                    )
+        return self._pool
+
+    def _start(self):
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_loop, name='task-fallback-dispatcher', daemon=True
+                )
+                self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        while True:
+            try:
+                self.drain()
+            except Exception:
+                logger.exception('Draining the local task queue failed')
+            self._wakeup.wait(self.config['RETRY_INTERVAL'])
+            self._wakeup.clear()
+
+    def _connection(self):
+        from core.celery import app
+
+        return app.connection_for_write(connect_timeout=self.config['CONNECT_TIMEOUT'])
+
+    def _publish(self, task, args, headers=None):
+        with self._connection() as connection:
+            # A single attempt: kombu's default retries would stall the caller
+            connection.ensure_connection(max_retries=0)
+            task.apply_async(args, retry=False, connection=connection, headers=headers)
+
+    def _broker_available(self):
+        try:
+            with self._connection() as connection:
+                connection.ensure_connection(max_retries=0)
+            return True
+        except Exception:
+            return False
+
+    def _claim(self, name):
+        """Atomically take a job so no other process runs or hands it over"""
+        running_path = os.path.join(self.directory, name + RUNNING_SUFFIX)
+        try:
+            os.rename(os.path.join(self.directory, name + PENDING_SUFFIX), running_path)
+            # The claim time, not the queue time, decides when a job is stale
+            os.utime(running_path)
+            with open(running_path) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _hand_over(self, name):
+        job = self._claim(name)
+        if job is None:
+            return True
+        try:
+            self._publish(import_string(job['task']), job['args'], job.get('headers'))
+        except Exception:
+            self._release(name)
+            return False
+        self._remove(name)
+        return True
+
+    def _run(self, name, job):
+        close_old_connections()
+        try:
+            import_string(job['task'])(*job['args'])
+        except Exception:
+            logger.exception('Local fallback job %s failed', job['task'])
+        finally:
+            self._remove(name)
+            close_old_connections()
+            with self._lock:
+                self._running -= 1
+                self._claimed.discard(name)
+            self._wakeup.set()
+
+    def _release(self, name):
+        try:
+            os.rename(
+                os.path.join(self.directory, name + RUNNING_SUFFIX),
+                os.path.join(self.directory, name + PENDING_SUFFIX),
+            )
+        except FileNotFoundError:
+            pass
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name + RUNNING_SUFFIX))
+        except FileNotFoundError:
+            pass
+
+    def _refresh_claims(self):
+        with self._lock:
+            names = list(self._claimed)
+        for name in names:
+            try:
+                os.utime(os.path.join(self.directory, name + RUNNING_SUFFIX))
+            except FileNotFoundError:
+                pass
+
+    def _requeue_stale(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        cutoff = time.time() - self.config['STALE_AFTER']
+        for name in names:
+            if name.endswith(RUNNING_SUFFIX):
+                try:
+                    if os.path.getmtime(os.path.join(self.directory, name)) < cutoff:
+                        self._release(name[:-len(RUNNING_SUFFIX)])
+                except FileNotFoundError:
+                    pass
+
+
+# Global fallback executor instance
+fallback_executor = FallbackExecutor()
+
+
+def submit_task(task, *args, headers=None):
+    """Run a Celery task in the background, whether or not the broker is up"""
+    return fallback_executor.submit(task, *args, headers=headers)
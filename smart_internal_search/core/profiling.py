@@ -0,0 +1,237 @@
+"""
+Opt-in per-request profiling for staff users.
+
+A staff user (session or HTTP Basic auth) adds the ``X-Profile: 1`` header
+or the ``?_profile=1`` query flag to any request. The request then runs
+under cProfile, and every SQL statement on the request thread is recorded
+with its duration. SELECT statements also get the database's query plan
+(EXPLAIN QUERY PLAN on SQLite, EXPLAIN on PostgreSQL). The result is saved
+in PROFILING['DIRECTORY'] as ``<id>.prof`` (pstats) plus ``<id>.json``
+(request, SQL and top functions), and the response carries the id in an
+``X-Profile-Id`` header. ``manage.py profiles`` lists and summarizes them.
+
+Work done on other threads, such as the sharded search fan-out, appears in
+the profile only as time spent waiting on it.
+
+The middleware runs in both modes, so async views (search, the change
+feed long-poll, export) are not adapted to a thread for it. In async mode
+the profiler is on while the view is awaited, so other coroutines running
+on the event loop meanwhile are counted too. Requests that do not ask for a
+profile only pay for the header check.
+"""
+import cProfile
+import json
+import os
+import pstats
+import time
+import uuid
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+
+DEFAULT_PROFILING_CONFIG = {
+    'ENABLED': True,
+    'DIRECTORY': os.path.join(str(settings.BASE_DIR), 'profiles'),
+    'HEADER': 'X-Profile',
+    'QUERY_PARAM': '_profile',
+    'MAX_EXPLAIN': 50,
+    'TOP_FUNCTIONS': 40,
+    'KEEP': 200,
+}
+
+
+def profiling_config():
+    return {**DEFAULT_PROFILING_CONFIG, **getattr(settings, 'PROFILING', {})}
+
+
+class _QueryRecorder:
+    """Database execute wrapper that records statements and their durations"""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': self.alias,
+                'sql': sql,
+                'params': self._jsonable(params),
+                'many': many,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+    @staticmethod
+    def _jsonable(params):
+        if params is None or isinstance(params, dict):
+            return params
+        try:
+            return [value if isinstance(value, (int, float, str, bool, type(None))) else str(value)
+                    for value in params]
+        except TypeError:
+            return str(params)
+
+
+class ProfilingMiddleware:
+    """Profiles requests from staff users that ask for it"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = profiling_config()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.config['ENABLED'] or not self._requested(request) or not self._is_staff(request):
+            return self.get_response(request)
+
+        recorders = self._recorders()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with self._recording(recorders):
+            response = profiler.runcall(self.get_response, request)
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        profile_id = self._save(request, response, profiler, self._queries(recorders), duration_ms)
+        response['X-Profile-Id'] = profile_id
+        return response
+
+    async def __acall__(self, request):
+        if not self.config['ENABLED'] or not self._requested(request) \
+                or not await sync_to_async(self._is_staff)(request):
+            return await self.get_response(request)
+
+        recorders = self._recorders()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        # Async ORM calls run on the request's thread-sensitive executor,
+        # whose connections are not the event loop's
+        recording = await sync_to_async(self._recording)(recorders)
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+            await sync_to_async(recording.close)()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        profile_id = await sync_to_async(self._save)(
+            request, response, profiler, self._queries(recorders), duration_ms
+        )
+        response['X-Profile-Id'] = profile_id
+        return response
+
+    @staticmethod
+    def _recorders():
+        return [_QueryRecorder(alias) for alias in connections]
+
+    @staticmethod
+    def _recording(recorders):
+        stack = ExitStack()
+        for recorder in recorders:
+            stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+        return stack
+
+    @staticmethod
+    def _queries(recorders):
+        return [query for recorder in recorders for query in recorder.queries]
+
+    def _requested(self, request):
+        header = 'HTTP_' + self.config['HEADER'].upper().replace('-', '_')
+        return request.META.get(header) in ('1', 'true') or \
+            request.GET.get(self.config['QUERY_PARAM']) in ('1', 'true')
+
+    @staticmethod
+    def _is_staff(request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        if request.META.get('HTTP_AUTHORIZATION', '').lower().startswith('basic '):
+            # API clients authenticate with DRF's Basic auth after middleware runs
+            from rest_framework.authentication import BasicAuthentication
+            from rest_framework.exceptions import AuthenticationFailed
+            from rest_framework.request import Request
+            try:
+                result = BasicAuthentication().authenticate(Request(request))
+            except AuthenticationFailed:
+                return False
+            return bool(result and result[0].is_staff)
+        return False
+
+    def _save(self, request, response, profiler, queries, duration_ms):
+        directory = self.config['DIRECTORY']
+        os.makedirs(directory, exist_ok=True)
+        profile_id = uuid.uuid4().hex[:16]
+        profiler.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+
+        self._explain(queries)
+        record = {
+            'id': profile_id,
+            'created_at': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 3),
+            'sql_count': len(queries),
+            'sql_ms': round(sum(query['ms'] for query in queries), 3),
+            'queries': queries,
+            'top_functions': self._top_functions(profiler),
+        }
+        with open(os.path.join(directory, f'{profile_id}.json'), 'w') as file:
+            json.dump(record, file, indent=1, default=str)
+        self._prune(directory)
+        return profile_id
+
+    def _explain(self, queries):
+        """Attach query plans to the slowest SELECT statements"""
+        selects = [query for query in queries if query['sql'].lstrip().upper().startswith('SELECT')]
+        for query in sorted(selects, key=lambda query: -query['ms'])[:self.config['MAX_EXPLAIN']]:
+            connection = connections[query['alias']]
+            prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(prefix + query['sql'], query['params'])
+                    query['plan'] = [' '.join(str(value) for value in row) for row in cursor.fetchall()]
+            except Exception as e:
+                query['plan_error'] = str(e)
+
+    def _top_functions(self, profiler):
+        rows = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in pstats.Stats(profiler).stats.items():
+            rows.append({
+                'function': f'{self._short_path(filename)}:{line}({function})',
+                'calls': calls,
+                'own_ms': round(own * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3),
+            })
+        rows.sort(key=lambda row: -row['cumulative_ms'])
+        return rows[:self.config['TOP_FUNCTIONS']]
+
+    @staticmethod
+    def _short_path(filename):
+        base_dir = str(settings.BASE_DIR)
+        return os.path.relpath(filename, base_dir) if filename.startswith(base_dir) else filename
+
+    def _prune(self, directory):
+        records = sorted(
+            (entry for entry in os.scandir(directory) if entry.name.endswith('.json')),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in records[:max(0, len(records) - self.config['KEEP'])]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(directory, entry.name[:-len('.json')] + suffix))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import connections
+
+
+READ_DATABASE = 'replica'
+WRITE_DATABASE = 'default'
+
+
+class ReadWriteRouter:
+    """
+    Send read-only traffic to the read connection and every write through
+    the default connection.
+
+    Reads fall back to the default connection while it is inside an atomic
+    block, so code that writes and then reads in one transaction still sees
+    its own uncommitted rows.
+    """
+
+    def _read_database(self):
+        if READ_DATABASE not in settings.DATABASES:
+            return None
+        if connections[WRITE_DATABASE].in_atomic_block:
+            return WRITE_DATABASE
+        return READ_DATABASE
+
+    def db_for_read(self, model, **hints):
+        return self._read_database()
+
+    def db_for_write(self, model, **hints):
+        return WRITE_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {READ_DATABASE, WRITE_DATABASE}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The read connection opens the same file, so only migrate it once
+        return db == WRITE_DATABASE
@@ -0,0 +1,135 @@
+"""
+Cost- and fairness-aware routing for document ingestion tasks.
+
+Each upload gets an estimated processing cost in seconds from its file type
+and size. Cheap uploads go to the 'interactive' queue, OCR-sized work to
+'heavy', and everything else to 'ingest' (see core/celery.py).
+
+Fair share: every team has a virtual finish time, the moment its queued
+work would be done if it had a worker to itself. A new task starts at
+max(now, the team's finish time), and its cost, divided by the team's weight,
+pushes that time further out. How far the start lies in the future (the
+team's lag) sets the message priority. A team that has just queued hundreds
+of scans drops to low priority, while a team with nothing queued keeps top
+priority and, for small files, the interactive queue. Finish times live in
+a shared cache, so every web and Celery process sees them.
+
+The upload path sends the team, file type and size in an ``ingestion``
+message header (see ``ingestion_headers``), so routing needs no query.
+Tasks published without it are looked up in the database.
+"""
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+
+INTERACTIVE_QUEUE = 'interactive'
+INGEST_QUEUE = 'ingest'
+HEAVY_QUEUE = 'heavy'
+MAINTENANCE_QUEUE = 'maintenance'
+
+# Priorities follow RabbitMQ: higher numbers are delivered first
+MAX_PRIORITY = 9
+
+INGESTION_HEADER = 'ingestion'
+
+# (fixed seconds, seconds per MB) of extraction work per file type
+COST_MODEL = {
+    'TXT': (0.05, 0.02),
+    'MD': (0.05, 0.02),
+    'DOCX': (0.2, 0.2),
+    'PPTX': (0.3, 0.3),
+    'XLSX': (0.3, 0.5),
+    'PDF': (0.3, 1.0),  # scanned pages go through OCR
+    'IMAGE': (3.0, 8.0),  # always OCR
+    'OTHER': (0.1, 0.1),
+}
+
+DEFAULT_SCHEDULING_CONFIG = {
+    'CACHE_ALIAS': 'scheduling',
+    'INTERACTIVE_MAX_COST': 1.0,
+    'INTERACTIVE_MAX_LAG': 10.0,
+    'HEAVY_MIN_COST': 10.0,
+    'LAG_PER_PRIORITY': 30.0,
+    'TEAM_WEIGHTS': {},
+}
+
+
+def estimate_cost(file_type, file_size):
+    """Estimated extraction time in seconds"""
+    fixed, per_mb = COST_MODEL.get(file_type, COST_MODEL['OTHER'])
+    return fixed + per_mb * (file_size or 0) / (1024 * 1024)
+
+
+class FairShareScheduler:
+    """Chooses the queue and priority of an ingestion task"""
+
+    def __init__(self, config=None, store=None, clock=time.time):
+        self.config = {
+            **DEFAULT_SCHEDULING_CONFIG,
+            **getattr(settings, 'INGESTION_SCHEDULING', {}),
+            **(config or {}),
+        }
+        self._store = store
+        self.clock = clock
+
+    @property
+    def store(self):
+        """Anything with the cache get()/set() interface"""
+        if self._store is None:
+            return caches[self.config['CACHE_ALIAS']]
+        return self._store
+
+    def plan(self, team_id, file_type, file_size):
+        """Return Celery routing options: {'queue': ..., 'priority': ...}"""
+        cost = estimate_cost(file_type, file_size)
+        lag = self._charge(team_id, cost)
+
+        if cost >= self.config['HEAVY_MIN_COST']:
+            queue = HEAVY_QUEUE
+        elif cost <= self.config['INTERACTIVE_MAX_COST'] and lag <= self.config['INTERACTIVE_MAX_LAG']:
+            queue = INTERACTIVE_QUEUE
+        else:
+            queue = INGEST_QUEUE
+
+        priority = MAX_PRIORITY - int(lag / self.config['LAG_PER_PRIORITY'])
+        return {'queue': queue, 'priority': max(0, min(MAX_PRIORITY, priority))}
+
+    def _charge(self, team_id, cost):
+        """Advance the team's virtual finish time; returns its lag before this task"""
+        now = self.clock()
+        key = f'ingest:finish:{team_id}'
+        start = max(now, self.store.get(key) or 0.0)
+        weight = self.config['TEAM_WEIGHTS'].get(team_id, 1.0)
+        finish = start + cost / weight
+        # Concurrent uploads may race on this read-modify-write; losing an
+        # update only makes a team look slightly less busy than it is
+        self.store.set(key, finish, timeout=max(60, int(finish - now) + 60))
+        return start - now
+
+
+# Global scheduler instance
+scheduler = FairShareScheduler()
+
+
+def ingestion_headers(document):
+    """Message headers that let ``route_ingestion`` plan a document without a query"""
+    return {INGESTION_HEADER: [document.team_id, document.file_type, document.file_size]}
+
+
+def route_ingestion(name, args, kwargs, options, task=None, **kw):
+    """Celery router: place process_document_task by cost and team fair share"""
+    if name != 'documents.tasks.process_document_task':
+        return None
+
+    hint = (options.get('headers') or {}).get(INGESTION_HEADER)
+    if hint:
+        return scheduler.plan(*hint)
+
+    from documents.models import Document
+
+    document_id = args[0] if args else kwargs.get('document_id')
+    row = Document.objects.filter(pk=document_id).values('team_id', 'file_type', 'file_size').first()
+    if row is None:
+        return {'queue': INGEST_QUEUE}
+    return scheduler.plan(row['team_id'], row['file_type'], row['file_size'])
@@ -60,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -86,13 +87,65 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Pragmas run on every new SQLite connection (see core/db/sqlite3/base.py).
+# WAL lets searches read while uploads and Celery workers write.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms to wait for a lock before "database is locked"
+    'cache_size': -64000,  # 64MB page cache per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pragmas': SQLITE_PRAGMAS,
+            # Writers take the lock up front and queue on busy_timeout
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Read-only connection to the same file for search/list traffic
+    'replica': {
+        'ENGINE': 'core.db.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pragmas': {
+                **{k: v for k, v in SQLITE_PRAGMAS.items() if k != 'journal_mode'},
+                'query_only': 'ON',
+            },
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['core.routers.ReadWriteRouter']
+
+# Set DATABASE_ENGINE=postgresql (plus POSTGRES_* variables) to run against
+# PostgreSQL, e.g. a local instance for the full-text search backend.
+if config('DATABASE_ENGINE', default='sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('POSTGRES_DB', default='smart_internal_search'),
+            'USER': config('POSTGRES_USER', default='postgres'),
+            'PASSWORD': config('POSTGRES_PASSWORD', default=''),
+            'HOST': config('POSTGRES_HOST', default='localhost'),
+            'PORT': config('POSTGRES_PORT', default='5432'),
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -177,6 +230,106 @@ SEARCH_CONFIG = {
     'MIN_SEARCH_LENGTH': 2,
     'MAX_SEARCH_RESULTS': 100,
     'ENABLE_FUZZY_SEARCH': True,
+    # 'search.backends.postgres.PostgresSearchBackend' needs DATABASE_ENGINE=postgresql;
+    # 'search.backends.segment.SegmentSearchBackend' uses mmap'd segments in SEARCH_INDEX_DIR
+    'BACKEND': config('SEARCH_BACKEND', default='search.backends.sqlite.SQLiteSearchBackend'),
+    'TEXT_SEARCH_CONFIG': 'english',
+    'MAX_CANDIDATES': 10000,
+    # Team-partitioned fan-out (see search/sharding.py)
+    'SHARDS': {
+        # Only worth enabling with shards on several databases
+        'ENABLED': False,
+        'DATABASES': [],  # aliases (e.g. read replicas) the shards are spread over
+        'LARGE_TEAM_THRESHOLD': 5000,  # documents per hash bucket within a team
+        'MAX_BUCKETS_PER_TEAM': 8,
+        'WORKERS': 4,
+        'MAP_TTL': 60,  # seconds between shard map refreshes
+    },
+    # Bitmap filter index for team/project/file_type/status/topic (see search/facets.py)
+    'FACET_INDEX': {
+        'ENABLED': True,
+        'REFRESH_INTERVAL': 2,  # seconds between cross-process generation checks
+        'MAX_AGE': 300,
+        'MAX_DELTA': 5000,  # pending change events above which a process rebuilds instead
+        'BACKGROUND_REBUILD': True,  # rebuild on a thread and keep serving the current bitmaps
+        'CACHE_ALIAS': 'search',
+    },
+    # Asynchronous query log (see search/querylog.py)
+    'QUERY_LOG': {
+        'ENABLED': True,
+        'BATCH_SIZE': 200,
+        'FLUSH_INTERVAL': 2.0,  # seconds a logged query may wait before it is written
+        'MAX_QUEUE': 10000,  # rows beyond this are dropped rather than block requests
+    },
+    # Cached search and suggestion payloads (see search/caching.py)
+    'RESULT_CACHE': {
+        'ENABLED': True,
+        'TTL': 300,
+        'CACHE_ALIAS': 'search',
+        'PREWARM_QUERIES': 50,
+        'PREWARM_DAYS': 7,
+    },
+    # Tokenizer and token filters for index terms and queries (see search/analysis.py);
+    # changing them requires "manage.py reindex_search" for the segment backend
+    'ANALYZER': {
+        'TOKEN_PATTERN': r'\b\w+\b',
+        'MIN_TOKEN_LENGTH': 2,
+        'FILTERS': ['lowercase', 'asciifold', 'stop', 'porter', 'synonyms'],
+        'SYNONYMS': [],  # groups of single words, e.g. ['cv', 'resume']; each maps to its first word
+    },
+    # "More like this" term selection and caching (see search/related.py)
+    'RELATED': {
+        'ENABLED': True,
+        'MAX_TERMS': 12,
+        'CANDIDATE_TERMS': 40,  # most frequent terms of the document scored by tf-idf
+        'MAX_DOC_RATIO': 0.5,  # skip terms found in more than this share of documents
+        'LIMIT': 10,
+        'MAX_LIMIT': 50,
+        'TTL': 3600,
+        'CACHE_ALIAS': 'search',
+    },
+    # Buffered writes and tiered merging for the segment backend (see search/segment_writer.py)
+    'SEGMENT_WRITER': {
+        'MAX_BUFFERED_DOCS': 500,
+        'FLUSH_INTERVAL': 1.0,  # seconds an unflushed change may wait
+        'MERGE_IN_BACKGROUND': True,
+        'SEGMENTS_PER_TIER': 10,
+        'MAX_MERGE_AT_ONCE': 10,
+        'FLOOR_SEGMENT_DOCS': 1000,
+        'DELETES_PCT_ALLOWED': 20,  # rewrite segments with more tombstones than this
+    },
+}
+
+
+# OCR configuration (see documents/ocr.py for defaults)
+OCR_CONFIG = {
+    'TARGET_DPI': 300,
+    'BINARIZE': True,
+    'TILE_HEIGHT': 2000,
+    'MAX_WORKERS': os.cpu_count() or 1,
+    'CACHE_ALIAS': 'ocr',
+}
+
+# Caches - OCR output, search index generations and ingestion fair-share
+# state are shared between web and Celery processes through file-based caches
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ocr': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'ocr'),
+        'TIMEOUT': None,
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'search'),
+        'TIMEOUT': None,
+    },
+    'scheduling': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'scheduling'),
+    },
 }
 
 
@@ -184,6 +337,70 @@ SEARCH_CONFIG = {
 FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 
+# Ingestion queue routing and per-team fair share (see core/scheduling.py)
+INGESTION_SCHEDULING = {
+    'CACHE_ALIAS': 'scheduling',
+    'INTERACTIVE_MAX_COST': 1.0,  # estimated seconds; cheaper uploads use the interactive queue
+    'INTERACTIVE_MAX_LAG': 10.0,  # ...unless the team already has this much work queued
+    'HEAVY_MIN_COST': 10.0,  # OCR-sized work goes to the heavy queue
+    'LAG_PER_PRIORITY': 30.0,  # seconds of queued team work per priority step
+    'TEAM_WEIGHTS': {},  # team id -> share weight, default 1.0
+}
+
+# Micro-batched saves and index commits in ingestion workers (see documents/batching.py)
+INGESTION_BATCH = {
+    'ENABLED': True,
+    'MAX_DOCUMENTS': 100,
+    'MAX_WAIT_MS': 500,
+}
+
+# MinHash/LSH near-duplicate clustering at ingestion (see documents/dedup.py);
+# run 'manage.py find_duplicates --rebuild' after changing NUM_PERM, BANDS or SHINGLE_SIZE
+NEAR_DUPLICATES = {
+    'ENABLED': True,
+    'NUM_PERM': 128,
+    'BANDS': 16,
+    'SHINGLE_SIZE': 5,  # words per shingle
+    'MAX_SHINGLES': 1000,  # smallest shingle hashes a long text is signed with
+    'THRESHOLD': 0.8,  # estimated Jaccard similarity to join a cluster
+}
+
+# In-process Team/Project/Topic lookups (see documents/taxonomy.py)
+TAXONOMY_CACHE = {
+    'ENABLED': True,
+    'REFRESH_INTERVAL': 1,  # seconds between checks of the shared generation token
+    'MAX_MISSING': 10000,  # unknown ids remembered per kind until the next generation
+    'CACHE_ALIAS': 'search',
+}
+
+# Document change feed at /api/documents/changes/ (see documents/changes.py)
+CHANGE_FEED = {
+    'ENABLED': True,
+    'BATCH_SIZE': 500,
+    'MAX_BATCH_SIZE': 5000,
+    'MAX_WAIT': 25,  # longest ?wait= long-poll, in seconds
+    'POLL_INTERVAL': 0.5,  # seconds between checks of the shared change token
+    'RETENTION_DAYS': 30,  # pruned hourly by documents.tasks.prune_change_events_task
+    'CACHE_ALIAS': 'search',
+}
+
+# Opt-in request profiling for staff: send 'X-Profile: 1' or '?_profile=1' (see core/profiling.py)
+PROFILING = {
+    'ENABLED': config('PROFILING_ENABLED', default=True, cast=bool),
+    'DIRECTORY': os.path.join(BASE_DIR, 'profiles'),
+    'MAX_EXPLAIN': 50,  # slowest SELECTs that get a query plan
+    'KEEP': 200,  # most recent profiles kept on disk
+}
+
+# Local fallback for Celery tasks while the broker is unreachable (see core/fallback.py)
+TASK_FALLBACK = {
+    'QUEUE_DIR': os.path.join(BASE_DIR, 'task_queue'),
+    'MAX_WORKERS': 2,
+    'CONNECT_TIMEOUT': 2,
+    'RETRY_INTERVAL': 10,  # seconds between broker checks
+    'STALE_AFTER': 3600,  # requeue jobs claimed by a process that died
+}
+
 # Search settings
 SEARCH_INDEX_DIR = os.path.join(BASE_DIR, 'search_index')
 CSRF_USE_SESSIONS = False
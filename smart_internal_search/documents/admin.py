@@ -2,6 +2,11 @@ from django.contrib import admin
 
 # Register your models here.
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from search.backends import get_search_backend
 from .models import Document, Team, Project, Topic
 
 
@@ -24,13 +29,68 @@ class TopicAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 
+def estimated_row_count(model, using):
+    """
+    Cheap row-count estimate for a whole table: the planner statistics on
+    PostgreSQL, ANALYZE statistics on SQLite. Returns None when there are
+    no statistics, or for other databases.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # sqlite_stat1 only exists once ANALYZE has run. Tables with
+            # indexes get one row per index, and each stat starts with the
+            # table's row count.
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if not cursor.fetchone():
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the table estimate instead of COUNT(*) for unfiltered changelists
+    of large tables. Filtered and searched lists are counted exactly.
+    """
+    ESTIMATE_ABOVE = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.ESTIMATE_ABOVE:
+                return estimate
+        return super().count
+
+
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
     list_display = ['title', 'file_type', 'team', 'project', 'uploaded_by', 'uploaded_at']
     list_filter = ['file_type', 'team', 'project', 'uploaded_at']
-    search_fields = ['title', 'description', 'content_text']
+    list_select_related = ['team', 'project', 'uploaded_by']
+    # Fallback when the search backend has no index over the extracted text;
+    # content_text is then only scanned for the CONTENT_SCAN_LIMIT newest documents
+    search_fields = ['title', 'description', 'original_filename']
+    CONTENT_SCAN_LIMIT = 5000
+    search_help_text = (
+        'Searches titles, descriptions, file names and extracted text. Without a search index '
+        f'(the default SQLite backend), only the {CONTENT_SCAN_LIMIT} most recently uploaded documents '
+        'are searched by their extracted text.'
+    )
     readonly_fields = ['file_size', 'uploaded_at', 'updated_at', 'last_accessed']
-    filter_horizontal = ['topics']
+    autocomplete_fields = ['topics']
+    raw_id_fields = ['uploaded_by']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         ('Basic Information', {
@@ -46,4 +106,17 @@ class DocumentAdmin(admin.ModelAdmin):
             'fields': ('content_extracted', 'content_text'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text matches come from the search index instead of a LIKE scan over content_text
+        if search_term:
+            matches = get_search_backend().index_search(queryset, search_term)
+            if matches is not None:
+                return matches, False
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            # A LIKE scan over content_text, bounded to the newest documents
+            recent = Document.objects.order_by('-uploaded_at').values('pk')[:self.CONTENT_SCAN_LIMIT]
+            results |= queryset.filter(pk__in=recent, content_text__icontains=search_term)
+        return results, may_have_duplicates
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+Native async views for the ASGI deployment.
+
+The change feed long-poll holds a request for up to CHANGE_FEED['MAX_WAIT']
+seconds, which would tie up a sync worker thread; here it only costs an
+idle coroutine. core.asgi cancels it when the client disconnects.
+
+The export streams through an async iterator, because Django buffers a
+sync StreamingHttpResponse under ASGI (see documents/export.py).
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from .changes import EXPIRED_SINCE, change_feed, parse_params
+from .export import async_chunks, export_response, prepare_export
+
+
+async def document_changes(request):
+    """Document changes after ?since=<seq>; ?wait=<seconds> waits for the next change"""
+    params, errors = parse_params(request.GET)
+    if errors:
+        return JsonResponse(errors, status=400)
+
+    if await sync_to_async(change_feed.expired)(params['since']):
+        return JsonResponse(EXPIRED_SINCE, status=410)
+    if params['wait']:
+        await change_feed.await_changes(params['since'], params['wait'])
+    # Taxonomy names may need a (sync) cache reload
+    payload = await sync_to_async(change_feed.changes)(params['since'], params['limit'], request)
+    return JsonResponse(payload)
+
+
+async def document_export(request):
+    """Documents with their extracted text as NDJSON; same parameters as /documents/export/"""
+    chunks, compress, errors = await sync_to_async(prepare_export)(request.GET, request)
+    if errors:
+        return JsonResponse(errors, status=400)
+    return export_response(async_chunks(chunks), compress)
@@ -0,0 +1,210 @@
+"""
+Micro-batched completion of document processing.
+
+process_document_task hands each extraction result to ``completion_batcher``
+instead of saving and indexing the document on its own. The batcher holds
+results for up to MAX_DOCUMENTS documents or MAX_WAIT_MS milliseconds, then
+writes them in one transaction with a bulk_update per outcome and their
+change feed events, updates the facet bitmaps once, indexes the batch with
+a single index commit, and adds the batch's MinHash signatures to the
+near-duplicate index.
+
+Tasks are acknowledged late, so ``add`` blocks until the batch holding
+the document is committed: a task never reports success for a result that
+is only in memory, and a worker killed mid-batch leaves its tasks to be
+redelivered. Tasks run inside ``processing()``, which counts them, and a
+batch is written as soon as every running task is waiting on it.
+
+Batches therefore only form in a worker process that runs several tasks
+at once. The ingestion workers use the threads pool for this (see
+core/celery.py); extraction mostly waits on parser C code and the
+tesseract subprocess. Under the default prefork pool each child runs one
+task at a time, so every document is written on its own, as it was
+before batching.
+
+If the batched write fails, each document is written in its own
+transaction, so one bad row does not sink the rest. ``add`` raises
+BatchWriteError for a document that still cannot be written, and the task
+retries.
+"""
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from .changes import change_feed
+from .conditional import bump
+from .models import Document
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BATCH_CONFIG = {
+    'ENABLED': True,
+    'MAX_DOCUMENTS': 100,
+    'MAX_WAIT_MS': 500,
+}
+
+PROCESSED_FIELDS = ['status', 'content_extracted', 'content_text', 'updated_at']
+FAILED_FIELDS = ['status', 'processing_error', 'updated_at']
+
+
+class BatchWriteError(Exception):
+    """A processed document could not be written"""
+
+
+class _Batch:
+    def __init__(self):
+        self.done = threading.Event()
+        self.errors = {}
+
+
+class CompletionBatcher:
+    """Collects processed documents and writes them in batches"""
+
+    def __init__(self, config=None):
+        self.config = {
+            **DEFAULT_BATCH_CONFIG,
+            **getattr(settings, 'INGESTION_BATCH', {}),
+            **(config or {}),
+        }
+        self._pending = {}
+        self._batch = _Batch()
+        self._active = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    @contextmanager
+    def processing(self):
+        """Count a running task, so batches close when every task has handed in"""
+        with self._lock:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def add(self, document, signature=None, wait=True):
+        """
+        Queue a document already marked processed or failed (with save=False),
+        with the MinHash signature of its text if one was computed. With
+        ``wait``, return once it is committed, or raise BatchWriteError.
+        """
+        with self._lock:
+            self._pending[document.id] = (document, signature)
+            batch = self._batch
+            full = (
+                not self.config['ENABLED']
+                or len(self._pending) >= self.config['MAX_DOCUMENTS']
+                or (wait and len(self._pending) >= self._active)
+            )
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.config['MAX_WAIT_MS'] / 1000, self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+        if wait:
+            batch.done.wait()
+            error = batch.errors.get(document.id)
+            if error is not None:
+                raise BatchWriteError(f'Document {document.id} could not be written: {error}') from error
+
+    def flush(self):
+        """Write pending documents; returns how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                pending = list(self._pending.values())
+                batch = self._batch
+                self._pending = {}
+                self._batch = _Batch()
+            try:
+                if not pending:
+                    return 0
+                written = self._save(pending, batch.errors)
+                if written:
+                    self._after_commit(written)
+                return len(written)
+            except Exception as error:
+                for document, _ in pending:
+                    batch.errors.setdefault(document.id, error)
+                raise
+            finally:
+                batch.done.set()
+
+    def _save(self, pending, errors):
+        """Commit ``pending`` in one transaction, else one document at a time; returns what was written"""
+        try:
+            self._write(pending)
+            return pending
+        except Exception:
+            logger.exception('Writing a batch of %d processed documents failed; writing them one by one', len(pending))
+        written = []
+        for entry in pending:
+            try:
+                self._write([entry])
+                written.append(entry)
+            except Exception as error:
+                errors[entry[0].id] = error
+        return written
+
+    @staticmethod
+    def _write(pending):
+        documents = [document for document, _ in pending]
+        processed = [document for document in documents if document.status == 'PROCESSED']
+        failed = [document for document in documents if document.status == 'FAILED']
+        with transaction.atomic():
+            if processed:
+                Document.objects.bulk_update(processed, PROCESSED_FIELDS)
+            if failed:
+                Document.objects.bulk_update(failed, FAILED_FIELDS)
+            bump(Document)
+            change_feed.record('PROCESSED', [document.id for document in documents])
+
+    @staticmethod
+    def _after_commit(pending):
+        # bulk_update sends no post_save signals, so do their work here. The
+        # rows are committed; a failure here leaves the index to be rebuilt
+        # (manage.py reindex_search), not the documents to be reprocessed.
+        documents = [document for document, _ in pending]
+        processed = [document for document in documents if document.status == 'PROCESSED']
+        try:
+            from search.facets import facet_index
+            from search.utils import SearchIndexer
+            facet_index.update_documents(documents)
+            if processed:
+                SearchIndexer.index_documents(processed)
+
+            from .dedup import near_duplicates
+            if near_duplicates.enabled:
+                near_duplicates.add_many([
+                    (document.id, signature) for document, signature in pending if document.status == 'PROCESSED'
+                ])
+        except Exception:
+            logger.exception('Indexing a batch of %d processed documents failed', len(documents))
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Writing a batch of processed documents failed')
+        finally:
+            close_old_connections()
+
+
+# Global batcher instance
+completion_batcher = CompletionBatcher()
+
+atexit.register(completion_batcher.flush)
+
+
+@worker_process_shutdown.connect
+def flush_completed_documents(**kwargs):
+    completion_batcher.flush()
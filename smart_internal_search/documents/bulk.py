@@ -0,0 +1,167 @@
+"""
+Set-based bulk operations on documents.
+
+Each operation selects documents by id list, or by the list endpoint's
+``search`` text match plus its filters. An empty selection is refused;
+every document is selected only with an explicit ``all``. Deleting
+anything but an id list needs the ``matched`` count of a dry run, and is
+refused if the selection has changed since. The selected ids are then
+processed in chunks of CHUNK_SIZE, one transaction per operation, with
+set-based SQL:
+
+- add_topics: bulk_create on the topics through table (existing pairs
+  are ignored)
+- remove_topics: one DELETE on the through table
+- move: one UPDATE of team/project
+- delete: QuerySet.delete(), with per-document signal work muted
+
+Per-document signal handlers (facet bitmaps, search index, version
+counters, change feed) are skipped. The same work is done once for the
+whole set: one version bump per table and the change events inside the
+transaction, then one facet publish and one index commit after it.
+Every operation also sets ``updated_at``, so incremental exports pick up
+the change.
+"""
+from django.db import transaction
+from django.utils import timezone
+from .changes import change_feed
+from .conditional import bump
+from .filters import DocumentFilter, has_effective_filters, text_search
+from .models import Document
+from .signals import mute_document_signals
+
+
+CHUNK_SIZE = 500
+
+
+class BulkSelectionError(ValueError):
+    """Invalid ``filters`` for selecting documents"""
+
+    def __init__(self, errors):
+        super().__init__(str(errors))
+        self.errors = errors
+
+
+def select_documents(ids=None, query=None, filters=None, select_all=False):
+    """
+    Ids of the documents an operation applies to.
+
+    Without ids, a query or an effective filter nothing is selected unless
+    ``select_all`` is set; unknown filter names are an error rather than
+    being ignored (which would also select everything).
+    """
+    if ids is not None:
+        queryset = Document.objects.filter(pk__in=ids)
+    elif select_all:
+        queryset = Document.objects.all()
+    else:
+        unknown = sorted(set(filters or {}) - set(DocumentFilter.base_filters))
+        if unknown:
+            raise BulkSelectionError({name: ['Unknown filter.'] for name in unknown})
+        if not query and not has_effective_filters(filters):
+            raise BulkSelectionError({'non_field_errors': ['Empty selection; pass "all": true to select everything.']})
+        filterset = DocumentFilter(filters or {}, queryset=Document.objects.all())
+        if not filterset.is_valid():
+            raise BulkSelectionError(filterset.errors)
+        queryset = filterset.qs
+        if query:
+            queryset = text_search(queryset, query)
+    return list(queryset.order_by('pk').values_list('pk', flat=True).distinct())
+
+
+def chunked(ids, size=CHUNK_SIZE):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def add_topics(document_ids, topic_ids):
+    through = Document.topics.through
+    now = timezone.now()
+    with transaction.atomic():
+        for chunk in chunked(document_ids):
+            through.objects.bulk_create(
+                [through(document_id=document_id, topic_id=topic_id) for document_id in chunk for topic_id in topic_ids],
+                ignore_conflicts=True,
+            )
+            Document.objects.filter(pk__in=chunk).update(updated_at=now)
+        bump(Document, through)
+        change_feed.record('UPDATED', document_ids)
+    _refresh_topic_facets(document_ids)
+    return len(document_ids)
+
+
+def remove_topics(document_ids, topic_ids):
+    through = Document.topics.through
+    now = timezone.now()
+    with transaction.atomic():
+        for chunk in chunked(document_ids):
+            through.objects.filter(document_id__in=chunk, topic_id__in=topic_ids).delete()
+            Document.objects.filter(pk__in=chunk).update(updated_at=now)
+        bump(Document, through)
+        change_feed.record('UPDATED', document_ids)
+    _refresh_topic_facets(document_ids)
+    return len(document_ids)
+
+
+def move(document_ids, team_id=None, project_id=None):
+    """Move to a team (clearing the project) or to a project and its team; team_id=None keeps teams"""
+    from search.facets import facet_index
+
+    values = {'project_id': project_id, 'updated_at': timezone.now()}
+    if team_id is not None:
+        values['team_id'] = team_id
+    with transaction.atomic():
+        for chunk in chunked(document_ids):
+            Document.objects.filter(pk__in=chunk).update(**values)
+        bump(Document)
+        change_feed.record('UPDATED', document_ids)
+
+    if team_id is not None:
+        facet_index.set_values('team', {document_id: [team_id] for document_id in document_ids})
+    facet_index.set_values('project', {document_id: [project_id] if project_id else [] for document_id in document_ids})
+    return len(document_ids)
+
+
+def delete(document_ids):
+    from search.backends import get_search_backend
+    from search.facets import facet_index
+
+    with mute_document_signals(), transaction.atomic():
+        for chunk in chunked(document_ids):
+            # Cascades and SET_NULL relations are still handled by Django
+            Document.objects.filter(pk__in=chunk).only('pk').delete()
+        bump(Document, Document.topics.through)
+        change_feed.record('DELETED', document_ids)
+
+    facet_index.remove_documents(document_ids)
+    backend = get_search_backend()
+    for document_id in document_ids:
+        backend.remove_document(document_id)
+    backend.flush()
+    return len(document_ids)
+
+
+def _refresh_topic_facets(document_ids):
+    from search.facets import facet_index
+
+    topics = {document_id: [] for document_id in document_ids}
+    through = Document.topics.through.objects
+    for chunk in chunked(document_ids):
+        for document_id, topic_id in through.filter(document_id__in=chunk).values_list('document_id', 'topic_id'):
+            topics[document_id].append(topic_id)
+    facet_index.set_values('topic', topics)
+
+
+def run_operation(action, document_ids, topics=None, team=None, project=None):
+    """Apply a validated BulkOperationSerializer action; returns the number of documents"""
+    if not document_ids:
+        return 0
+    if action == 'add_topics':
+        return add_topics(document_ids, topics)
+    if action == 'remove_topics':
+        return remove_topics(document_ids, topics)
+    if action == 'move':
+        return move(document_ids, team, project)
+    if action == 'delete':
+        return delete(document_ids)
+    raise ValueError(f'Unknown bulk action: {action}')
@@ -0,0 +1,195 @@
+"""
+Document change feed.
+
+Every create, update, processing result and delete of a document appends
+a ChangeEvent row, whose id is the change's sequence number. Model
+signals cover single-document writes (see documents/signals.py), and the
+bulk paths that mute signals record their own events. Renaming a team,
+project or topic, and deleting a project or topic, record an update for
+each document that shows it. Events are written in the transaction of the
+change they describe. Consumers call
+``/api/documents/changes/?since=<seq>`` with the ``next`` value of the
+previous response. Each response holds at most one entry per document
+(its latest change in the batch) with the document's current list
+metadata, so a sync costs time proportional to what changed.
+
+Sequence numbers must become visible in order, or a consumer could move
+past an id whose transaction commits later. ``record`` therefore bumps the
+TableVersion row of the ChangeEvent table before inserting. That row lock
+is held until commit, so writers take ids and commit one at a time.
+
+Events older than RETENTION_DAYS are deleted by ``prune()``, hourly from
+Celery beat. Pruning removes every id up to the newest expired one, so a
+consumer whose ``since`` is below the last pruned id may have missed
+changes. It gets a 410 and must resync, for example with an
+export.
+
+The async endpoint long-polls: with ``wait=<seconds>`` it holds the
+request until there is a change after ``since``. Waiters watch a token in
+the shared 'search' cache that ``record`` replaces after each commit, and
+query the database only when it changes.
+"""
+import asyncio
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from .conditional import bump
+from .fast_serializers import COLUMNS, document_rows, format_datetime
+from .models import ChangeEvent, Document
+
+
+DEFAULT_CHANGE_FEED_CONFIG = {
+    'ENABLED': True,
+    'BATCH_SIZE': 500,
+    'MAX_BATCH_SIZE': 5000,
+    'MAX_WAIT': 25,
+    'POLL_INTERVAL': 0.5,
+    'RETENTION_DAYS': 30,
+    'CACHE_ALIAS': 'search',
+}
+
+LATEST_KEY = 'documents:changes:latest'
+
+EXPIRED_SINCE = {'since': ['Changes after this sequence number have been pruned; resync and start again.']}
+
+
+class ChangeFeed:
+    """Records document changes and serves them in sequence order"""
+
+    def __init__(self, config=None):
+        self.config = {
+            **DEFAULT_CHANGE_FEED_CONFIG,
+            **getattr(settings, 'CHANGE_FEED', {}),
+            **(config or {}),
+        }
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    def record(self, action, document_ids):
+        """Append one ``action`` event per document id"""
+        document_ids = list(document_ids)
+        if not self.enabled or not document_ids:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            # Serializes writers until commit, so ids are committed in order
+            bump(ChangeEvent)
+            ChangeEvent.objects.bulk_create(
+                [ChangeEvent(document_id=document_id, action=action, created_at=now) for document_id in document_ids],
+                batch_size=500,
+            )
+            transaction.on_commit(self._publish)
+
+    def prune(self, now=None):
+        """Delete events older than RETENTION_DAYS; returns how many"""
+        cutoff = (now or timezone.now()) - timedelta(days=self.config['RETENTION_DAYS'])
+        # Ids rise with time, and deleting a prefix lets expired() compare ids
+        last = ChangeEvent.objects.filter(created_at__lt=cutoff).aggregate(last=Max('id'))['last']
+        if last is None:
+            return 0
+        deleted, _ = ChangeEvent.objects.filter(id__lte=last).delete()
+        return deleted
+
+    def expired(self, since):
+        """Whether events after ``since`` may have been pruned"""
+        if not since:
+            return False
+        # Everything below the oldest remaining id was pruned; a consumer at
+        # the last pruned id has seen it all (gaps from rollbacks only make
+        # this err towards a resync)
+        oldest = ChangeEvent.objects.aggregate(oldest=Min('id'))['oldest']
+        return oldest is not None and since < oldest - 1
+
+    def batch_size(self, requested=None):
+        return max(1, min(requested or self.config['BATCH_SIZE'], self.config['MAX_BATCH_SIZE']))
+
+    def changes(self, since=0, limit=None, request=None):
+        """The body of a change feed response for events after ``since``"""
+        limit = self.batch_size(limit)
+        events = list(
+            ChangeEvent.objects.filter(id__gt=since).order_by('id')
+            .values_list('id', 'document_id', 'action', 'created_at')[:limit + 1]
+        )
+        has_more = len(events) > limit
+        events = events[:limit]
+
+        latest = {}
+        for event in events:
+            latest[event[1]] = event
+        live_ids = [document_id for document_id, event in latest.items() if event[2] != 'DELETED']
+        rows = {
+            row['id']: row
+            for row in document_rows(Document.objects.filter(pk__in=live_ids).values_list(*COLUMNS), request)
+        }
+
+        changes = [
+            {
+                'seq': seq,
+                'document_id': document_id,
+                'action': action,
+                'changed_at': format_datetime(created_at),
+                # None once the document no longer exists
+                'document': rows.get(document_id),
+            }
+            for seq, document_id, action, created_at in sorted(latest.values())
+        ]
+        return {
+            'since': since,
+            'next': events[-1][0] if events else since,
+            'has_more': has_more,
+            'changes': changes,
+        }
+
+    async def await_changes(self, since, wait):
+        """Wait up to ``wait`` seconds for an event after ``since``; returns whether one exists"""
+        deadline = time.monotonic() + min(wait, self.config['MAX_WAIT'])
+        # Read the token before checking, so a change committed in between is not missed
+        token = await self.cache.aget(LATEST_KEY)
+        while True:
+            if await ChangeEvent.objects.filter(id__gt=since).aexists():
+                return True
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                await asyncio.sleep(min(self.config['POLL_INTERVAL'], remaining))
+                current = await self.cache.aget(LATEST_KEY)
+                if current != token or current is None:
+                    token = current
+                    break
+
+    def _publish(self):
+        self.cache.set(LATEST_KEY, uuid.uuid4().hex, None)
+
+
+def parse_params(params):
+    """Read since, limit and wait from query parameters; returns (values, errors)"""
+    values = {}
+    errors = {}
+    for name, default in (('since', 0), ('limit', None), ('wait', 0)):
+        raw = params.get(name)
+        if raw in (None, ''):
+            values[name] = default
+            continue
+        try:
+            values[name] = int(raw)
+        except ValueError:
+            values[name] = None
+        if values[name] is None or values[name] < 0:
+            errors[name] = ['Expected a non-negative integer.']
+    return values, errors
+
+
+# Global change feed instance
+change_feed = ChangeFeed()
@@ -0,0 +1,127 @@
+"""
+Conditional GET support from per-table change counters.
+
+Every write to a tracked table bumps its TableVersion row: model signals
+handle saves, deletes and topic changes (see documents/signals.py), and
+bulk paths that skip signals call ``bump`` themselves. A view decorated with
+``conditional(Model, ...)`` reads the counters of the tables it depends on
+(one small query). It answers If-None-Match / If-Modified-Since with a 304
+before running its own queries or serializers. Otherwise it adds ETag and
+Last-Modified headers to the response.
+
+The ETag covers the counters plus everything else a response varies on:
+the full path with its query string, the host (absolute file URLs), the
+negotiated format, and the generation of this process's taxonomy cache.
+Names come from that cache and can lag a rename in another process; the
+generation makes the ETag change again once the new names are loaded.
+Last-Modified is the newest counter change and has the one-second
+resolution of HTTP dates. Clients that send both headers are matched on
+the ETag.
+
+Views only save Document.access_count and last_accessed, and those saves
+do not bump the counters, so reading a document takes no lock on the
+shared TableVersion row. Responses that show the access fields pass
+``accessed=True``: their ETag then also covers a token in the shared
+'search' cache that ``record_access`` replaces after each such save.
+Last-Modified is left out of those responses, because the token has no
+time.
+"""
+import hashlib
+import uuid
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.views.decorators.http import condition
+from .taxonomy import taxonomy
+
+
+ACCESS_CACHE_ALIAS = 'search'
+ACCESS_KEY = 'documents:access:token'
+
+
+def table_name(model):
+    return model._meta.db_table
+
+
+def bump(*models):
+    """Record a change to the tables of ``models`` (models or m2m through models)"""
+    from .models import TableVersion
+
+    now = timezone.now()
+    for table in sorted({table_name(model) for model in models}):
+        updated = TableVersion.objects.filter(table=table).update(version=F('version') + 1, updated_at=now)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    TableVersion.objects.create(table=table, version=1, updated_at=now)
+            except IntegrityError:
+                # Another process created the row first
+                TableVersion.objects.filter(table=table).update(version=F('version') + 1, updated_at=now)
+
+
+def table_versions(models):
+    """Map table -> (version, updated_at) for ``models``; untouched tables are (0, None)"""
+    from .models import TableVersion
+
+    tables = [table_name(model) for model in models]
+    versions = {table: (0, None) for table in tables}
+    for table, version, updated_at in TableVersion.objects.filter(table__in=tables).values_list(
+        'table', 'version', 'updated_at'
+    ):
+        versions[table] = (version, updated_at)
+    return versions
+
+
+def record_access():
+    """Change the access token after an access-only save commits"""
+    transaction.on_commit(lambda: caches[ACCESS_CACHE_ALIAS].set(ACCESS_KEY, uuid.uuid4().hex, None))
+
+
+def access_token():
+    cache = caches[ACCESS_CACHE_ALIAS]
+    token = cache.get(ACCESS_KEY)
+    if token is None:
+        # Evicted or never set: a new token, so no old ETag can match
+        cache.add(ACCESS_KEY, uuid.uuid4().hex, None)
+        token = cache.get(ACCESS_KEY)
+    return token
+
+
+def conditional(*models, skip=None, accessed=False):
+    """
+    View decorator for conditional GETs on data from ``models``.
+
+    Requests for which ``skip(request)`` is true get no validators, for
+    responses that depend on writes that do not bump the counters.
+    ``accessed`` adds the access token to the ETag, for responses that
+    show access counts.
+
+    Works on function views; wrap it in ``method_decorator`` for viewset
+    methods. With @api_view, apply it below the DRF decorators.
+    """
+    def stamp(request):
+        if skip is not None and skip(request):
+            return None, None
+        # The ETag and Last-Modified callbacks share one counter query
+        cached = getattr(request, '_table_stamp', None)
+        if cached is None:
+            versions = table_versions(models)
+            fingerprint = '|'.join([
+                ','.join(f'{table}:{version}' for table, (version, _) in sorted(versions.items())),
+                request.get_host(),
+                request.get_full_path(),
+                request.META.get('HTTP_ACCEPT', ''),
+                str(taxonomy.generation()),
+                access_token() if accessed else '',
+            ])
+            changed = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+            last_modified = max(changed) if changed and not accessed else None
+            cached = (hashlib.sha1(fingerprint.encode('utf-8')).hexdigest(), last_modified)
+            request._table_stamp = cached
+        return cached
+
+    return condition(
+        etag_func=lambda request, *args, **kwargs: stamp(request)[0],
+        last_modified_func=lambda request, *args, **kwargs: stamp(request)[1],
+    )
@@ -0,0 +1,185 @@
+"""
+Near-duplicate detection with MinHash and locality-sensitive hashing.
+
+process_document_task computes a MinHash signature of the extracted text:
+the text is split into overlapping SHINGLE_SIZE-word shingles, each
+shingle is hashed, and each of NUM_PERM hash permutations keeps its
+minimum value. The share of equal positions between two signatures
+estimates the Jaccard similarity of their shingle sets.
+
+Applying the permutations costs NUM_PERM multiplications per shingle, so
+long texts only use their MAX_SHINGLES smallest shingle hashes. The same
+shingles always hash the same way, so two texts keep a consistent sample
+and their similarity estimate holds.
+
+Signatures are cut into BANDS bands, and each band is hashed into an
+LSHBucket row indexed on (band, bucket). Documents that share any bucket
+are candidates, so a new document is compared only with the few documents
+returned by one indexed lookup, not the whole corpus. With the defaults
+(16 bands of 8 rows) pairs above ~0.7 similarity almost always collide.
+A document joins the cluster of its most similar candidate at or above
+THRESHOLD, otherwise it starts a cluster named after its own id. Clusters
+are never merged or split afterwards.
+
+Search can collapse each cluster to its best-ranked member (see
+search/caching.py). ``manage.py find_duplicates`` fingerprints documents
+processed before this existed and reports the clusters.
+"""
+import hashlib
+import heapq
+import random
+import struct
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from .conditional import bump
+from .models import DocumentFingerprint, LSHBucket
+
+
+DEFAULT_NEAR_DUPLICATE_CONFIG = {
+    'ENABLED': True,
+    'NUM_PERM': 128,
+    'BANDS': 16,
+    'SHINGLE_SIZE': 5,
+    'MAX_SHINGLES': 1000,
+    'THRESHOLD': 0.8,
+}
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+class NearDuplicateIndex:
+    """MinHash signatures plus a database-backed LSH index over them"""
+
+    def __init__(self, config=None):
+        self.config = {
+            **DEFAULT_NEAR_DUPLICATE_CONFIG,
+            **getattr(settings, 'NEAR_DUPLICATES', {}),
+            **(config or {}),
+        }
+        if self.config['NUM_PERM'] % self.config['BANDS']:
+            raise ValueError('NEAR_DUPLICATES NUM_PERM must be a multiple of BANDS')
+        self.rows_per_band = self.config['NUM_PERM'] // self.config['BANDS']
+        # Fixed seed: signatures must be comparable across processes and restarts
+        rng = random.Random(1)
+        self._permutations = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(self.config['NUM_PERM'])
+        ]
+        self._packer = struct.Struct(f"<{self.config['NUM_PERM']}Q")
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    def shingles(self, text):
+        words = (text or '').lower().split()
+        size = self.config['SHINGLE_SIZE']
+        if len(words) <= size:
+            return {' '.join(words)} if words else set()
+        return {' '.join(words[start:start + size]) for start in range(len(words) - size + 1)}
+
+    def signature(self, text):
+        """MinHash signature of ``text`` as a tuple of NUM_PERM ints, or None for empty text"""
+        hashes = {_hash64(shingle.encode('utf-8')) % MERSENNE_PRIME for shingle in self.shingles(text)}
+        if len(hashes) > self.config['MAX_SHINGLES']:
+            hashes = heapq.nsmallest(self.config['MAX_SHINGLES'], hashes)
+        if not hashes:
+            return None
+        prime = MERSENNE_PRIME
+        return tuple(min((a * value + b) % prime for value in hashes) for a, b in self._permutations)
+
+    @staticmethod
+    def similarity(first, second):
+        """Estimated Jaccard similarity of two signatures"""
+        return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+    def bands(self, signature):
+        rows = self.rows_per_band
+        for band in range(self.config['BANDS']):
+            data = struct.pack(f'<{rows}Q', *signature[band * rows:(band + 1) * rows])
+            # Signed, to fit a BigIntegerField
+            yield band, _hash64(data) - (1 << 63)
+
+    def add(self, document_id, signature):
+        """Store a signature, assign the document to a cluster and return its cluster id"""
+        return self.add_many([(document_id, signature)])[document_id]
+
+    def add_many(self, signatures):
+        """
+        Like ``add`` for many (document id, signature) pairs in one transaction.
+        Earlier documents of the batch are candidates for later ones.
+        """
+        clusters = {}
+        with transaction.atomic():
+            # Collapsed search results are cached per version of this table
+            bump(DocumentFingerprint)
+            for document_id, signature in signatures:
+                DocumentFingerprint.objects.filter(document_id=document_id).delete()
+                LSHBucket.objects.filter(document_id=document_id).delete()
+                if signature is None:
+                    continue
+                bands = list(self.bands(signature))
+                cluster_id, similarity = self._closest_cluster(document_id, signature, bands)
+                DocumentFingerprint.objects.create(
+                    document_id=document_id, signature=self._packer.pack(*signature),
+                    cluster_id=cluster_id, similarity=similarity,
+                )
+                LSHBucket.objects.bulk_create([
+                    LSHBucket(document_id=document_id, band=band, bucket=bucket) for band, bucket in bands
+                ])
+                clusters[document_id] = cluster_id
+        return clusters
+
+    def candidates(self, bands, exclude=None):
+        """Ids of documents sharing at least one band bucket"""
+        match = Q()
+        for band, bucket in bands:
+            match |= Q(band=band, bucket=bucket)
+        queryset = LSHBucket.objects.filter(match)
+        if exclude is not None:
+            queryset = queryset.exclude(document_id=exclude)
+        return set(queryset.values_list('document_id', flat=True))
+
+    def clusters(self, document_ids):
+        """Map document id -> cluster id for fingerprinted documents"""
+        return dict(
+            DocumentFingerprint.objects.filter(document_id__in=document_ids).values_list('document_id', 'cluster_id')
+        )
+
+    def collapse(self, document_ids):
+        """Keep the first id of each cluster, preserving order"""
+        clusters = self.clusters(document_ids)
+        seen = set()
+        kept = []
+        for document_id in document_ids:
+            cluster_id = clusters.get(document_id, ('document', document_id))
+            if cluster_id not in seen:
+                seen.add(cluster_id)
+                kept.append(document_id)
+        return kept
+
+    def _closest_cluster(self, document_id, signature, bands):
+        best = (document_id, 1.0)
+        best_similarity = 0.0
+        candidates = self.candidates(bands, exclude=document_id)
+        if not candidates:
+            return best
+        rows = DocumentFingerprint.objects.filter(document_id__in=candidates).values_list(
+            'signature', 'cluster_id'
+        )
+        for packed, cluster_id in rows:
+            if len(packed) != self._packer.size:
+                continue  # stored before NUM_PERM changed; refreshed by find_duplicates --rebuild
+            similarity = self.similarity(signature, self._packer.unpack(bytes(packed)))
+            if similarity >= self.config['THRESHOLD'] and similarity > best_similarity:
+                best, best_similarity = (cluster_id, similarity), similarity
+        return best
+
+
+# Global near-duplicate index instance
+near_duplicates = NearDuplicateIndex()
@@ -0,0 +1,157 @@
+"""
+Streaming NDJSON export of documents and their extracted text.
+
+One JSON object per line, ordered by (updated_at, id). Rows are read from
+a ``values_list().iterator()`` cursor (server-side on PostgreSQL) in
+chunks of CHUNK_SIZE. The topics and taxonomy names for each chunk are
+resolved before it is encoded, so memory stays constant however many
+documents are exported. Output is produced as byte chunks, optionally
+gzip-compressed on the fly, for a StreamingHttpResponse or a file.
+
+For incremental pulls, pass the largest ``updated_at`` seen so far as
+``since``: documents updated at or after it are exported again, so the
+boundary is never missed, and consumers upsert by ``id``.
+
+Under ASGI, Django buffers a StreamingHttpResponse over a sync iterator
+in full before sending it. Deployments on ASGI use the async view in
+documents/async_views.py, which hands Django ``async_chunks()``. That
+pulls one chunk at a time from the same generator on the sync thread,
+where the database cursor lives.
+"""
+import json
+import zlib
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .fast_serializers import format_datetime
+from .filters import DocumentFilter
+from .models import Document
+from .taxonomy import taxonomy
+
+
+CHUNK_SIZE = 500
+FLUSH_BYTES = 64 * 1024
+
+EXPORT_COLUMNS = (
+    'id', 'title', 'description', 'file', 'original_filename', 'file_type', 'file_size',
+    'uploaded_by__username', 'team_id', 'project_id', 'uploaded_at', 'updated_at',
+    'status', 'content_extracted', 'content_text',
+)
+
+
+def export_queryset(queryset=None, since=None):
+    """Documents to export, in a stable order that resumes cleanly with ``since``"""
+    queryset = Document.objects.all() if queryset is None else queryset
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since)
+    return queryset.order_by('updated_at', 'id')
+
+
+def export_records(queryset, chunk_size=CHUNK_SIZE):
+    """Yield one dict per document"""
+    rows = queryset.values_list(*EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+    through = Document.topics.through
+    storage = Document._meta.get_field('file').storage
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        topics = {}
+        for document_id, topic_id in through.objects.filter(
+            document_id__in=[row[0] for row in chunk]
+        ).order_by('document_id', 'topic_id').values_list('document_id', 'topic_id'):
+            topics.setdefault(document_id, []).append({'id': topic_id, 'name': taxonomy.name('topic', topic_id)})
+
+        for (document_id, title, description, file, file_name, file_type, file_size, uploaded_by,
+             team_id, project_id, uploaded_at, updated_at, status, content_extracted, content_text) in chunk:
+            yield {
+                'id': document_id,
+                'title': title,
+                'description': description,
+                'file_url': storage.url(file) if file else None,
+                'file_name': file_name,
+                'file_type': file_type,
+                'file_size': file_size,
+                'uploaded_by': uploaded_by,
+                'team_id': team_id,
+                'team_name': taxonomy.name('team', team_id),
+                'project_id': project_id,
+                'project_name': taxonomy.name('project', project_id),
+                'topics': topics.get(document_id, []),
+                'uploaded_at': format_datetime(uploaded_at),
+                'updated_at': format_datetime(updated_at),
+                'status': status,
+                'content_extracted': content_extracted,
+                'content_text': content_text,
+            }
+
+
+def ndjson_chunks(records, compress=False):
+    """Encode records as NDJSON byte chunks of roughly FLUSH_BYTES each"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+    for record in records:
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            data = b''.join(buffer)
+            buffer, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+
+    data = b''.join(buffer)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+async def async_chunks(chunks):
+    """Async iterator over a sync chunk generator; closing it closes the generator and its cursor"""
+    done = object()
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+def prepare_export(params, request=None):
+    """
+    Read since, gzip and the list filters from query parameters; returns
+    (chunks, compress, errors)
+    """
+    since = params.get('since')
+    if since:
+        since = parse_datetime(since)
+        if since is None:
+            return None, False, {'since': ['Expected an ISO 8601 datetime.']}
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+    # The list filters (team, project, topics, ...) apply here too
+    filterset = DocumentFilter(params, queryset=Document.objects.all(), request=request)
+    if not filterset.is_valid():
+        return None, False, filterset.errors
+
+    compress = params.get('gzip') in ('1', 'true')
+    return ndjson_chunks(export_records(export_queryset(filterset.qs, since)), compress=compress), compress, None
+
+
+def export_response(chunks, compress):
+    """A StreamingHttpResponse over sync or async ``chunks``"""
+    if compress:
+        response = StreamingHttpResponse(chunks, content_type='application/gzip')
+        response['Content-Disposition'] = 'attachment; filename="documents.ndjson.gz"'
+    else:
+        response = StreamingHttpResponse(chunks, content_type='application/x-ndjson')
+    return response
@@ -0,0 +1,175 @@
+"""
+Text extractors keyed by Document.file_type.
+
+Parsers (PyPDF2, python-docx, python-pptx, pandas, Pillow/pytesseract) are
+imported inside each extractor, so importing this module - or anything that
+imports it, such as documents.tasks - costs nothing until a file of that type
+is actually extracted.
+
+Extra extractors can be registered in settings.DOCUMENT_EXTRACTORS
+({'FILE_TYPE': 'dotted.path.to.callable'}) or by an installed package through
+the ``smart_internal_search.extractors`` entry point group, where the entry
+point name is the file type and the value is ``module:callable``.
+"""
+from importlib import metadata
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+ENTRY_POINT_GROUP = 'smart_internal_search.extractors'
+
+BUILTIN_EXTRACTORS = {
+    'PDF': 'documents.extractors.extract_from_pdf',
+    'DOCX': 'documents.extractors.extract_from_docx',
+    'PPTX': 'documents.extractors.extract_from_pptx',
+    'XLSX': 'documents.extractors.extract_from_excel',
+    'TXT': 'documents.extractors.extract_from_txt',
+    'IMAGE': 'documents.extractors.extract_from_image',
+}
+
+
+class ExtractorRegistry:
+    """Maps file types to extractor callables, resolving each on first use"""
+
+    def __init__(self):
+        self._sources = {}
+        self._resolved = {}
+        self._configured = False
+
+    def register(self, file_type, extractor):
+        """Register a callable, dotted path or entry point for a file type"""
+        self._sources[file_type] = extractor
+        self._resolved.pop(file_type, None)
+
+    def get(self, file_type):
+        """Return the extractor for a file type, or None if there is none"""
+        self._configure()
+        if file_type not in self._resolved:
+            source = self._sources.get(file_type)
+            if source is None:
+                return None
+            self._resolved[file_type] = self._resolve(source)
+        return self._resolved[file_type]
+
+    def file_types(self):
+        self._configure()
+        return sorted(self._sources)
+
+    def _configure(self):
+        # Built-ins first, then entry points, then settings so that a
+        # deployment can always override what a package installs.
+        if self._configured:
+            return
+        self._configured = True
+        for file_type, path in BUILTIN_EXTRACTORS.items():
+            self._sources.setdefault(file_type, path)
+        for entry_point in metadata.entry_points(group=ENTRY_POINT_GROUP):
+            self._sources[entry_point.name.upper()] = entry_point
+        for file_type, path in getattr(settings, 'DOCUMENT_EXTRACTORS', {}).items():
+            self._sources[file_type] = path
+
+    @staticmethod
+    def _resolve(source):
+        if isinstance(source, metadata.EntryPoint):
+            return source.load()
+        if isinstance(source, str):
+            return import_string(source)
+        return source
+
+
+registry = ExtractorRegistry()
+
+
+def extract_from_pdf(file_path):
+    """Extract text from PDF files, routing text-less (scanned) pages to OCR"""
+    import PyPDF2
+    from .ocr import OCRProcessor
+
+    ocr = OCRProcessor()
+    page_texts = []
+    scanned_pages = {}
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page_number, page in enumerate(pdf_reader.pages):
+            page_text = page.extract_text() or ""
+            page_texts.append(page_text)
+            if len(page_text.strip()) < ocr.config['MIN_PAGE_TEXT_LENGTH']:
+                try:
+                    images = [image.data for image in page.images]
+                except Exception:
+                    images = []
+                if images:
+                    scanned_pages[page_number] = images
+
+    if scanned_pages:
+        # OCR every scanned page image in one parallel batch
+        flat = [(page_number, data) for page_number, images in scanned_pages.items() for data in images]
+        try:
+            texts = ocr.ocr_images([data for _, data in flat])
+        except Exception:
+            texts = [""] * len(flat)
+        ocr_text = {}
+        for (page_number, _), page_text in zip(flat, texts):
+            ocr_text.setdefault(page_number, []).append(page_text)
+        for page_number, parts in ocr_text.items():
+            page_texts[page_number] = "\n".join(
+                [page_texts[page_number].strip()] + [part for part in parts if part]
+            ).strip()
+
+    text = ""
+    for page_text in page_texts:
+        text += page_text + "\n"
+    return text.strip()
+
+
+def extract_from_docx(file_path):
+    """Extract text from Word documents"""
+    import docx
+
+    doc = docx.Document(file_path)
+    text = ""
+    for paragraph in doc.paragraphs:
+        text += paragraph.text + "\n"
+    return text.strip()
+
+
+def extract_from_pptx(file_path):
+    """Extract text from PowerPoint presentations"""
+    from pptx import Presentation
+
+    prs = Presentation(file_path)
+    text = ""
+    for slide in prs.slides:
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                text += shape.text + "\n"
+    return text.strip()
+
+
+def extract_from_excel(file_path):
+    """Extract text from Excel files"""
+    import pandas as pd
+
+    text = ""
+    # Read all sheets
+    excel_file = pd.ExcelFile(file_path)
+    for sheet_name in excel_file.sheet_names:
+        df = pd.read_excel(file_path, sheet_name=sheet_name)
+        text += f"Sheet: {sheet_name}\n"
+        text += df.to_string() + "\n\n"
+    return text.strip()
+
+
+def extract_from_txt(file_path):
+    """Extract text from plain text files"""
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+        return file.read().strip()
+
+
+def extract_from_image(file_path):
+    """Extract text from images using OCR"""
+    # Errors propagate, so an unreadable scan is marked failed
+    from .ocr import OCRProcessor
+
+    # Preprocessed, tiled and cached OCR
+    return OCRProcessor().ocr_image_file(file_path)
@@ -0,0 +1,71 @@
+"""
+Document list filters that validate team, project and topic ids against
+the in-process taxonomy cache.
+
+django-filter's default model choice filters run a query per parameter
+just to check that the id exists. These behave the same (invalid ids are a
+400, several ``topics`` values match any of them) without that query.
+"""
+import django_filters
+from django.db.models import Q
+from django_filters import fields
+from .models import Document
+from .taxonomy import taxonomy
+
+
+def text_search(queryset, query):
+    """The list endpoint's ``search`` parameter: a substring of any text field"""
+    return queryset.filter(
+        Q(title__icontains=query) |
+        Q(description__icontains=query) |
+        Q(content_text__icontains=query) |
+        Q(original_filename__icontains=query)
+    )
+
+
+def has_effective_filters(filters):
+    """Whether a filters dict narrows the selection at all"""
+    return any(value not in (None, '', [], ()) for value in (filters or {}).values())
+
+
+def taxonomy_choices(kind):
+    return [(pk, row['name']) for pk, row in sorted(taxonomy.rows(kind).items())]
+
+
+class TaxonomyChoiceMixin:
+    def __init__(self, *args, kind, **kwargs):
+        self.kind = kind
+        kwargs.setdefault('choices', lambda: taxonomy_choices(kind))
+        super().__init__(*args, **kwargs)
+
+    def valid_value(self, value):
+        try:
+            return taxonomy.exists(self.kind, int(value))
+        except (TypeError, ValueError):
+            return False
+
+
+class TaxonomyChoiceField(TaxonomyChoiceMixin, fields.ChoiceField):
+    pass
+
+
+class TaxonomyMultipleChoiceField(TaxonomyChoiceMixin, fields.MultipleChoiceField):
+    pass
+
+
+class TaxonomyChoiceFilter(django_filters.ChoiceFilter):
+    field_class = TaxonomyChoiceField
+
+
+class TaxonomyMultipleChoiceFilter(django_filters.MultipleChoiceFilter):
+    field_class = TaxonomyMultipleChoiceField
+
+
+class DocumentFilter(django_filters.FilterSet):
+    team = TaxonomyChoiceFilter(kind='team')
+    project = TaxonomyChoiceFilter(kind='project')
+    topics = TaxonomyMultipleChoiceFilter(kind='topic', distinct=True)
+
+    class Meta:
+        model = Document
+        fields = ['team', 'project', 'file_type', 'topics', 'status']
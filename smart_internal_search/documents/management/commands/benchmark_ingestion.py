@@ -0,0 +1,86 @@
+import contextlib
+import io
+import random
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from documents.batching import CompletionBatcher
+from documents.models import Document, Team
+from search.utils import SearchIndexer
+
+
+WORDS = [
+    'marketing', 'strategy', 'report', 'content', 'analytics', 'campaign', 'budget',
+    'seo', 'plan', 'quarterly', 'review', 'audience', 'brand', 'social', 'growth',
+]
+BENCHMARK_PREFIX = '__ingestion_benchmark__'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-document saves and index updates with micro-batched completion. '
+        'Creates temporary documents in the configured database and removes them afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=1000, help='Documents to complete per run')
+        parser.add_argument('--batch-size', type=int, default=100, help='MAX_DOCUMENTS for the batched run')
+        parser.add_argument('--words', type=int, default=400, help='Words of extracted text per document')
+
+    def handle(self, *args, **options):
+        team = Team.objects.first()
+        user = User.objects.first()
+        if team is None or user is None:
+            raise CommandError('Create at least one team and user first (see seed_data)')
+
+        rng = random.Random(0)
+        texts = [' '.join(rng.choice(WORDS) for _ in range(options['words'])) for _ in range(options['documents'])]
+        Document.objects.bulk_create([
+            Document(
+                title=f'{BENCHMARK_PREFIX} {n}', file=f'benchmark/{n}.txt', file_type='TXT',
+                original_filename=f'{n}.txt', team=team, uploaded_by=user,
+            )
+            for n in range(options['documents'])
+        ])
+        documents = Document.objects.filter(title__startswith=BENCHMARK_PREFIX)
+
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                per_document = self._run(documents, texts, self._complete_one_by_one)
+                documents.update(status='PENDING', content_extracted=False, content_text='')
+                batcher = CompletionBatcher({'ENABLED': True, 'MAX_DOCUMENTS': options['batch_size']})
+                batched = self._run(documents, texts, lambda document, text: self._complete_batched(
+                    batcher, document, text
+                ), finish=batcher.flush)
+        finally:
+            # Deleting one by one keeps the facet bitmaps and search index in step
+            for document in documents:
+                document.delete()
+
+        count = options['documents']
+        self.stdout.write(f"{'mode':<14}{'seconds':>10}{'docs/s':>10}")
+        for name, seconds in (('per-document', per_document), ('batched', batched)):
+            self.stdout.write(f'{name:<14}{seconds:>10.2f}{count / seconds:>10.0f}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Batched completion: {per_document / batched:.1f}x the per-document throughput'
+        ))
+
+    def _run(self, documents, texts, complete, finish=None):
+        started = time.perf_counter()
+        for document, text in zip(documents.order_by('id'), texts):
+            complete(document, text)
+        if finish:
+            finish()
+        return time.perf_counter() - started
+
+    @staticmethod
+    def _complete_one_by_one(document, text):
+        # What process_document_task did before batching
+        document.mark_processed(text)
+        SearchIndexer.index_document(document)
+
+    @staticmethod
+    def _complete_batched(batcher, document, text):
+        # One thread stands in for many concurrent tasks, so do not wait per document
+        document.mark_processed(text, save=False)
+        batcher.add(document, wait=False)
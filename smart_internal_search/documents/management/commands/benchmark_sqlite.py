@@ -0,0 +1,161 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+READ_SQL = (
+    "SELECT id, title FROM documents_document "
+    "WHERE title LIKE ? OR description LIKE ? OR content_text LIKE ? "
+    "ORDER BY uploaded_at DESC LIMIT 100"
+)
+WRITE_SQL = (
+    "UPDATE documents_document SET access_count = access_count + 1, "
+    "last_accessed = CURRENT_TIMESTAMP WHERE id = ?"
+)
+SEARCH_TERMS = ['report', 'strategy', 'seo', 'content', 'marketing', 'analytics', 'plan']
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent read throughput of the default and tuned SQLite configurations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Concurrent reader threads')
+        parser.add_argument('--writers', type=int, default=2, help='Concurrent writer threads')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run')
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=5000,
+            help='Pad the benchmark copy with duplicated documents up to this many rows',
+        )
+
+    def handle(self, *args, **options):
+        source = str(settings.DATABASES['default']['NAME'])
+        if not os.path.exists(source):
+            raise CommandError(f'Database {source} does not exist; run migrate first')
+
+        workdir = tempfile.mkdtemp(prefix='sqlite-bench-')
+        try:
+            baseline = self._run(
+                self._prepare(source, workdir, 'baseline.sqlite3', options['rows'], wal=False),
+                pragmas={},
+                transaction_mode='DEFERRED',
+                **options,
+            )
+            tuned_pragmas = settings.DATABASES['default'].get('OPTIONS', {}).get(
+                'pragmas', settings.SQLITE_PRAGMAS
+            )
+            tuned = self._run(
+                self._prepare(source, workdir, 'tuned.sqlite3', options['rows'], wal=True),
+                pragmas=tuned_pragmas,
+                transaction_mode='IMMEDIATE',
+                **options,
+            )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(
+            f"{'config':<10}{'reads/s':>10}{'writes/s':>10}{'read errors':>13}{'write errors':>14}"
+        )
+        for name, result in (('baseline', baseline), ('tuned', tuned)):
+            self.stdout.write(
+                f"{name:<10}{result['reads'] / options['seconds']:>10.0f}"
+                f"{result['writes'] / options['seconds']:>10.0f}"
+                f"{result['read_errors']:>13}{result['write_errors']:>14}"
+            )
+
+        if baseline['reads']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Concurrent read throughput: {tuned['reads'] / baseline['reads']:.1f}x baseline"
+            ))
+
+    def _prepare(self, source, workdir, name, rows, wal):
+        """Copy the database with the backup API and pad it to the requested size"""
+        path = os.path.join(workdir, name)
+        with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode = %s' % ('WAL' if wal else 'DELETE'))
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(documents_document)') if row[1] != 'id']
+        column_list = ', '.join(columns)
+        count = conn.execute('SELECT COUNT(*) FROM documents_document').fetchone()[0]
+        if not count:
+            conn.close()
+            raise CommandError('The documents table is empty; seed some data first')
+        while count < rows:
+            conn.execute(
+                f"INSERT INTO documents_document ({column_list}) "
+                f"SELECT {column_list} FROM documents_document LIMIT ?",
+                (rows - count,),
+            )
+            count = conn.execute('SELECT COUNT(*) FROM documents_document').fetchone()[0]
+        conn.commit()
+        conn.close()
+        return path
+
+    def _connect(self, path, pragmas):
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        for pragma, value in pragmas.items():
+            conn.execute('PRAGMA %s = %s' % (pragma, value))
+        return conn
+
+    def _run(self, path, pragmas, transaction_mode, readers, writers, seconds, **options):
+        result = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+        conn = sqlite3.connect(path)
+        max_id = conn.execute('SELECT MAX(id) FROM documents_document').fetchone()[0]
+        conn.close()
+
+        def reader(seed):
+            conn = self._connect(path, pragmas)
+            reads = errors = 0
+            i = seed
+            while not stop.is_set():
+                pattern = f'%{SEARCH_TERMS[i % len(SEARCH_TERMS)]}%'
+                i += 1
+                try:
+                    conn.execute(READ_SQL, (pattern, pattern, pattern)).fetchall()
+                    reads += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+            conn.close()
+            with lock:
+                result['reads'] += reads
+                result['read_errors'] += errors
+
+        def writer(seed):
+            conn = self._connect(path, pragmas)
+            writes = errors = 0
+            i = seed
+            while not stop.is_set():
+                i += 1
+                try:
+                    conn.execute(f'BEGIN {transaction_mode}')
+                    conn.execute(WRITE_SQL, ((i * 7919) % max_id + 1,))
+                    conn.execute('COMMIT')
+                    writes += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+            conn.close()
+            with lock:
+                result['writes'] += writes
+                result['write_errors'] += errors
+
+        threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+        threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return result
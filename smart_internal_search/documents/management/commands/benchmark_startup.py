@@ -0,0 +1,77 @@
+import json
+import statistics
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Parser modules the web worker used to import through documents.utils
+PARSER_MODULES = ['PyPDF2', 'docx', 'pptx', 'pandas', 'PIL.Image', 'pytesseract', 'magic']
+
+PROBE = """
+import importlib, json, resource, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+import documents.tasks, documents.serializers, documents.views, search.views
+skipped = []
+for name in sys.argv[1:]:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        skipped.append(name)
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': elapsed, 'rss_kb': rss_kb, 'skipped': skipped}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure Django startup time and RSS with lazy vs eager document parser imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Number of fresh interpreters to start per mode',
+        )
+
+    def handle(self, *args, **options):
+        lazy = self._measure([], options['runs'])
+        eager = self._measure(PARSER_MODULES, options['runs'])
+
+        self.stdout.write(f"{'mode':<8}{'startup (ms)':>14}{'max RSS (MB)':>14}")
+        for name, result in (('lazy', lazy), ('eager', eager)):
+            self.stdout.write(
+                f"{name:<8}{result['seconds'] * 1000:>14.1f}{result['rss_kb'] / 1024:>14.1f}"
+            )
+
+        if eager['skipped']:
+            self.stdout.write(self.style.WARNING(
+                f"Not installed, excluded from eager run: {', '.join(eager['skipped'])}"
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Lazy extractor registry saves {(eager['seconds'] - lazy['seconds']) * 1000:.1f} ms "
+            f"and {(eager['rss_kb'] - lazy['rss_kb']) / 1024:.1f} MB per worker"
+        ))
+
+    def _measure(self, modules, runs):
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, '-c', PROBE, *modules],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+
+        return {
+            'seconds': statistics.median(sample['seconds'] for sample in samples),
+            'rss_kb': statistics.median(sample['rss_kb'] for sample in samples),
+            'skipped': samples[0]['skipped'],
+        }
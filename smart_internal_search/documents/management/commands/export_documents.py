@@ -0,0 +1,48 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from documents.export import export_queryset, export_records, ndjson_chunks
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Export documents and their extracted text as NDJSON, one document per line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help="Output file, or '-' for stdout")
+        parser.add_argument('--since', help='Only documents updated at or after this ISO 8601 datetime')
+        parser.add_argument('--team', type=int, help='Only documents of this team id')
+        parser.add_argument('--gzip', action='store_true', help='gzip-compress the output')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since datetime: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        queryset = Document.objects.all()
+        if options['team']:
+            queryset = queryset.filter(team_id=options['team'])
+
+        count = 0
+
+        def counted(records):
+            nonlocal count
+            for record in records:
+                count += 1
+                yield record
+
+        chunks = ndjson_chunks(counted(export_records(export_queryset(queryset, since))), compress=options['gzip'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            with open(options['output'], 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+        self.stderr.write(f'Exported {count} documents')
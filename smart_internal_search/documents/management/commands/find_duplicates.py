@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from documents.conditional import bump
+from documents.dedup import near_duplicates
+from documents.models import Document, DocumentFingerprint, LSHBucket
+
+
+class Command(BaseCommand):
+    help = 'Fingerprint processed documents for near-duplicate detection and list the largest clusters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop every fingerprint and cluster first (after changing NEAR_DUPLICATES)')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--show', type=int, default=10, help='Clusters to list')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            LSHBucket.objects.all().delete()
+            DocumentFingerprint.objects.all().delete()
+            bump(DocumentFingerprint)
+
+        # Oldest first, so the earliest upload names each cluster
+        documents = (
+            Document.objects.filter(status='PROCESSED', fingerprint__isnull=True)
+            .order_by('uploaded_at', 'id').values_list('id', 'content_text')
+        )
+        batch = []
+        added = 0
+        for document_id, content_text in documents.iterator(chunk_size=options['batch_size']):
+            batch.append((document_id, near_duplicates.signature(content_text)))
+            if len(batch) >= options['batch_size']:
+                added += len(near_duplicates.add_many(batch))
+                batch = []
+        if batch:
+            added += len(near_duplicates.add_many(batch))
+        self.stdout.write(f'Fingerprinted {added} documents')
+
+        clusters = (
+            DocumentFingerprint.objects.values('cluster_id').annotate(size=Count('document'))
+            .filter(size__gt=1).order_by('-size', 'cluster_id')
+        )
+        duplicates = sum(row['size'] - 1 for row in clusters)
+        self.stdout.write(f'{len(clusters)} clusters with near-duplicates, {duplicates} redundant documents')
+        for row in clusters[:options['show']]:
+            titles = list(
+                Document.objects.filter(fingerprint__cluster_id=row['cluster_id'])
+                .order_by('-uploaded_at').values_list('title', flat=True)[:5]
+            )
+            self.stdout.write(f"  cluster {row['cluster_id']} ({row['size']} documents): {'; '.join(titles)}")
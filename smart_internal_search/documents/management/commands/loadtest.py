@@ -0,0 +1,397 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from documents.changes import change_feed
+from documents.conditional import bump
+from documents.models import Document, Team
+from documents.utils import percentile
+from search.backends import get_search_backend
+from search.facets import facet_index
+
+
+WORDS = [
+    'marketing', 'strategy', 'report', 'content', 'analytics', 'campaign', 'budget', 'seo',
+    'quarterly', 'review', 'audience', 'brand', 'social', 'growth', 'revenue', 'roadmap',
+    'launch', 'pricing', 'competitor', 'keyword', 'newsletter', 'webinar', 'funnel', 'retention',
+]
+CORPUS_PREFIX = '__loadtest__'
+DEFAULT_MIX = 'typeahead=50,search=20,browse=20'
+# Uploads are only in the default mix of a served run, whose corpus is removed afterwards
+SERVED_MIX = DEFAULT_MIX + ',upload=10'
+LABELS = ('suggestions', 'search', 'list', 'retrieve', 'upload')
+
+
+class _Connection:
+    """Minimal HTTP/1.1 keep-alive client on asyncio streams"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        for attempt in range(2):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            head = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+            head += [f'{name}: {value}' for name, value in (headers or {}).items()]
+            try:
+                self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+                await self.writer.drain()
+                return await self._read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                # Only a kept-alive connection that the server dropped is retried
+                if not reused or attempt:
+                    raise
+
+    async def _read_response(self):
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+                body += chunk[:-2]
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class _VirtualUser:
+    """Runs scripted sessions and records one sample per request"""
+
+    def __init__(self, host, port, samples, rng, think, team_ids):
+        self.connection = _Connection(host, port)
+        self.samples = samples
+        self.rng = rng
+        self.think = think
+        self.team_ids = team_ids
+
+    async def call(self, label, method, path, body=b'', headers=None):
+        started = time.perf_counter()
+        try:
+            status, payload = await self.connection.request(method, path, body, headers)
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            status, payload = 0, b''
+        self.samples.append((label, time.perf_counter() - started, status))
+        if 200 <= status < 300:
+            try:
+                return json.loads(payload or b'null')
+            except ValueError:
+                return None
+        return None
+
+    async def pause(self, low, high):
+        if self.think:
+            await asyncio.sleep(self.rng.uniform(low, high) * self.think)
+
+    async def typeahead(self):
+        """Type a query a key at a time, then search and open a result"""
+        query = ' '.join(self.rng.sample(WORDS, self.rng.choice([1, 1, 2])))
+        for end in range(2, len(query) + 1):
+            await self.call('suggestions', 'GET', '/api/search/suggestions/?' + urlencode({'q': query[:end]}))
+            await self.pause(0.05, 0.15)
+        data = await self.call('search', 'GET', '/api/search/?' + urlencode({'q': query}))
+        if data and data.get('results') and self.rng.random() < 0.6:
+            await self.pause(0.5, 2)
+            document_id = self.rng.choice(data['results'][:5])['id']
+            await self.call('retrieve', 'GET', f'/api/documents/documents/{document_id}/')
+
+    async def search(self):
+        params = {'q': self.rng.choice(WORDS)}
+        if self.team_ids and self.rng.random() < 0.5:
+            params['team'] = self.rng.choice(self.team_ids)
+        await self.call('search', 'GET', '/api/search/?' + urlencode(params))
+
+    async def browse(self):
+        data = await self.call('list', 'GET', f'/api/documents/documents/?page={self.rng.randint(1, 5)}')
+        if data and data.get('results'):
+            await self.pause(0.5, 2)
+            document_id = self.rng.choice(data['results'])['id']
+            await self.call('retrieve', 'GET', f'/api/documents/documents/{document_id}/')
+
+    async def upload(self):
+        boundary = uuid.uuid4().hex
+        text = ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(50, 500)))
+        fields = {'title': f'{CORPUS_PREFIX} upload {uuid.uuid4().hex[:8]}', 'team': self.rng.choice(self.team_ids)}
+        body = b''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in fields.items()
+        )
+        body += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="loadtest.txt"\r\n'
+            f'Content-Type: text/plain\r\n\r\n{text}\r\n--{boundary}--\r\n'
+        ).encode()
+        await self.call(
+            'upload', 'POST', '/api/documents/documents/', body,
+            {'Content-Type': f'multipart/form-data; boundary={boundary}'},
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the API with concurrent scripted users (typeahead bursts, searches, '
+        'browsing and uploads), optionally against a locally started WSGI or ASGI server'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server to test when --serve is none')
+        parser.add_argument('--serve', choices=['none', 'wsgi', 'asgi'], default='none',
+                            help='Start runserver (wsgi) or uvicorn (asgi) on a free port for the run')
+        parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users')
+        parser.add_argument('--duration', type=float, default=20.0, help='Seconds of load')
+        parser.add_argument('--ramp-up', type=float, default=2.0, help='Seconds over which users start')
+        parser.add_argument('--mix', help=f'Session weights (default "{DEFAULT_MIX}", plus upload=10 with --serve)')
+        parser.add_argument('--think', type=float, default=1.0, help='Think-time multiplier; 0 for no pauses')
+        parser.add_argument('--corpus', type=int, default=0,
+                            help='Create this many synthetic documents for the run (removed afterwards); '
+                                 'needs --serve, as it writes to the local database')
+        parser.add_argument('--save', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Compare with a JSON file from an earlier --save')
+        parser.add_argument('--max-regression', type=float, default=20.0,
+                            help='Percent worse p95 latency or throughput that counts as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        # Without --serve the server at --url may use another database, so
+        # this command leaves the local one alone
+        local = options['serve'] != 'none'
+        options['mix'] = options['mix'] or (SERVED_MIX if local else DEFAULT_MIX)
+        mix = self._parse_mix(options['mix'])
+        if options['corpus'] and not local:
+            raise CommandError('--corpus writes to the local database; use it with --serve')
+        if mix.get('upload') and not local:
+            self.stderr.write(self.style.WARNING(
+                f"Uploaded documents stay on {options['url']}; their titles start with {CORPUS_PREFIX}"
+            ))
+        if local:
+            team_ids = list(Team.objects.values_list('id', flat=True))
+        else:
+            team_ids = asyncio.run(self._remote_team_ids(options['url']))
+        if not team_ids:
+            raise CommandError('Create at least one team first (see seed_data)')
+
+        server = None
+        try:
+            if options['corpus']:
+                self._create_corpus(options['corpus'], team_ids, options['seed'])
+            if local:
+                server, url = self._start_server(options['serve'])
+            else:
+                url = options['url']
+            samples, elapsed = asyncio.run(self._run(url, mix, team_ids, options))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+            if local:
+                self._remove_corpus()
+
+        results = self._summarize(samples, elapsed, options)
+        self._report(results)
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f"Saved results to {options['save']}")
+        if options['compare']:
+            with open(options['compare']) as file:
+                regressions = self._compare(json.load(file), results, options['max_regression'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} regression(s) against {options["compare"]}')
+
+    @staticmethod
+    def _parse_mix(mix):
+        weights = {}
+        for part in mix.split(','):
+            name, _, weight = part.partition('=')
+            if name.strip() not in ('typeahead', 'search', 'browse', 'upload'):
+                raise CommandError(f'Unknown session type in --mix: {name}')
+            weights[name.strip()] = float(weight or 1)
+        return weights
+
+    @staticmethod
+    async def _remote_team_ids(url):
+        parts = urlsplit(url)
+        connection = _Connection(parts.hostname, parts.port or 80)
+        try:
+            status, body = await connection.request('GET', '/api/documents/teams/')
+        except OSError as e:
+            raise CommandError(f'Could not reach {url}: {e}')
+        finally:
+            connection.close()
+        if status != 200:
+            raise CommandError(f'{url} answered {status} for its team list')
+        data = json.loads(body)
+        return [team['id'] for team in (data['results'] if isinstance(data, dict) else data)]
+
+    async def _run(self, url, mix, team_ids, options):
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        samples = []
+        started = time.perf_counter()
+        deadline = started + options['duration']
+
+        async def user(number):
+            rng = random.Random(options['seed'] * 1000 + number)
+            await asyncio.sleep(options['ramp_up'] * number / max(1, options['users']))
+            virtual_user = _VirtualUser(host, port, samples, rng, options['think'], team_ids)
+            sessions = list(mix)
+            weights = [mix[name] for name in sessions]
+            while time.perf_counter() < deadline:
+                await getattr(virtual_user, rng.choices(sessions, weights)[0])()
+                await virtual_user.pause(1, 3)
+            virtual_user.connection.close()
+
+        await asyncio.gather(*(user(number) for number in range(options['users'])))
+        return samples, time.perf_counter() - started
+
+    def _summarize(self, samples, elapsed, options):
+        endpoints = {}
+        for label in LABELS + ('total',):
+            rows = [sample for sample in samples if label == 'total' or sample[0] == label]
+            if not rows:
+                continue
+            latencies = sorted(latency * 1000 for _, latency, _ in rows)
+            errors = sum(1 for _, _, status in rows if not 200 <= status < 300)
+            endpoints[label] = {
+                'requests': len(rows),
+                'rps': round(len(rows) / elapsed, 2),
+                'error_rate': round(errors / len(rows), 4),
+                'p50_ms': round(percentile(latencies, 50), 1),
+                'p95_ms': round(percentile(latencies, 95), 1),
+                'p99_ms': round(percentile(latencies, 99), 1),
+                'max_ms': round(latencies[-1], 1),
+            }
+        return {
+            'config': {key: options[key] for key in ('serve', 'users', 'duration', 'mix', 'think', 'corpus')},
+            'elapsed': round(elapsed, 2),
+            'endpoints': endpoints,
+        }
+
+    def _report(self, results):
+        self.stdout.write(
+            f"{'endpoint':<13}{'requests':>9}{'req/s':>9}{'errors':>8}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+        )
+        for label, row in results['endpoints'].items():
+            self.stdout.write(
+                f"{label:<13}{row['requests']:>9}{row['rps']:>9.1f}{row['error_rate']:>8.1%}"
+                f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}"
+            )
+
+    def _compare(self, baseline, current, max_regression):
+        self.stdout.write(f"\n{'endpoint':<13}{'req/s':>16}{'p95 ms':>18}{'errors':>16}")
+        regressions = 0
+        for label, row in current['endpoints'].items():
+            before = baseline['endpoints'].get(label)
+            if not before:
+                continue
+            slower = before['p95_ms'] and (row['p95_ms'] / before['p95_ms'] - 1) * 100 > max_regression
+            fewer = before['rps'] and (1 - row['rps'] / before['rps']) * 100 > max_regression
+            more_errors = row['error_rate'] - before['error_rate'] > 0.01
+            flagged = slower or fewer or more_errors
+            regressions += bool(flagged)
+            line = (
+                f"{label:<13}{before['rps']:>7.1f} -> {row['rps']:<6.1f}"
+                f"{before['p95_ms']:>8.1f} -> {row['p95_ms']:<7.1f}"
+                f"{before['error_rate']:>6.1%} -> {row['error_rate']:<6.1%}"
+            )
+            self.stdout.write(self.style.ERROR(line + ' REGRESSION') if flagged else line)
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions'))
+        return regressions
+
+    def _create_corpus(self, count, team_ids, seed):
+        rng = random.Random(seed)
+        user = User.objects.first()
+        if user is None:
+            raise CommandError('Create at least one user first (see create_default_user)')
+        Document.objects.bulk_create([
+            Document(
+                title=f"{CORPUS_PREFIX} {' '.join(rng.sample(WORDS, 3))}",
+                description=' '.join(rng.sample(WORDS, 6)),
+                content_text=' '.join(rng.choice(WORDS) for _ in range(300)),
+                file=f'loadtest/{n}.txt', original_filename=f'{n}.txt', file_type=rng.choice(['PDF', 'DOCX', 'TXT']),
+                team_id=rng.choice(team_ids), uploaded_by=user, status='PROCESSED', content_extracted=True,
+            )
+            for n in range(count)
+        ], batch_size=500)
+        # bulk_create skips the indexing signals
+        backend = get_search_backend()
+        for document in Document.objects.filter(title__startswith=CORPUS_PREFIX).iterator():
+            backend.index_document(document)
+        backend.flush()
+        facet_index.invalidate()
+        bump(Document)
+        created = Document.objects.filter(title__startswith=CORPUS_PREFIX).values_list('id', flat=True)
+        change_feed.record('CREATED', created)
+        self.stdout.write(f'Created {count} synthetic documents')
+
+    def _remove_corpus(self):
+        for document in Document.objects.filter(title__startswith=CORPUS_PREFIX):
+            if document.file and not document.file.name.startswith('loadtest/'):
+                document.file.delete(save=False)
+            document.delete()
+
+    def _start_server(self, kind):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        if kind == 'wsgi':
+            command = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+        else:
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                raise CommandError('--serve asgi needs uvicorn (pip install uvicorn)')
+            command = [sys.executable, '-m', 'uvicorn', 'core.asgi:application', '--port', str(port), '--no-access-log']
+
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'core.settings'))
+        server = subprocess.Popen(
+            command, cwd=str(settings.BASE_DIR), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for _ in range(300):
+            if server.poll() is not None:
+                raise CommandError(f'{kind} server exited with code {server.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                self.stdout.write(f'Started {kind} server on port {port}')
+                return server, f'http://127.0.0.1:{port}'
+            except OSError:
+                time.sleep(0.1)
+        server.terminate()
+        raise CommandError(f'{kind} server did not start listening on port {port}')
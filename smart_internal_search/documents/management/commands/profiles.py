@@ -0,0 +1,83 @@
+import io
+import json
+import os
+import pstats
+from django.core.management.base import BaseCommand, CommandError
+from core.profiling import profiling_config
+
+
+class Command(BaseCommand):
+    help = 'List and summarize request profiles saved by the profiling middleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_id', nargs='?', help='Show this profile instead of listing')
+        parser.add_argument('--limit', type=int, default=20, help='Profiles to list, newest first')
+        parser.add_argument('--path', help='Only list profiles whose path contains this text')
+        parser.add_argument('--queries', type=int, default=10, help='Slowest SQL statements to show')
+        parser.add_argument('--functions', type=int, default=15, help='Top functions to show')
+        parser.add_argument('--pstats', metavar='SORT', help='Print the raw cProfile stats sorted by SORT')
+
+    def handle(self, *args, **options):
+        directory = profiling_config()['DIRECTORY']
+        if options['profile_id']:
+            self._show(directory, options['profile_id'], options)
+        else:
+            self._list(directory, options)
+
+    def _list(self, directory, options):
+        records = []
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith('.json'):
+                    with open(os.path.join(directory, name)) as file:
+                        records.append(json.load(file))
+        if options['path']:
+            records = [record for record in records if options['path'] in record['path']]
+        records.sort(key=lambda record: record['created_at'], reverse=True)
+
+        if not records:
+            self.stdout.write('No saved profiles')
+            return
+        self.stdout.write(f"{'id':<18}{'created':<21}{'status':>7}{'ms':>10}{'sql':>6}{'sql ms':>10}  path")
+        for record in records[:options['limit']]:
+            self.stdout.write(
+                f"{record['id']:<18}{record['created_at'][:19]:<21}{record['status']:>7}"
+                f"{record['duration_ms']:>10.1f}{record['sql_count']:>6}{record['sql_ms']:>10.1f}  "
+                f"{record['method']} {record['path']}"
+            )
+
+    def _show(self, directory, profile_id, options):
+        path = os.path.join(directory, f'{os.path.basename(profile_id)}.json')
+        if not os.path.exists(path):
+            raise CommandError(f'No profile with id {profile_id}')
+        with open(path) as file:
+            record = json.load(file)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{record['method']} {record['path']} -> {record['status']} in {record['duration_ms']:.1f} ms"
+        ))
+        self.stdout.write(
+            f"{record['sql_count']} SQL statements, {record['sql_ms']:.1f} ms "
+            f"({record['sql_ms'] / record['duration_ms']:.0%} of the request)" if record['duration_ms'] else ''
+        )
+
+        self.stdout.write('\nSlowest SQL:')
+        for query in sorted(record['queries'], key=lambda query: -query['ms'])[:options['queries']]:
+            self.stdout.write(f"  {query['ms']:>9.2f} ms  [{query['alias']}] {query['sql'][:300]}")
+            for line in query.get('plan', []):
+                self.stdout.write(f'               plan: {line}')
+            if query.get('plan_error'):
+                self.stdout.write(f"               plan error: {query['plan_error']}")
+
+        self.stdout.write('\nTop functions (cumulative):')
+        for row in record['top_functions'][:options['functions']]:
+            self.stdout.write(
+                f"  {row['cumulative_ms']:>9.2f} ms  {row['own_ms']:>9.2f} own  {row['calls']:>7}x  {row['function']}"
+            )
+
+        if options['pstats']:
+            stats_path = os.path.join(directory, f"{record['id']}.prof")
+            output = io.StringIO()
+            stats = pstats.Stats(stats_path, stream=output)
+            stats.sort_stats(options['pstats']).print_stats(options['functions'])
+            self.stdout.write(output.getvalue())
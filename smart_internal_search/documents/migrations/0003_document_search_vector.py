@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+# Weighted tsvector used by search.backends.postgres.PostgresSearchBackend.
+# Content is capped so very large extractions stay under the 1MB tsvector limit.
+SEARCH_VECTOR_SQL = """
+ALTER TABLE documents_document ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english'::regconfig, left(coalesce(content_text, ''), 500000)), 'B') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'C') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(original_filename, '')), 'D')
+    ) STORED;
+CREATE INDEX documents_document_search_vector_gin
+    ON documents_document USING GIN (search_vector);
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP INDEX IF EXISTS documents_document_search_vector_gin;
+ALTER TABLE documents_document DROP COLUMN IF EXISTS search_vector;
+"""
+
+
+def add_search_vector(apps, schema_editor):
+    # Only PostgreSQL has tsvector; other databases keep the icontains backend
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SEARCH_VECTOR_SQL)
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_document_access_count_document_original_filename_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_tableversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentFingerprint',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='documents.document')),
+                ('signature', models.BinaryField()),
+                ('cluster_id', models.BigIntegerField(db_index=True)),
+                ('similarity', models.FloatField(default=1.0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='documents.document')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'bucket'], name='documents_l_band_5ab186_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_near_duplicates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('CREATED', 'Created'), ('UPDATED', 'Updated'), ('PROCESSED', 'Processed'), ('DELETED', 'Deleted')], max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import os
@@ -13,7 +13,22 @@ def document_file_path(instance, filename):
     return f"documents/{filename}"
 
 
-class Team(models.Model):
+class AtomicSaveModel(models.Model):
+    """
+    Saves in a transaction, so post_save receivers (table version bumps,
+    change feed events; see documents/signals.py) commit with the row
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
+class Team(AtomicSaveModel):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
 
@@ -21,7 +36,7 @@ class Team(models.Model):
         return self.name
 
 
-class Project(models.Model):
+class Project(AtomicSaveModel):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='projects')
@@ -30,7 +45,7 @@ class Project(models.Model):
         return self.name
 
 
-class Topic(models.Model):
+class Topic(AtomicSaveModel):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
 
@@ -38,7 +53,7 @@ class Topic(models.Model):
         return self.name
 
 
-class Document(models.Model):
+class Document(AtomicSaveModel):
     DOCUMENT_TYPES = [
         ('PDF', 'PDF'),
         ('DOCX', 'Word Document'),
@@ -138,13 +153,74 @@ class Document(models.Model):
         self.last_accessed = timezone.now()
         self.save(update_fields=['access_count', 'last_accessed'])
 
-    def mark_processed(self, content_text=""):
+    def mark_processed(self, content_text="", save=True):
         self.status = 'PROCESSED'
         self.content_extracted = True
         self.content_text = content_text
-        self.save(update_fields=['status', 'content_extracted', 'content_text'])
+        # Set explicitly: bulk_update (see documents/batching.py) skips auto_now
+        self.updated_at = timezone.now()
+        if save:
+            self.save(update_fields=['status', 'content_extracted', 'content_text', 'updated_at'])
 
-    def mark_failed(self, error_message):
+    def mark_failed(self, error_message, save=True):
         self.status = 'FAILED'
         self.processing_error = error_message
-        self.save(update_fields=['status', 'processing_error'])
\ No newline at end of file
+        self.updated_at = timezone.now()
+        if save:
+            self.save(update_fields=['status', 'processing_error', 'updated_at'])
+
+
+class TableVersion(models.Model):
+    """Change counter per database table, bumped on every write (see documents/conditional.py)"""
+    table = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.table} v{self.version}'
+
+
+class DocumentFingerprint(models.Model):
+    """MinHash signature of a document's extracted text and its near-duplicate cluster (see documents/dedup.py)"""
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    signature = models.BinaryField()
+    cluster_id = models.BigIntegerField(db_index=True)
+    similarity = models.FloatField(default=1.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.document_id} in cluster {self.cluster_id}'
+
+
+class LSHBucket(models.Model):
+    """One band hash of a document's MinHash signature; documents sharing a bucket are candidates"""
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='lsh_buckets')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket']),
+        ]
+
+
+class ChangeEvent(models.Model):
+    """One entry of the document change feed; the id is its sequence number (see documents/changes.py)"""
+
+    ACTION_CHOICES = [
+        ('CREATED', 'Created'),
+        ('UPDATED', 'Updated'),
+        ('PROCESSED', 'Processed'),
+        ('DELETED', 'Deleted'),
+    ]
+
+    # Not a foreign key: events of deleted documents are kept
+    document_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f'#{self.id} {self.action} document {self.document_id}'
@@ -0,0 +1,191 @@
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import caches
+from PIL import Image, ImageOps
+import pytesseract
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OCR_CONFIG = {
+    'TARGET_DPI': 300,
+    'MAX_DIMENSION': 5000,
+    'BINARIZE': True,
+    'TILE_HEIGHT': 2000,
+    'TILE_OVERLAP': 40,
+    'MAX_WORKERS': os.cpu_count() or 1,
+    'MIN_PAGE_TEXT_LENGTH': 20,
+    'LANG': 'eng',
+    'CACHE_ALIAS': 'ocr',
+    'CACHE_TIMEOUT': None,
+}
+
+
+class OCRProcessor:
+    """Preprocesses images and runs tesseract over pages/tiles in parallel"""
+
+    def __init__(self, config=None):
+        self.config = {**DEFAULT_OCR_CONFIG, **getattr(settings, 'OCR_CONFIG', {}), **(config or {})}
+        # Each tesseract call is its own process; stop it from also spawning
+        # OpenMP threads so the pool does not oversubscribe the cores.
+        os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+    def ocr_image_file(self, file_path):
+        """OCR a single image file"""
+        with open(file_path, 'rb') as file:
+            return self.ocr_images([file.read()])[0]
+
+    def ocr_images(self, images):
+        """OCR a list of encoded images, returning one text per image in order"""
+        results = [None] * len(images)
+        pending = {}
+
+        for index, data in enumerate(images):
+            key = self._cache_key(data)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending[index] = key
+
+        if pending:
+            # Flatten every uncached image into tiles so that a single large
+            # scan and many small pages both spread across the pool.
+            jobs = []
+            for index in pending:
+                for tile in self._tiles(self.preprocess(images[index])):
+                    jobs.append((index, tile))
+
+            with ThreadPoolExecutor(max_workers=self.config['MAX_WORKERS']) as executor:
+                outcomes = list(executor.map(self._run_tile, (tile for _, tile in jobs)))
+
+            collected = {index: [] for index in pending}
+            errors = {index: [] for index in pending}
+            for (index, _), (text, error) in zip(jobs, outcomes):
+                if error is not None:
+                    errors[index].append(error)
+                elif text.strip():
+                    collected[index].append(text.strip())
+
+            for index, key in pending.items():
+                if errors[index] and not collected[index]:
+                    # Nothing was read; fail the document rather than store it empty
+                    raise errors[index][0]
+                results[index] = "\n".join(collected[index])
+                # Partial text is returned but not cached, so a reprocess retries
+                if not errors[index]:
+                    self.cache.set(key, results[index], self.config['CACHE_TIMEOUT'])
+
+        return results
+
+    def preprocess(self, data):
+        """
+        Normalize an encoded image to grayscale, optionally binarized. Images
+        that record their resolution are scaled to the target DPI; others
+        keep their size, as scans and photos without metadata are usually
+        already sharp enough.
+        """
+        image = Image.open(io.BytesIO(data))
+        dpi = self._dpi(image)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('L')
+
+        scale = self.config['TARGET_DPI'] / dpi if dpi else 1.0
+
+        # Never scale past the size cap; huge scans are downsampled instead
+        longest = max(image.size) * scale
+        if longest > self.config['MAX_DIMENSION']:
+            scale *= self.config['MAX_DIMENSION'] / longest
+
+        if abs(scale - 1.0) > 0.05:
+            new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(new_size, Image.LANCZOS)
+
+        if self.config['BINARIZE']:
+            image = ImageOps.autocontrast(image)
+            threshold = self._otsu_threshold(image.histogram())
+            image = image.point(lambda value: 255 if value > threshold else 0, mode='1')
+
+        return image
+
+    def _tiles(self, image):
+        """Split tall images into overlapping horizontal strips"""
+        tile_height = self.config['TILE_HEIGHT']
+        if image.height <= tile_height:
+            return [image]
+
+        overlap = self.config['TILE_OVERLAP']
+        tiles = []
+        top = 0
+        while top < image.height:
+            bottom = min(image.height, top + tile_height)
+            tiles.append(image.crop((0, top, image.width, bottom)))
+            if bottom == image.height:
+                break
+            top = bottom - overlap
+        return tiles
+
+    @staticmethod
+    def _dpi(image):
+        """Horizontal resolution recorded in the image, or None"""
+        try:
+            dpi = float(image.info.get('dpi', (0,))[0])
+        except (TypeError, ValueError, IndexError):
+            return None
+        # JFIF headers without units report an aspect ratio of 1
+        return dpi if dpi > 1 else None
+
+    def _run_tile(self, image):
+        """(text, None) for a strip, or (None, error) so one bad strip does not fail the rest"""
+        try:
+            return self._run_tesseract(image), None
+        except Exception as e:
+            logger.warning('OCR of a %dx%d strip failed: %s', image.width, image.height, e)
+            return None, e
+
+    def _run_tesseract(self, image):
+        return pytesseract.image_to_string(image, lang=self.config['LANG'])
+
+    @staticmethod
+    def _otsu_threshold(histogram):
+        """Compute Otsu's threshold from a 256-bin grayscale histogram"""
+        total = sum(histogram)
+        if not total:
+            return 127
+
+        sum_all = sum(value * count for value, count in enumerate(histogram))
+        sum_background = 0
+        weight_background = 0
+        best_threshold = 127
+        best_variance = 0.0
+
+        for value, count in enumerate(histogram):
+            weight_background += count
+            if weight_background == 0:
+                continue
+            weight_foreground = total - weight_background
+            if weight_foreground == 0:
+                break
+            sum_background += value * count
+            mean_background = sum_background / weight_background
+            mean_foreground = (sum_all - sum_background) / weight_foreground
+            variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+            if variance > best_variance:
+                best_variance = variance
+                best_threshold = value
+
+        return best_threshold
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    def _cache_key(self, data):
+        """Key OCR output by image content plus the settings that affect it"""
+        digest = hashlib.sha256(data).hexdigest()
+        return "ocr:%s:%s:%s:%s" % (
+            digest, self.config['LANG'], self.config['TARGET_DPI'], int(self.config['BINARIZE'])
+        )
@@ -1,9 +1,32 @@
 from rest_framework import serializers
+from rest_framework.fields import SkipField
+from .filters import DocumentFilter, has_effective_filters
 from .models import Document, Team, Project, Topic
+from .taxonomy import taxonomy
 from django.contrib.auth.models import User
 import os
 
 
+class TaxonomyNameField(serializers.CharField):
+    """
+    Read-only name of a related team/project/topic, resolved from the
+    taxonomy cache by the id in ``source`` (e.g. ``team_id``). Like
+    ``CharField(source='team.name')``, the field is left out when the
+    relation is empty.
+    """
+
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        pk = super().get_attribute(instance)
+        if pk is None:
+            raise SkipField()
+        return taxonomy.name(self.kind, pk)
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -23,7 +46,7 @@ class TeamSerializer(serializers.ModelSerializer):
 
 
 class ProjectSerializer(serializers.ModelSerializer):
-    team_name = serializers.CharField(source='team.name', read_only=True)
+    team_name = TaxonomyNameField('team', source='team_id')
 
     class Meta:
         model = Project
@@ -32,8 +55,8 @@ class ProjectSerializer(serializers.ModelSerializer):
 
 class DocumentListSerializer(serializers.ModelSerializer):
     uploaded_by_name = serializers.CharField(source='uploaded_by.get_full_name', read_only=True)
-    team_name = serializers.CharField(source='team.name', read_only=True)
-    project_name = serializers.CharField(source='project.name', read_only=True)
+    team_name = TaxonomyNameField('team', source='team_id')
+    project_name = TaxonomyNameField('project', source='project_id')
     topics_list = TopicSerializer(source='topics', many=True, read_only=True)
     file_url = serializers.FileField(source='file', read_only=True)
     file_name = serializers.CharField(source='original_filename', read_only=True)
@@ -116,13 +139,12 @@ class DocumentCreateSerializer(serializers.ModelSerializer):
         if topics:
             document.topics.set(topics)
 
-        # Process the document asynchronously
+        # Process the document asynchronously; if Celery is not reachable the
+        # job is queued on disk and run by the local fallback executor
+        from core.fallback import submit_task
+        from core.scheduling import ingestion_headers
         from .tasks import process_document_task
-        try:
-            process_document_task.delay(document.id)
-        except:
-            # If Celery is not running, process synchronously
-            process_document_task(document.id)
+        submit_task(process_document_task, document.id, headers=ingestion_headers(document))
 
         return document
 
@@ -132,4 +154,65 @@ class DocumentUpdateSerializer(serializers.ModelSerializer):
         model = Document
         fields = [
             'title', 'description', 'team', 'project', 'topics'
-        ]
\ No newline at end of file
+        ]
+
+
+class BulkOperationSerializer(serializers.Serializer):
+    """Validates a request to the bulk operations endpoint (see documents/bulk.py)"""
+    ACTIONS = ['add_topics', 'remove_topics', 'move', 'delete']
+
+    action = serializers.ChoiceField(choices=ACTIONS)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    query = serializers.CharField(required=False)
+    filters = serializers.DictField(required=False)
+    topics = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    team = serializers.IntegerField(required=False)
+    project = serializers.IntegerField(required=False, allow_null=True)
+    # Required to select every document: no ids, query or filter
+    all = serializers.BooleanField(default=False)
+    # The "matched" count of a dry run; required to delete by query/filters/all
+    expected_count = serializers.IntegerField(required=False, min_value=0)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate_filters(self, value):
+        unknown = sorted(set(value) - set(DocumentFilter.base_filters))
+        if unknown:
+            raise serializers.ValidationError(f"Unknown filters: {', '.join(unknown)}")
+        return value
+
+    def validate(self, attrs):
+        by_query = bool(attrs.get('query')) or has_effective_filters(attrs.get('filters'))
+        if attrs['all']:
+            if 'ids' in attrs or by_query:
+                raise serializers.ValidationError('"all" cannot be combined with "ids", "query" or "filters".')
+        elif ('ids' in attrs) == by_query:
+            raise serializers.ValidationError(
+                'Select documents with either "ids" or a non-empty "query"/"filters", or set "all": true.'
+            )
+
+        if (attrs['action'] == 'delete' and 'ids' not in attrs and not attrs['dry_run']
+                and 'expected_count' not in attrs):
+            raise serializers.ValidationError({
+                'expected_count': 'Deleting by query, filters or "all" needs the "matched" count of a dry run.'
+            })
+
+        action = attrs['action']
+        if action in ('add_topics', 'remove_topics'):
+            if 'topics' not in attrs:
+                raise serializers.ValidationError({'topics': f'Required for {action}.'})
+            unknown = [pk for pk in attrs['topics'] if not taxonomy.exists('topic', pk)]
+            if unknown:
+                raise serializers.ValidationError({'topics': f'Unknown topic ids: {unknown}'})
+
+        if action == 'move':
+            if 'team' not in attrs and 'project' not in attrs:
+                raise serializers.ValidationError('move needs a "team" and/or "project".')
+            if 'team' in attrs and not taxonomy.exists('team', attrs['team']):
+                raise serializers.ValidationError({'team': 'Unknown team id.'})
+            if attrs.get('project') is not None:
+                project = taxonomy.get('project', attrs['project'])
+                if project is None:
+                    raise serializers.ValidationError({'project': 'Unknown project id.'})
+                if attrs.setdefault('team', project['team']) != project['team']:
+                    raise serializers.ValidationError({'project': 'The project belongs to another team.'})
+        return attrs
@@ -0,0 +1,144 @@
+import threading
+from contextlib import contextmanager
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+from .changes import change_feed
+from .conditional import bump, record_access
+from .models import Document, Team, Project, Topic
+from .taxonomy import taxonomy
+
+
+# Tables whose rows appear in document, taxonomy or stats responses
+VERSIONED_MODELS = (Document, Team, Project, Topic, User)
+
+# Saves touching only these fields are reads, not changes; for documents
+# they change the access token instead (see documents/conditional.py)
+ACCESS_FIELDS = {'access_count', 'last_accessed'}
+# The same for each versioned model: logins only move User.last_login
+UNVERSIONED_FIELDS = {Document: ACCESS_FIELDS, User: {'last_login'}}
+
+_muted = threading.local()
+
+
+@contextmanager
+def mute_document_signals():
+    """
+    Skip per-document signal work (version bumps, facet and index updates)
+    on this thread. Bulk operations use it and then do that work once
+    for the whole set (see documents/bulk.py).
+    """
+    previous = getattr(_muted, 'active', False)
+    _muted.active = True
+    try:
+        yield
+    finally:
+        _muted.active = previous
+
+
+def document_signals_muted():
+    return getattr(_muted, 'active', False)
+
+
+def bump_table_version(sender, update_fields=None, **kwargs):
+    if document_signals_muted():
+        return
+    if update_fields is not None and UNVERSIONED_FIELDS.get(sender, set()).issuperset(update_fields):
+        if sender is Document:
+            record_access()
+        return
+    bump(sender)
+
+
+# Connected per model, so deletes of other models keep Django's fast path
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_table_version, sender=model)
+    post_delete.connect(bump_table_version, sender=model)
+
+
+@receiver(m2m_changed, sender=Document.topics.through)
+def bump_document_topics_version(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and not document_signals_muted():
+        bump(sender)
+
+
+def invalidate_taxonomy(sender, **kwargs):
+    # After commit, so other processes cannot reload the old rows under the new token
+    transaction.on_commit(taxonomy.invalidate)
+
+
+for model in (Team, Project, Topic):
+    post_save.connect(invalidate_taxonomy, sender=model)
+    post_delete.connect(invalidate_taxonomy, sender=model)
+
+
+# Connected after bump_table_version, so every path takes the Document
+# counter lock before the ChangeEvent one
+@receiver(post_save, sender=Document)
+def record_document_change(sender, instance, created, update_fields=None, **kwargs):
+    if document_signals_muted():
+        return
+    if created:
+        action = 'CREATED'
+    elif update_fields is not None and ACCESS_FIELDS.issuperset(update_fields):
+        return
+    elif update_fields is not None and 'status' in update_fields and instance.status in ('PROCESSED', 'FAILED'):
+        action = 'PROCESSED'
+    else:
+        action = 'UPDATED'
+    change_feed.record(action, [instance.id])
+
+
+@receiver(post_delete, sender=Document)
+def record_document_delete(sender, instance, **kwargs):
+    if not document_signals_muted():
+        change_feed.record('DELETED', [instance.id])
+
+
+@receiver(m2m_changed, sender=Document.topics.through)
+def record_document_topics_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear') or document_signals_muted():
+        return
+    if not reverse:
+        change_feed.record('UPDATED', [instance.id])
+    elif pk_set:
+        # Topic.documents.clear() does not say which documents were affected
+        change_feed.record('UPDATED', sorted(pk_set))
+
+
+def taxonomy_document_ids(sender, instance):
+    """Ids of the documents that show ``instance``'s name"""
+    if sender is Topic:
+        return Document.topics.through.objects.filter(topic_id=instance.pk).values_list('document_id', flat=True)
+    field = 'team_id' if sender is Team else 'project_id'
+    return Document.objects.filter(**{field: instance.pk}).values_list('id', flat=True)
+
+
+def remember_taxonomy_name(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw:
+        instance._saved_name = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+def record_taxonomy_rename(sender, instance, created, **kwargs):
+    # Change feed entries carry team, project and topic names
+    previous = getattr(instance, '_saved_name', None)
+    if created or previous is None or previous == instance.name:
+        return
+    instance._saved_name = instance.name
+    change_feed.record('UPDATED', list(taxonomy_document_ids(sender, instance)))
+
+
+def record_taxonomy_delete(sender, instance, **kwargs):
+    # Sent inside the delete's transaction. Deleting a topic drops its
+    # m2m rows and deleting a project nulls Document.project, both without
+    # per-document signals; team deletes cascade to the documents, which
+    # record their own events.
+    change_feed.record('UPDATED', list(taxonomy_document_ids(sender, instance)))
+
+
+for model in (Team, Project, Topic):
+    pre_save.connect(remember_taxonomy_name, sender=model)
+    post_save.connect(record_taxonomy_rename, sender=model)
+for model in (Project, Topic):
+    pre_delete.connect(record_taxonomy_delete, sender=model)
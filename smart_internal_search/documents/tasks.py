@@ -1,38 +1,51 @@
 import os
 from celery import shared_task
 from django.conf import settings
+from .batching import BatchWriteError, completion_batcher
+from .changes import change_feed
+from .dedup import near_duplicates
 from .models import Document
 from .utils import DocumentProcessor
 from search.utils import SearchIndexer
 
 
-@shared_task
-def process_document_task(document_id):
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def process_document_task(self, document_id):
     """Background task to process document and extract text"""
-    try:
-        document = Document.objects.get(id=document_id)
+    with completion_batcher.processing():
+        try:
+            document = Document.objects.get(id=document_id)
 
-        # Get the file path
-        file_path = document.file.path
+            # Get the file path
+            file_path = document.file.path
 
-        # Extract text content
-        content_text = DocumentProcessor.extract_text_from_file(file_path, document.file_type)
+            # Extract text content
+            content_text = DocumentProcessor.extract_text_from_file(file_path, document.file_type)
 
-        # Update document status and content
-        document.mark_processed(content_text)
+            # Near-duplicate fingerprint, computed here so workers share the CPU work
+            signature = near_duplicates.signature(content_text) if near_duplicates.enabled else None
 
-        # Index the document for search
-        SearchIndexer.index_document(document)
+            # Update document status and content; the batcher saves and indexes
+            # completed documents together, and returns once they are committed
+            document.mark_processed(content_text, save=False)
+            completion_batcher.add(document, signature)
 
-        return f"Successfully processed and indexed document: {document.title}"
+            return f"Successfully processed document: {document.title}"
 
-    except Document.DoesNotExist:
-        return f"Document with id {document_id} does not exist"
-    except Exception as e:
-        # Update document with error
-        document = Document.objects.get(id=document_id)
-        document.mark_failed(str(e))
-        return f"Error processing document: {str(e)}"
+        except Document.DoesNotExist:
+            return f"Document with id {document_id} does not exist"
+        except BatchWriteError as e:
+            # The extraction worked but could not be saved; run it again later
+            raise self.retry(exc=e)
+        except Exception as e:
+            # Update document with error
+            document = Document.objects.get(id=document_id)
+            document.mark_failed(str(e), save=False)
+            try:
+                completion_batcher.add(document)
+            except BatchWriteError as write_error:
+                raise self.retry(exc=write_error)
+            return f"Error processing document: {str(e)}"
 
 
 @shared_task
@@ -42,4 +55,10 @@ def reindex_all_documents_task():
         result = SearchIndexer.reindex_all()
         return result
     except Exception as e:
-        return f"Error reindexing documents: {str(e)}"
\ No newline at end of file
+        return f"Error reindexing documents: {str(e)}"
+
+
+@shared_task
+def prune_change_events_task():
+    """Background task to delete change feed events past their retention"""
+    return f"Pruned {change_feed.prune()} change events"
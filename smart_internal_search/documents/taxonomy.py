@@ -0,0 +1,143 @@
+"""
+Process-local cache of the Team, Project and Topic tables.
+
+These tables are tiny and read-mostly, yet every serialized document needs
+a team name, usually a project name and its topics. Each process keeps
+all three tables in memory and resolves names by id. The first lookup
+loads them with three small queries.
+
+Saves and deletes of these models (see documents/signals.py) clear the
+local copy and publish a new generation token in a shared cache, the same
+scheme as the search facet bitmaps. Other web and Celery processes reload
+when they see a new token, checking at most every REFRESH_INTERVAL seconds.
+A lookup of an unknown id reloads once, so rows created in another process
+are found immediately. Ids still unknown after that are remembered until
+the generation changes, so a stale or made-up id in every request does not
+reload the tables every time. Renames can be up to REFRESH_INTERVAL seconds
+stale; ``generation()`` names the copy in use, and conditional GETs include
+it in their ETags so a stale name is never cached under a fresh ETag.
+"""
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+
+
+DEFAULT_TAXONOMY_CONFIG = {
+    'ENABLED': True,
+    'REFRESH_INTERVAL': 1,
+    'MAX_MISSING': 10000,
+    'CACHE_ALIAS': 'search',
+}
+
+GENERATION_KEY = 'documents:taxonomy:generation'
+
+KINDS = ('team', 'project', 'topic')
+
+
+class TaxonomyCache:
+    """In-memory id -> row maps for teams, projects and topics"""
+
+    def __init__(self, config=None):
+        self.config = {
+            **DEFAULT_TAXONOMY_CONFIG,
+            **getattr(settings, 'TAXONOMY_CACHE', {}),
+            **(config or {}),
+        }
+        self._tables = None
+        self._generation = None
+        # Ids not found in the current generation, per kind
+        self._missing = {kind: set() for kind in KINDS}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    def rows(self, kind):
+        """Map id -> row dict for one kind. Rows are shared; do not modify them."""
+        return self._current()[kind]
+
+    def get(self, kind, pk):
+        if pk is None:
+            return None
+        row = self._current()[kind].get(pk)
+        if row is None and pk not in self._missing[kind]:
+            # Possibly created by another process since the last load
+            row = self._current(force=True)[kind].get(pk)
+            if row is None:
+                missing = self._missing[kind]
+                if len(missing) >= self.config['MAX_MISSING']:
+                    missing.clear()
+                missing.add(pk)
+        return row
+
+    def name(self, kind, pk):
+        row = self.get(kind, pk)
+        return row['name'] if row is not None else None
+
+    def exists(self, kind, pk):
+        return self.get(kind, pk) is not None
+
+    def with_names(self, rows, kind, id_key, name_key):
+        """Add ``name_key`` after ``id_key`` to aggregate rows grouped by id"""
+        return [
+            {id_key: row[id_key], name_key: self.name(kind, row[id_key]),
+             **{key: value for key, value in row.items() if key != id_key}}
+            for row in rows
+        ]
+
+    def generation(self):
+        """Token of the tables this process is using, after the regular refresh check"""
+        self._current()
+        return self._generation
+
+    def invalidate(self):
+        """Drop this process's copy and tell the others to reload"""
+        with self._lock:
+            self._tables = None
+            self._missing = {kind: set() for kind in KINDS}
+        self.cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+    def load(self):
+        from .models import Project, Team, Topic
+
+        return {
+            'team': {
+                pk: {'id': pk, 'name': name, 'description': description}
+                for pk, name, description in Team.objects.values_list('id', 'name', 'description')
+            },
+            'project': {
+                pk: {'id': pk, 'name': name, 'description': description, 'team': team_id}
+                for pk, name, description, team_id in Project.objects.values_list(
+                    'id', 'name', 'description', 'team_id'
+                )
+            },
+            'topic': {
+                pk: {'id': pk, 'name': name, 'description': description}
+                for pk, name, description in Topic.objects.values_list('id', 'name', 'description')
+            },
+        }
+
+    def _current(self, force=False):
+        if not self.config['ENABLED']:
+            return self.load()
+        now = time.monotonic()
+        tables = self._tables
+        if tables is not None and not force and now - self._checked_at <= self.config['REFRESH_INTERVAL']:
+            return tables
+        with self._lock:
+            self._checked_at = now
+            generation = self.cache.get(GENERATION_KEY)
+            if self._tables is None or force or generation != self._generation:
+                if generation != self._generation:
+                    self._missing = {kind: set() for kind in KINDS}
+                self._tables = self.load()
+                self._generation = generation
+            return self._tables
+
+
+# Global taxonomy cache instance
+taxonomy = TaxonomyCache()
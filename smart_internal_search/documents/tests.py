@@ -1,3 +1,1086 @@
-from django.test import TestCase
+import base64
+import gzip
+import heapq
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import timedelta
+from unittest import mock, skipUnless
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from core.db.sqlite3.base import DatabaseWrapper
+from core.fallback import RUNNING_SUFFIX, FallbackExecutor
+from core.profiling import ProfilingMiddleware
+from core.routers import ReadWriteRouter
+from core.scheduling import (
+    HEAVY_QUEUE, INGEST_QUEUE, INTERACTIVE_QUEUE, MAX_PRIORITY, FairShareScheduler, estimate_cost, ingestion_headers,
+    route_ingestion,
+)
+from search.facets import facet_index
+from search.querylog import query_logger
+from .admin import DocumentAdmin, EstimatedCountPaginator, estimated_row_count
+from .batching import BatchWriteError, CompletionBatcher
+from .changes import ChangeFeed, change_feed
+from .conditional import ACCESS_CACHE_ALIAS, ACCESS_KEY, bump, table_versions
+from .dedup import NearDuplicateIndex
+from .extractors import ExtractorRegistry, extract_from_txt
+from .fast_serializers import COLUMNS, document_rows, serialize_documents
+from .management.commands.loadtest import CORPUS_PREFIX, Command as LoadtestCommand
+from .models import ChangeEvent, Document, Team, Project, Topic
+from .serializers import DocumentListSerializer
+from .taxonomy import GENERATION_KEY, TaxonomyCache, taxonomy
+from .utils import DocumentProcessor, percentile
+from .tasks import process_document_task
 
-# Create your tests here.
+
+def make_document(team, user, title='Document', **fields):
+    fields.setdefault('file', f'documents/{title}.txt')
+    fields.setdefault('original_filename', f'{title}.txt')
+    fields.setdefault('file_type', 'TXT')
+    fields.setdefault('status', 'PROCESSED')
+    return Document.objects.create(title=title, team=team, uploaded_by=user, **fields)
+
+
+class DocumentTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Background threads use their own connections, which would race the
+        # test transaction; tests of the log flush it on this thread instead
+        for patcher in (
+            mock.patch.dict(query_logger.config, ENABLED=False),
+            mock.patch.dict(facet_index.config, BACKGROUND_REBUILD=False),
+        ):
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        # Names are cached across tests, and rolled-back ids are reused
+        taxonomy.invalidate()
+        cls.user = User.objects.create_user('tester', password='pw', first_name='Test', last_name='User')
+        cls.marketing = Team.objects.create(name='Marketing')
+        cls.seo = Team.objects.create(name='SEO')
+        cls.project = Project.objects.create(name='Q4', team=cls.marketing)
+        cls.topic = Topic.objects.create(name='Strategy')
+
+
+class BulkOperationTests(DocumentTestCase):
+    url = '/api/documents/documents/bulk/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.documents = [
+            make_document(self.marketing, self.user, 'alpha report'),
+            make_document(self.marketing, self.user, 'beta report'),
+            make_document(self.seo, self.user, 'gamma notes'),
+        ]
+
+    def post(self, **body):
+        return self.client.post(self.url, body, format='json')
+
+    def test_empty_filters_are_rejected(self):
+        response = self.post(action='delete', filters={})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Document.objects.count(), 3)
+
+    def test_empty_filter_values_are_rejected(self):
+        response = self.post(action='move', filters={'team': ''}, team=self.seo.id)
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_filter_keys_are_rejected(self):
+        response = self.post(action='delete', filters={'tem': self.marketing.id}, expected_count=2)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('filters', response.data)
+        self.assertEqual(Document.objects.count(), 3)
+
+    def test_delete_by_filters_needs_a_dry_run_count(self):
+        filters = {'team': self.marketing.id}
+        response = self.post(action='delete', filters=filters)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expected_count', response.data)
+
+        dry_run = self.post(action='delete', filters=filters, dry_run=True)
+        self.assertEqual(dry_run.data['matched'], 2)
+        response = self.post(action='delete', filters=filters, expected_count=dry_run.data['matched'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['affected'], 2)
+        self.assertEqual(list(Document.objects.values_list('title', flat=True)), ['gamma notes'])
+
+    def test_delete_refuses_a_changed_selection(self):
+        response = self.post(action='delete', filters={'team': self.marketing.id}, expected_count=1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['matched'], 2)
+        self.assertEqual(Document.objects.count(), 3)
+
+    def test_select_everything_needs_all(self):
+        response = self.post(action='delete', all=True, dry_run=True)
+        self.assertEqual(response.data['matched'], 3)
+        response = self.post(action='delete', all=True, expected_count=3)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Document.objects.exists())
+
+    def test_all_cannot_be_combined_with_a_selection(self):
+        response = self.post(action='delete', all=True, ids=[self.documents[0].id])
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete_by_ids(self):
+        response = self.post(action='delete', ids=[self.documents[0].id])
+        self.assertEqual(response.data['affected'], 1)
+        self.assertEqual(Document.objects.count(), 2)
+
+    def test_move_by_query(self):
+        response = self.post(action='move', query='report', team=self.seo.id)
+        self.assertEqual(response.data['affected'], 2)
+        self.assertEqual(Document.objects.filter(team=self.seo).count(), 3)
+
+    def test_add_and_remove_topics(self):
+        ids = [document.id for document in self.documents[:2]]
+        self.post(action='add_topics', ids=ids, topics=[self.topic.id])
+        self.assertEqual(self.topic.documents.count(), 2)
+        self.post(action='remove_topics', ids=ids, topics=[self.topic.id])
+        self.assertEqual(self.topic.documents.count(), 0)
+
+    def test_requires_authentication(self):
+        response = APIClient().post(self.url, {'action': 'delete', 'ids': [1]}, format='json')
+        self.assertIn(response.status_code, (401, 403))
+
+
+class CompletionBatcherTests(DocumentTestCase):
+    def setUp(self):
+        self.batcher = CompletionBatcher({'MAX_DOCUMENTS': 10, 'MAX_WAIT_MS': 10000})
+        self.documents = [make_document(self.marketing, self.user, f'doc {n}', status='PENDING') for n in range(3)]
+
+    def tearDown(self):
+        self.batcher.flush()
+
+    def statuses(self):
+        return dict(Document.objects.values_list('id', 'status'))
+
+    def test_add_outside_a_task_writes_before_returning(self):
+        document = self.documents[0]
+        document.mark_processed('text', save=False)
+        self.batcher.add(document)
+        document.refresh_from_db()
+        self.assertEqual(document.status, 'PROCESSED')
+        self.assertEqual(document.content_text, 'text')
+        self.assertTrue(ChangeEvent.objects.filter(document_id=document.id, action='PROCESSED').exists())
+
+    def test_results_are_held_until_the_batch_is_written(self):
+        for document in self.documents:
+            document.mark_processed('text', save=False)
+            self.batcher.add(document, wait=False)
+        self.assertEqual(set(self.statuses().values()), {'PENDING'})
+        self.assertEqual(self.batcher.flush(), 3)
+        self.assertEqual(set(self.statuses().values()), {'PROCESSED'})
+
+    def test_full_batch_is_written(self):
+        batcher = CompletionBatcher({'MAX_DOCUMENTS': 2, 'MAX_WAIT_MS': 10000})
+        for document in self.documents[:2]:
+            document.mark_failed('unreadable', save=False)
+            batcher.add(document, wait=False)
+        self.assertEqual(Document.objects.filter(status='FAILED').count(), 2)
+
+    def test_failed_batch_is_written_one_by_one(self):
+        bad = self.documents[2]
+        bulk_update = Document.objects.bulk_update
+
+        def fail_on_bad(objs, fields, **kwargs):
+            if any(document.id == bad.id for document in objs):
+                raise ValueError('bad row')
+            return bulk_update(objs, fields, **kwargs)
+
+        with mock.patch.object(Document.objects, 'bulk_update', side_effect=fail_on_bad):
+            for document in self.documents[:2]:
+                document.mark_processed('text', save=False)
+                self.batcher.add(document, wait=False)
+            bad.mark_processed('text', save=False)
+            with self.assertRaises(BatchWriteError), self.assertLogs('documents.batching', 'ERROR'):
+                self.batcher.add(bad)
+
+        statuses = self.statuses()
+        self.assertEqual([statuses[document.id] for document in self.documents], ['PROCESSED', 'PROCESSED', 'PENDING'])
+
+    def test_waiting_tasks_share_one_batch(self):
+        batches = []
+        batcher = CompletionBatcher({'MAX_DOCUMENTS': 10, 'MAX_WAIT_MS': 10000})
+        barrier = threading.Barrier(2)
+
+        def task(document):
+            with batcher.processing():
+                barrier.wait()
+                document.mark_processed('text', save=False)
+                batcher.add(document)
+
+        with mock.patch.object(batcher, '_write', side_effect=lambda pending: batches.append(len(pending))), \
+                mock.patch.object(batcher, '_after_commit'):
+            threads = [threading.Thread(target=task, args=(document,)) for document in self.documents[:2]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(batches, [2])
+
+    def test_task_retries_when_its_result_cannot_be_written(self):
+        document = self.documents[0]
+        with mock.patch('documents.tasks.DocumentProcessor.extract_text_from_file', return_value='text'), \
+                mock.patch('documents.tasks.completion_batcher.add', side_effect=BatchWriteError('locked')) as add:
+            # apply() runs the retries inline
+            process_document_task.apply(args=[document.id])
+        self.assertEqual(add.call_count, 1 + process_document_task.max_retries)
+        document.refresh_from_db()
+        self.assertEqual(document.status, 'PENDING')
+
+    def test_task_retries_when_its_failure_cannot_be_written(self):
+        document = self.documents[0]
+        with mock.patch('documents.tasks.DocumentProcessor.extract_text_from_file', side_effect=ValueError('bad')), \
+                mock.patch('documents.tasks.completion_batcher.add', side_effect=BatchWriteError('locked')) as add:
+            result = process_document_task.apply(args=[document.id])
+        self.assertIsInstance(result.result, BatchWriteError)
+        self.assertEqual(add.call_count, 1 + process_document_task.max_retries)
+        self.assertEqual(add.call_args.args[0].status, 'FAILED')
+
+
+class ExportTests(DocumentTestCase):
+    url = '/api/documents/documents/export/'
+
+    def setUp(self):
+        self.documents = [
+            make_document(self.marketing, self.user, f'doc {n}', content_text=f'text {n}') for n in range(4)
+        ]
+        self.documents[1].topics.add(self.topic)
+        base = timezone.now() - timedelta(days=1)
+        for offset, document in enumerate(self.documents):
+            Document.objects.filter(pk=document.pk).update(updated_at=base + timedelta(minutes=offset))
+        self.documents[3].refresh_from_db()
+        # Shares the boundary timestamp with documents[3]
+        Document.objects.filter(pk=self.documents[2].pk).update(updated_at=self.documents[3].updated_at)
+
+    @staticmethod
+    def lines(content):
+        return [json.loads(line) for line in content.decode('utf-8').splitlines()]
+
+    def test_exports_every_document_in_order(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = self.lines(b''.join(response.streaming_content))
+        self.assertEqual([record['id'] for record in records], [document.id for document in self.documents])
+        self.assertEqual(records[1]['topics'], [{'id': self.topic.id, 'name': 'Strategy'}])
+        self.assertEqual(records[0]['team_name'], 'Marketing')
+        self.assertEqual(records[0]['content_text'], 'text 0')
+
+    def test_since_includes_the_boundary(self):
+        since = self.documents[3].updated_at.isoformat()
+        response = self.client.get(self.url, {'since': since})
+        records = self.lines(b''.join(response.streaming_content))
+        self.assertEqual([record['id'] for record in records], [self.documents[2].id, self.documents[3].id])
+
+    def test_invalid_since(self):
+        response = self.client.get(self.url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_gzip_round_trip(self):
+        plain = b''.join(self.client.get(self.url).streaming_content)
+        response = self.client.get(self.url, {'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    def test_filters_apply(self):
+        make_document(self.seo, self.user, 'other team')
+        response = self.client.get(self.url, {'team': self.seo.id})
+        records = self.lines(b''.join(response.streaming_content))
+        self.assertEqual([record['title'] for record in records], ['other team'])
+
+    async def test_async_export_streams_chunks(self):
+        with mock.patch('documents.export.FLUSH_BYTES', 1):
+            response = await self.async_client.get('/api/documents/export/async/', {'gzip': '1'})
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertGreater(len(chunks), 1)
+        records = self.lines(gzip.decompress(b''.join(chunks)))
+        self.assertEqual(len(records), len(self.documents))
+
+
+class TableVersionTests(DocumentTestCase):
+    list_url = '/api/documents/documents/'
+
+    def setUp(self):
+        self.document = make_document(self.marketing, self.user, 'versioned')
+
+    def version(self, model):
+        return next(iter(table_versions([model]).values()))[0]
+
+    def test_edits_bump_and_views_do_not(self):
+        before = self.version(Document)
+        self.client.get(f'{self.list_url}{self.document.id}/')
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.access_count, 1)
+        self.assertEqual(self.version(Document), before)
+
+        self.document.title = 'renamed'
+        self.document.save()
+        self.assertEqual(self.version(Document), before + 1)
+
+    def test_logins_do_not_bump_users(self):
+        before = self.version(User)
+        self.assertTrue(self.client.login(username='tester', password='pw'))
+        self.assertEqual(self.version(User), before)
+
+    def test_list_revalidates_across_views(self):
+        for url in (self.list_url, f'{self.list_url}by_team/'):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.get(f'{self.list_url}{self.document.id}/')
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('"access_count":', response.content.decode())
+            self.assertFalse(response.has_header('Last-Modified'))
+
+            etag = response['ETag']
+            self.document.title = f'renamed for {url}'
+            self.document.save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_access_ordered_responses_are_conditional_on_access(self):
+        ordered = {'ordering': '-access_count'}
+        etag = self.client.get(self.list_url, ordered)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(f'{self.list_url}{self.document.id}/')
+        self.assertEqual(self.client.get(self.list_url, ordered, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertFalse(self.client.get(f'{self.list_url}recent/').has_header('ETag'))
+
+    def test_a_lost_access_token_changes_the_etag(self):
+        etag = self.client.get(self.list_url)['ETag']
+        caches[ACCESS_CACHE_ALIAS].delete(ACCESS_KEY)
+        self.assertEqual(self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ChangeFeedTests(DocumentTestCase):
+    url = '/api/documents/changes/'
+
+    def setUp(self):
+        self.documents = [make_document(self.marketing, self.user, f'doc {n}', project=self.project) for n in range(3)]
+
+    def feed(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def actions(self, since=0):
+        return [(change['document_id'], change['action']) for change in self.feed(since=since)['changes']]
+
+    def test_changes_are_ordered_and_collapsed_per_document(self):
+        first, second, third = self.documents
+        second.title = 'renamed'
+        second.save()
+        first.mark_processed('text')
+        third_id = third.id
+        third.delete()
+        feed = self.feed()
+        self.assertEqual(
+            [(change['document_id'], change['action']) for change in feed['changes']],
+            [(second.id, 'UPDATED'), (first.id, 'PROCESSED'), (third_id, 'DELETED')],
+        )
+        seqs = [change['seq'] for change in feed['changes']]
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual(feed['next'], seqs[-1])
+        self.assertEqual(feed['changes'][0]['document']['title'], 'renamed')
+        self.assertIsNone(feed['changes'][2]['document'])
+        self.assertEqual(self.feed(since=feed['next'])['changes'], [])
+
+    def test_pages_cover_every_event_in_order(self):
+        for document in self.documents:
+            document.title += ' edited'
+            document.save()
+        seen, since = [], 0
+        while True:
+            page = self.feed(since=since, limit=2)
+            seen += [change['seq'] for change in page['changes']]
+            since = page['next']
+            if not page['has_more']:
+                break
+        self.assertEqual(seen, list(ChangeEvent.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_event_commits_with_the_save(self):
+        def fail(sender, **kwargs):
+            raise RuntimeError('after the event was recorded')
+
+        before = ChangeEvent.objects.count()
+        post_save.connect(fail, sender=Document)
+        try:
+            document = self.documents[0]
+            document.title = 'never saved'
+            with self.assertRaises(RuntimeError):
+                document.save()
+        finally:
+            post_save.disconnect(fail, sender=Document)
+        self.assertEqual(ChangeEvent.objects.count(), before)
+        self.assertEqual(Document.objects.get(pk=document.pk).title, 'doc 0')
+
+    def test_access_saves_are_not_changes(self):
+        since = ChangeEvent.objects.order_by('-id').values_list('id', flat=True).first()
+        self.documents[0].increment_access_count()
+        self.assertEqual(self.actions(since), [])
+
+    def test_renames_and_taxonomy_deletes_are_changes(self):
+        self.documents[0].topics.add(self.topic)
+        since = ChangeEvent.objects.order_by('-id').values_list('id', flat=True).first()
+
+        self.addCleanup(taxonomy.invalidate)
+        self.marketing.name = 'Growth'
+        # Taxonomy names are reloaded after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.marketing.save()
+        changes = self.feed(since=since)['changes']
+        self.assertEqual({change['document_id'] for change in changes}, {document.id for document in self.documents})
+        self.assertEqual({change['document']['team_name'] for change in changes}, {'Growth'})
+
+        since = changes[-1]['seq']
+        self.marketing.description = 'not shown in the feed'
+        self.marketing.save()
+        self.assertEqual(self.actions(since), [])
+
+        self.topic.delete()
+        changes = self.feed(since=since)['changes']
+        self.assertEqual([change['document_id'] for change in changes], [self.documents[0].id])
+        self.assertEqual(changes[0]['document']['topics_list'], [])
+
+        self.project.delete()
+        changes = self.feed(since=since)['changes']
+        self.assertEqual(len(changes), 3)
+        self.assertFalse(any('project_name' in change['document'] for change in changes))
+
+    def test_pruned_history_asks_for_a_resync(self):
+        feed = ChangeFeed({'RETENTION_DAYS': 1})
+        events = list(ChangeEvent.objects.order_by('id'))
+        ChangeEvent.objects.filter(pk__in=[event.pk for event in events[:2]]).update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        self.assertEqual(feed.prune(), 2)
+        self.assertFalse(ChangeEvent.objects.filter(pk=events[0].pk).exists())
+        with mock.patch('documents.views.change_feed', feed):
+            self.assertEqual(self.client.get(self.url, {'since': events[0].id}).status_code, 410)
+            self.assertEqual(self.client.get(self.url, {'since': events[1].id}).status_code, 200)
+            self.assertEqual(self.client.get(self.url, {'since': 0}).status_code, 200)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'since': '-1'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'limit': 'ten'}).status_code, 400)
+
+    async def test_long_poll(self):
+        since = await ChangeEvent.objects.order_by('-id').values_list('id', flat=True).afirst()
+        self.assertFalse(await change_feed.await_changes(since, 0.1))
+        self.assertTrue(await change_feed.await_changes(since - 1, 5))
+        response = await self.async_client.get('/api/documents/changes/async/', {'since': since - 1, 'wait': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['changes']), 1)
+
+
+class DocumentAdminTests(DocumentTestCase):
+    url = '/admin/documents/document/'
+
+    def setUp(self):
+        self.documents = [make_document(self.marketing, self.user, f'doc {n}') for n in range(5)]
+        self.documents[0].description = 'pricing notes'
+        self.documents[0].save()
+        # Trailing deletes leave MAX(rowid) above the row count
+        Document.objects.filter(pk__in=[document.id for document in self.documents[3:]]).delete()
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_estimate_reads_index_statistics(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite statistics')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('DELETE FROM sqlite_stat1')
+        self.assertIsNone(estimated_row_count(Document, 'default'))
+        self.analyze()
+        self.assertEqual(estimated_row_count(Document, 'default'), 3)
+
+    def test_paginator_estimates_only_unfiltered_large_tables(self):
+        self.analyze()
+        with mock.patch.object(EstimatedCountPaginator, 'ESTIMATE_ABOVE', 1), \
+                mock.patch('documents.admin.estimated_row_count', return_value=1000):
+            self.assertEqual(EstimatedCountPaginator(Document.objects.all(), 10).count, 1000)
+            self.assertEqual(EstimatedCountPaginator(Document.objects.filter(team=self.marketing), 10).count, 3)
+
+    def test_search_matches_descriptions(self):
+        User.objects.create_superuser('admin', password='pw')
+        self.client.login(username='admin', password='pw')
+        response = self.client.get(self.url, {'q': 'pricing'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['cl'].result_list), [self.documents[0]])
+
+    def test_search_scans_the_text_of_recent_documents(self):
+        User.objects.create_superuser('admin', password='pw')
+        self.client.login(username='admin', password='pw')
+        Document.objects.filter(pk=self.documents[1].pk).update(content_text='the renewal terms')
+        Document.objects.filter(pk=self.documents[2].pk).update(
+            content_text='older renewal notes', uploaded_at=timezone.now() - timedelta(days=30),
+        )
+        response = self.client.get(self.url, {'q': 'renewal'})
+        self.assertEqual({document.pk for document in response.context['cl'].result_list},
+                         {self.documents[1].pk, self.documents[2].pk})
+        self.assertContains(response, 'most recently uploaded')
+
+        with mock.patch.object(DocumentAdmin, 'CONTENT_SCAN_LIMIT', 1):
+            response = self.client.get(self.url, {'q': 'renewal'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.documents[1]])
+
+
+class TaxonomyCacheTests(DocumentTestCase):
+    def setUp(self):
+        self.taxonomy = TaxonomyCache({'REFRESH_INTERVAL': 3600})
+        self.load = mock.patch.object(self.taxonomy, 'load', wraps=self.taxonomy.load).start()
+        self.addCleanup(mock.patch.stopall)
+        self.addCleanup(taxonomy.invalidate)
+
+    def test_unknown_ids_reload_once_per_generation(self):
+        self.assertEqual(self.taxonomy.name('team', self.marketing.id), 'Marketing')
+        for _ in range(3):
+            self.assertIsNone(self.taxonomy.get('team', 999999))
+        self.assertEqual(self.load.call_count, 2)
+
+        # A row created elsewhere comes with a new generation
+        self.taxonomy.cache.set(GENERATION_KEY, 'other', None)
+        self.taxonomy._checked_at = 0.0
+        self.assertIsNone(self.taxonomy.get('team', 999999))
+        self.assertEqual(self.load.call_count, 4)
+
+    def test_new_rows_in_this_process_are_found(self):
+        self.assertIsNone(self.taxonomy.get('team', 999999))
+        team = Team.objects.create(name='Design')
+        self.taxonomy.invalidate()
+        self.assertEqual(self.taxonomy.name('team', team.id), 'Design')
+
+    def test_etag_changes_when_renamed_names_are_loaded(self):
+        url = '/api/documents/documents/'
+        make_document(self.marketing, self.user, 'plan')
+        first = self.client.get(url)
+
+        with mock.patch.dict(taxonomy.config, {'REFRESH_INTERVAL': 3600}):
+            # A rename in another process: counters and generation change, local names lag
+            Team.objects.filter(pk=self.marketing.pk).update(name='Growth')
+            bump(Team)
+            taxonomy.cache.set(GENERATION_KEY, 'renamed', None)
+            stale = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(stale.status_code, 200)
+            self.assertEqual(stale.data['results'][0]['team_name'], 'Marketing')
+
+        with mock.patch.dict(taxonomy.config, {'REFRESH_INTERVAL': 0}):
+            fresh = self.client.get(url, HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.data['results'][0]['team_name'], 'Growth')
+
+
+class NearDuplicateTests(TestCase):
+    def setUp(self):
+        self.index = NearDuplicateIndex({'MAX_SHINGLES': 200})
+        words = [f'word{n}' for n in range(3000)]
+        self.text = ' '.join(words)
+        self.edited = ' '.join(words[:2900] + ['changed'] * 100)
+        self.other = ' '.join(reversed(words))
+
+    def test_long_texts_are_signed_with_a_consistent_sample(self):
+        with mock.patch('documents.dedup.heapq.nsmallest', wraps=heapq.nsmallest) as sample:
+            signature = self.index.signature(self.text)
+        self.assertEqual(len(sample.call_args.args[1]), 2996)
+        self.assertEqual(len(signature), 128)
+        self.assertGreaterEqual(self.index.similarity(signature, self.index.signature(self.edited)), 0.8)
+        self.assertLess(self.index.similarity(signature, self.index.signature(self.other)), 0.2)
+
+    def test_short_texts(self):
+        self.assertIsNone(self.index.signature(''))
+        self.assertEqual(self.index.signature('a b c'), self.index.signature('A B  C'))
+
+
+class MemoryStore(dict):
+    def set(self, key, value, timeout=None):
+        self[key] = value
+
+
+class SchedulingTests(DocumentTestCase):
+    task = 'documents.tasks.process_document_task'
+
+    def setUp(self):
+        self.now = 1000.0
+        self.scheduler = FairShareScheduler({'TEAM_WEIGHTS': {}}, store=MemoryStore(), clock=lambda: self.now)
+
+    def test_queue_follows_cost(self):
+        self.assertEqual(self.scheduler.plan(1, 'TXT', 10_000), {'queue': INTERACTIVE_QUEUE, 'priority': MAX_PRIORITY})
+        self.assertEqual(self.scheduler.plan(2, 'PDF', 5 * 1024 * 1024)['queue'], INGEST_QUEUE)
+        self.assertEqual(self.scheduler.plan(3, 'IMAGE', 2 * 1024 * 1024)['queue'], HEAVY_QUEUE)
+        self.assertLess(estimate_cost('TXT', 1024 * 1024), estimate_cost('IMAGE', 1024 * 1024))
+
+    def test_busy_teams_lose_priority_and_idle_teams_keep_it(self):
+        for _ in range(20):
+            self.scheduler.plan('bulk', 'IMAGE', 5 * 1024 * 1024)
+        busy = self.scheduler.plan('bulk', 'TXT', 10_000)
+        idle = self.scheduler.plan('small', 'TXT', 10_000)
+        self.assertEqual(busy, {'queue': INGEST_QUEUE, 'priority': 0})
+        self.assertEqual(idle, {'queue': INTERACTIVE_QUEUE, 'priority': MAX_PRIORITY})
+
+        # The backlog drains as time passes
+        self.now += 3600
+        self.assertEqual(self.scheduler.plan('bulk', 'TXT', 10_000)['priority'], MAX_PRIORITY)
+
+    def test_weights_slow_down_lag(self):
+        self.scheduler.config['TEAM_WEIGHTS'] = {'heavy': 4.0}
+        for team in ('light', 'heavy'):
+            for _ in range(5):
+                self.scheduler.plan(team, 'IMAGE', 5 * 1024 * 1024)
+        lag = {team: self.scheduler.store[f'ingest:finish:{team}'] - self.now for team in ('light', 'heavy')}
+        self.assertAlmostEqual(lag['light'], 4 * lag['heavy'])
+
+    def test_router_uses_the_header_without_a_query(self):
+        document = make_document(self.marketing, self.user, 'scan', file_type='IMAGE')
+        Document.objects.filter(pk=document.pk).update(file_size=2 * 1024 * 1024)
+        document.refresh_from_db()
+        with mock.patch('core.scheduling.scheduler', self.scheduler), self.assertNumQueries(0):
+            routed = route_ingestion(self.task, (document.id,), {}, {'headers': ingestion_headers(document)})
+        self.assertEqual(routed['queue'], HEAVY_QUEUE)
+
+        with mock.patch('core.scheduling.scheduler', self.scheduler), self.assertNumQueries(1):
+            self.assertEqual(route_ingestion(self.task, (document.id,), {}, {})['queue'], HEAVY_QUEUE)
+        self.assertEqual(route_ingestion(self.task, (0,), {}, {}), {'queue': INGEST_QUEUE})
+        self.assertIsNone(route_ingestion('documents.tasks.reindex_all_documents_task', (), {}, {}))
+
+    def test_fallback_jobs_keep_their_headers(self):
+        directory = tempfile.mkdtemp(prefix='fallback-test-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        executor = FallbackExecutor({'QUEUE_DIR': directory})
+        headers = {'ingestion': [self.marketing.id, 'TXT', 10]}
+        executor.enqueue(self.task, [1], headers)
+        name = executor.pending()[0]
+        with mock.patch.object(executor, '_publish') as publish:
+            self.assertTrue(executor._hand_over(name))
+        self.assertEqual(publish.call_args.args[1:], ([1], headers))
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 99), 0.0)
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 50), percentile(values, 99), percentile(values, 100)), (51, 100, 100))
+
+
+@skipUnless(importlib.util.find_spec('PIL') and importlib.util.find_spec('pytesseract'), 'needs Pillow and pytesseract')
+class OCRProcessorTests(TestCase):
+    def setUp(self):
+        from .ocr import OCRProcessor
+
+        self.ocr = OCRProcessor({
+            'BINARIZE': False, 'MAX_DIMENSION': 1000, 'TILE_HEIGHT': 100, 'TILE_OVERLAP': 0,
+            'MAX_WORKERS': 1, 'CACHE_ALIAS': 'default',
+        })
+        self.ocr.cache.clear()
+
+    def encode(self, size, **info):
+        from PIL import Image
+
+        output = io.BytesIO()
+        Image.new('L', size, 255).save(output, format='PNG', **info)
+        return output.getvalue()
+
+    def test_images_without_a_resolution_keep_their_size(self):
+        self.assertEqual(self.ocr.preprocess(self.encode((400, 300))).size, (400, 300))
+
+    def test_recorded_resolution_is_scaled_to_the_target(self):
+        self.assertEqual(self.ocr.preprocess(self.encode((200, 100), dpi=(150, 150))).size, (400, 200))
+        # Capped at MAX_DIMENSION
+        self.assertEqual(self.ocr.preprocess(self.encode((600, 300), dpi=(72, 72))).size, (1000, 500))
+
+    def test_a_failed_strip_keeps_the_others(self):
+        data = self.encode((100, 300))
+        with mock.patch.object(self.ocr, '_run_tesseract', side_effect=['top', RuntimeError('crashed'), 'bottom']):
+            self.assertEqual(self.ocr.ocr_images([data]), ['top\nbottom'])
+        # Not cached, so the next run retries the failed strip
+        with mock.patch.object(self.ocr, '_run_tesseract', return_value='line') as run:
+            self.assertEqual(self.ocr.ocr_images([data]), ['line\nline\nline'])
+        self.assertEqual(run.call_count, 3)
+
+    def test_an_image_with_no_readable_strip_fails(self):
+        with mock.patch.object(self.ocr, '_run_tesseract', side_effect=RuntimeError('no tesseract')):
+            with self.assertRaises(RuntimeError):
+                self.ocr.ocr_images([self.encode((100, 300))])
+
+
+class ImageExtractionTests(DocumentTestCase):
+    """Runs without Pillow or pytesseract: documents.ocr is replaced by a stub"""
+
+    def stub_ocr(self, **behaviour):
+        processor = mock.Mock()
+        processor.return_value.ocr_image_file.configure_mock(**behaviour)
+        module = types.ModuleType('documents.ocr')
+        module.OCRProcessor = processor
+        patcher = mock.patch.dict(sys.modules, {'documents.ocr': module})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return processor
+
+    def test_text_comes_from_ocr(self):
+        self.stub_ocr(return_value='scanned text')
+        self.assertEqual(DocumentProcessor.extract_text_from_file('scan.png', 'IMAGE'), 'scanned text')
+
+    def test_failed_scans_are_marked_failed(self):
+        self.stub_ocr(side_effect=RuntimeError('no readable strip'))
+        document = make_document(self.marketing, self.user, 'scan', file_type='IMAGE', status='PENDING')
+        process_document_task.apply(args=[document.id])
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, 'FAILED')
+        self.assertIn('no readable strip', document.processing_error)
+        self.assertEqual(document.content_text, '')
+
+
+class LoadtestCommandTests(DocumentTestCase):
+    def setUp(self):
+        self.leftover = make_document(self.marketing, self.user, f'{CORPUS_PREFIX} upload')
+        run = mock.patch.object(LoadtestCommand, '_run', mock.AsyncMock(return_value=([('search', 0.01, 200)], 1.0)))
+        self.run = run.start()
+        self.addCleanup(mock.patch.stopall)
+
+    def loadtest(self, *args):
+        call_command('loadtest', *args, stdout=io.StringIO())
+
+    def test_remote_runs_leave_the_local_database_alone(self):
+        with mock.patch.object(LoadtestCommand, '_remote_team_ids', mock.AsyncMock(return_value=[42])):
+            self.loadtest('--url', 'http://search.example:8000')
+        self.assertEqual(self.run.call_args.args[2], [42])
+        self.assertTrue(Document.objects.filter(pk=self.leftover.pk).exists())
+
+        with self.assertRaises(CommandError):
+            self.loadtest('--url', 'http://search.example:8000', '--corpus', '5')
+        self.assertEqual(Document.objects.count(), 1)
+
+    def test_remote_runs_only_upload_when_asked(self):
+        with mock.patch.object(LoadtestCommand, '_remote_team_ids', mock.AsyncMock(return_value=[42])):
+            self.loadtest()
+            self.assertNotIn('upload', self.run.call_args.args[1])
+            stderr = io.StringIO()
+            call_command('loadtest', '--mix', 'search=1,upload=1', stdout=io.StringIO(), stderr=stderr)
+        self.assertEqual(self.run.call_args.args[1], {'search': 1.0, 'upload': 1.0})
+        self.assertIn('stay on', stderr.getvalue())
+
+    def test_served_runs_create_and_remove_the_corpus(self):
+        server = mock.Mock()
+        corpus_sizes = []
+
+        def start_server(kind):
+            corpus_sizes.append(Document.objects.filter(title__startswith=CORPUS_PREFIX).count())
+            return server, 'http://127.0.0.1:1'
+
+        with mock.patch.object(LoadtestCommand, '_start_server', side_effect=start_server):
+            self.loadtest('--serve', 'wsgi', '--corpus', '3')
+        self.assertEqual(corpus_sizes, [4])
+        self.assertIn('upload', self.run.call_args.args[1])
+        server.terminate.assert_called_once()
+        self.assertFalse(Document.objects.filter(title__startswith=CORPUS_PREFIX).exists())
+
+
+class FallbackExecutorTests(TestCase):
+    task = 'documents.tasks.process_document_task'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='fallback-test-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def executor(self):
+        executor = FallbackExecutor({'QUEUE_DIR': self.directory, 'STALE_AFTER': 60})
+        # Broker down, and a pool that never finishes a job
+        executor._broker_down = True
+        executor._broker_available = mock.Mock(return_value=False)
+        executor._pool = mock.Mock()
+        return executor
+
+    def age(self, name, seconds):
+        path = os.path.join(self.directory, name + RUNNING_SUFFIX)
+        past = os.path.getmtime(path) - seconds
+        os.utime(path, (past, past))
+        return path
+
+    def test_running_jobs_keep_their_claim(self):
+        executor = self.executor()
+        executor.enqueue(self.task, [1])
+        executor.drain()
+        name = executor._pool.submit.call_args.args[1]
+        path = self.age(name, 3600)
+
+        executor.drain()
+        self.assertEqual(executor.pending(), [])
+        self.assertGreater(os.path.getmtime(path), time.time() - 60)
+        self.assertEqual(executor._pool.submit.call_count, 1)
+
+    def test_claims_of_a_dead_process_are_requeued(self):
+        dead = self.executor()
+        dead.enqueue(self.task, [1])
+        dead.drain()
+        name = dead._pool.submit.call_args.args[1]
+        self.age(name, 3600)
+
+        survivor = self.executor()
+        survivor.drain()
+        self.assertEqual(survivor._pool.submit.call_args.args[1], name)
+
+
+def upper_extractor(file_path):
+    return file_path.upper()
+
+
+class ExtractorRegistryTests(TestCase):
+    def test_builtins_resolve_on_first_use(self):
+        registry = ExtractorRegistry()
+        self.assertIn('PDF', registry.file_types())
+        self.assertEqual(registry._resolved, {})
+
+        self.assertIs(registry.get('TXT'), extract_from_txt)
+        self.assertEqual(list(registry._resolved), ['TXT'])
+
+    def test_unknown_type_has_no_extractor(self):
+        self.assertIsNone(ExtractorRegistry().get('RTF'))
+
+    @override_settings(DOCUMENT_EXTRACTORS={'TXT': 'documents.tests.upper_extractor', 'CSV': upper_extractor})
+    def test_settings_override_builtins(self):
+        registry = ExtractorRegistry()
+        self.assertIs(registry.get('TXT'), upper_extractor)
+        self.assertIs(registry.get('CSV'), upper_extractor)
+
+    def test_register_replaces_a_resolved_extractor(self):
+        registry = ExtractorRegistry()
+        registry.get('TXT')
+        registry.register('TXT', 'documents.tests.upper_extractor')
+        self.assertIs(registry.get('TXT'), upper_extractor)
+
+    def test_text_is_extracted_through_the_registry(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as file:
+            file.write('  quarterly report\n')
+        self.addCleanup(os.remove, file.name)
+
+        self.assertEqual(DocumentProcessor.extract_text_from_file(file.name, 'TXT'), 'quarterly report')
+        self.assertEqual(DocumentProcessor.extract_text_from_file(file.name, 'RTF'), '')
+
+
+class SQLiteBackendTests(TestCase):
+    def wrapper(self, **options):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3'), 'OPTIONS': options}
+        wrapper = DatabaseWrapper(settings_dict, alias='scratch')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA %s' % name)
+            return cursor.fetchone()[0]
+
+    def test_pragmas_run_on_new_connections(self):
+        wrapper = self.wrapper(pragmas={'journal_mode': 'WAL', 'busy_timeout': 1234, 'query_only': 'ON'})
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 1234)
+        self.assertEqual(self.pragma(wrapper, 'query_only'), 1)
+
+        wrapper.close()
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 1234)
+
+    def holds_write_lock(self, wrapper):
+        wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        try:
+            other = sqlite3.connect(wrapper.settings_dict['NAME'], timeout=0)
+            try:
+                other.execute('BEGIN IMMEDIATE')
+                other.rollback()
+                return False
+            except sqlite3.OperationalError:
+                return True
+            finally:
+                other.close()
+        finally:
+            wrapper.rollback()
+            wrapper.set_autocommit(True)
+
+    def test_immediate_transactions_take_the_write_lock_up_front(self):
+        self.assertTrue(self.holds_write_lock(self.wrapper(transaction_mode='immediate')))
+        self.assertFalse(self.holds_write_lock(self.wrapper()))
+
+    def test_unknown_transaction_mode_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.wrapper(transaction_mode='LAZY')
+
+
+class ReadWriteRouterTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def test_reads_use_the_replica_outside_transactions(self):
+        self.assertEqual(Team.objects.all().db, 'replica')
+
+    def test_reads_inside_a_transaction_see_its_writes(self):
+        with transaction.atomic():
+            team = Team.objects.create(name='Uncommitted')
+            self.assertEqual(Team.objects.all().db, 'default')
+            self.assertTrue(Team.objects.filter(pk=team.pk).exists())
+        self.assertEqual(Team.objects.get(pk=team.pk)._state.db, 'replica')
+
+    def test_writes_and_migrations_use_the_default_connection(self):
+        router = ReadWriteRouter()
+        self.assertEqual(router.db_for_write(Team), 'default')
+        self.assertTrue(router.allow_migrate('default', 'documents'))
+        self.assertFalse(router.allow_migrate('replica', 'documents'))
+
+    def test_objects_from_either_connection_can_be_related(self):
+        team = Team.objects.create(name='Relations')
+        replica_team = Team.objects.get(pk=team.pk)
+        self.assertTrue(ReadWriteRouter().allow_relation(team, replica_team))
+
+
+class ProfilingMiddlewareTests(DocumentTestCase):
+    url = '/api/documents/documents/'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings_override = override_settings(PROFILING={'DIRECTORY': self.directory, 'KEEP': 2})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        make_document(self.marketing, self.user, 'alpha report')
+
+    def record(self, response):
+        with open(os.path.join(self.directory, response['X-Profile-Id'] + '.json')) as file:
+            return json.load(file)
+
+    def test_staff_requests_with_the_header_are_profiled(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+
+        record = self.record(response)
+        self.assertEqual(record['path'], self.url)
+        self.assertEqual(record['sql_count'], len(record['queries']))
+        selects = [query for query in record['queries'] if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        self.assertTrue(all('plan' in query for query in selects))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, response['X-Profile-Id'] + '.prof')))
+        self.assertTrue(record['top_functions'])
+
+    def test_basic_auth_and_query_flag(self):
+        credentials = base64.b64encode(b'staff:pw').decode('ascii')
+        response = self.client.get(self.url + '?_profile=1', HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(self.record(response)['status'], 200)
+
+    def test_other_requests_are_not_profiled(self):
+        self.client.force_login(self.user)
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url, HTTP_X_PROFILE='1'))
+        self.client.force_login(self.staff)
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    async def test_async_views_stay_async(self):
+        async def view(request):
+            return HttpResponse('ok')
+
+        middleware = ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with mock.patch('core.profiling.sync_to_async') as adapt:
+            response = await middleware(RequestFactory().get(self.url))
+        self.assertEqual(response.content, b'ok')
+        adapt.assert_not_called()
+
+    async def test_async_staff_requests_are_profiled(self):
+        credentials = base64.b64encode(b'staff:pw').decode('ascii')
+        response = await self.async_client.get(
+            '/api/search/async/', {'q': 'alpha'}, AUTHORIZATION=f'Basic {credentials}', X_PROFILE='1',
+        )
+        self.assertEqual(response.status_code, 200)
+        record = self.record(response)
+        self.assertEqual(record['path'], '/api/search/async/?q=alpha')
+        self.assertTrue(record['sql_count'])
+
+    def test_old_profiles_are_pruned_and_listed(self):
+        self.client.force_login(self.staff)
+        ids = []
+        for _ in range(3):
+            ids.append(self.client.get(self.url, HTTP_X_PROFILE='1')['X-Profile-Id'])
+            # mtimes order the pruning
+            time.sleep(0.01)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted(f'{profile_id}{suffix}' for profile_id in ids[1:] for suffix in ('.json', '.prof')),
+        )
+
+        output = io.StringIO()
+        call_command('profiles', stdout=output)
+        self.assertIn(ids[2], output.getvalue())
+        output = io.StringIO()
+        call_command('profiles', ids[2], stdout=output)
+        self.assertIn('Slowest SQL', output.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('profiles', ids[0])
+
+
+class FastSerializerTests(DocumentTestCase):
+    def setUp(self):
+        taxonomy.invalidate()
+        other_topic = Topic.objects.create(name='Budget', description='Spend')
+        self.documents = [
+            make_document(self.marketing, self.user, 'alpha report', project=self.project, description='Q4 plan'),
+            make_document(self.seo, self.user, 'beta notes', file_size=2048, last_accessed=timezone.now()),
+            make_document(self.seo, self.user, 'gamma sheet', file=''),
+        ]
+        self.documents[0].topics.set([other_topic, self.topic])
+        self.queryset = Document.objects.filter(pk__in=[document.pk for document in self.documents]).order_by('id')
+
+    def assertSameAsSerializer(self, request=None):
+        context = {'request': request} if request is not None else {}
+        expected = DocumentListSerializer(self.queryset, many=True, context=context).data
+        actual = serialize_documents(self.queryset, request)
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+
+    def test_output_matches_the_list_serializer(self):
+        self.assertSameAsSerializer()
+
+    def test_file_urls_are_absolute_with_a_request(self):
+        request = APIRequestFactory().get('/api/documents/documents/')
+        self.assertSameAsSerializer(request)
+        self.assertTrue(serialize_documents(self.queryset, request)[0]['file_url'].startswith('http://testserver/'))
+
+    def test_one_query_for_topics_and_none_for_taxonomy(self):
+        rows = list(self.queryset.values_list(*COLUMNS))
+        document_rows(rows)
+        with self.assertNumQueries(1):
+            data = document_rows(rows)
+        self.assertNotIn('project_name', data[1])
+        self.assertEqual([topic['name'] for topic in data[0]['topics_list']], ['Strategy', 'Budget'])
+        self.assertEqual(document_rows([]), [])
+
+    def test_list_endpoint_uses_the_same_payload(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/documents/documents/')
+        request = response.wsgi_request
+        by_id = {row['id']: row for row in serialize_documents(self.queryset, request)}
+        self.assertEqual({row['id'] for row in response.json()['results']}, set(by_id))
+        for row in response.json()['results']:
+            self.assertEqual(row, json.loads(JSONRenderer().render(by_id[row['id']])))
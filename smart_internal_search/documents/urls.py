@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, async_views
 
 router = DefaultRouter()
 router.register(r'teams', views.TeamViewSet)
@@ -11,5 +11,8 @@ router.register(r'documents', views.DocumentViewSet, basename='document')
 
 urlpatterns = [
     path('', views.api_root, name='api-root'),
+    path('changes/', views.document_changes, name='document-changes'),
+    path('changes/async/', async_views.document_changes, name='async-document-changes'),
+    path('export/async/', async_views.document_export, name='async-document-export'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
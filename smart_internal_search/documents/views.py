@@ -5,12 +5,22 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-from django.db.models import Q
 from .models import Document, Team, Project, Topic
 from .serializers import (
     DocumentListSerializer, DocumentDetailSerializer, DocumentCreateSerializer,
     DocumentUpdateSerializer, TeamSerializer, ProjectSerializer, TopicSerializer
 )
+from django.contrib.auth.models import User
+from django.utils.decorators import method_decorator
+from .changes import EXPIRED_SINCE, change_feed, parse_params
+from .conditional import conditional
+from .export import export_response, prepare_export
+from .filters import DocumentFilter, text_search
+from .taxonomy import taxonomy
+
+
+# Tables behind a DocumentListSerializer row
+DOCUMENT_LIST_MODELS = (Document, Team, Project, Topic, Document.topics.through, User)
 
 
 # Public view for testing
@@ -25,10 +35,24 @@ def api_root(request):
             'documents': '/api/documents/documents/',
             'topics': '/api/documents/topics/',
             'upload': '/api/documents/documents/upload/',
+            'changes': '/api/documents/changes/',
         }
     })
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def document_changes(request):
+    """Document changes after ?since=<seq>, oldest first (see documents/changes.py)"""
+    params, errors = parse_params(request.query_params)
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    # Long-polling with ?wait= is served by the async variant
+    if change_feed.expired(params['since']):
+        return Response(EXPIRED_SINCE, status=status.HTTP_410_GONE)
+    return Response(change_feed.changes(params['since'], params['limit'], request))
+
+
 class TeamViewSet(viewsets.ModelViewSet):
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
@@ -39,6 +63,10 @@ class TeamViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         return [IsAuthenticated()]
 
+    @method_decorator(conditional(Team))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class ProjectViewSet(viewsets.ModelViewSet):
     queryset = Project.objects.all()
@@ -52,6 +80,10 @@ class ProjectViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         return [IsAuthenticated()]
 
+    @method_decorator(conditional(Project, Team))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class TopicViewSet(viewsets.ModelViewSet):
     queryset = Topic.objects.all()
@@ -63,20 +95,26 @@ class TopicViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         return [IsAuthenticated()]
 
+    @method_decorator(conditional(Topic))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-from django.db.models import Q
 from .models import Document, Team, Project, Topic
 from .serializers import (
     DocumentListSerializer, DocumentDetailSerializer, DocumentCreateSerializer,
     DocumentUpdateSerializer, TeamSerializer, ProjectSerializer, TopicSerializer
 )
+from .fast_serializers import COLUMNS, document_rows, serialize_documents
+from .serializers import BulkOperationSerializer
+from . import bulk
 
 
 # ... existing code ...
@@ -85,7 +123,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
     # Change to IsAuthenticatedOrReadOnly to allow uploads without auth in development
     permission_classes = [AllowAny]  # For development - change to IsAuthenticatedOrReadOnly in production
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['team', 'project', 'file_type', 'topics', 'status']
+    filterset_class = DocumentFilter
     search_fields = ['title', 'description', 'content_text', 'original_filename']
     ordering_fields = ['uploaded_at', 'updated_at', 'last_accessed', 'file_size', 'access_count']
     ordering = ['-uploaded_at']
@@ -97,12 +135,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
         # Filter by search query if provided
         search_query = self.request.query_params.get('search', None)
         if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(content_text__icontains=search_query) |
-                Q(original_filename__icontains=search_query)
-            )
+            queryset = text_search(queryset, search_query)
 
         return queryset
 
@@ -141,20 +174,52 @@ class DocumentViewSet(viewsets.ModelViewSet):
         else:
             serializer.save()
 
+    @method_decorator(conditional(*DOCUMENT_LIST_MODELS, accessed=True))
+    def list(self, request, *args, **kwargs):
+        # Read-only rows come from values_list() instead of DocumentListSerializer
+        rows = self.filter_queryset(self.get_queryset()).values_list(*COLUMNS)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(document_rows(page, request))
+        return Response(document_rows(rows, request))
+
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         instance.increment_access_count()
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """Documents similar to this one (see search/related.py)"""
+        from search.backends import get_search_backend
+        from search.related import related_documents
+
+        if not get_search_backend().supports_related:
+            return Response(
+                {'detail': 'Related documents need the segment or PostgreSQL search backend.'},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                return Response({'limit': ['Expected a positive integer.']}, status=status.HTTP_400_BAD_REQUEST)
+        document = self.get_object()
+        payload, _ = related_documents.related(document, limit)
+        return Response(payload)
+
     @action(detail=False, methods=['get'])
     def recent(self, request):
         """Get recently accessed documents"""
         recent_docs = Document.objects.all().order_by('-last_accessed')[:10]
-        serializer = DocumentListSerializer(recent_docs, many=True)
-        return Response(serializer.data)
+        return Response(serialize_documents(recent_docs))
 
     @action(detail=False, methods=['get'])
+    @method_decorator(conditional(*DOCUMENT_LIST_MODELS, accessed=True))
     def by_team(self, request):
         """Get documents grouped by team"""
         team_id = request.query_params.get('team_id')
@@ -163,16 +228,20 @@ class DocumentViewSet(viewsets.ModelViewSet):
         else:
             documents = Document.objects.all()
 
-        serializer = DocumentListSerializer(documents, many=True)
-        return Response(serializer.data)
+        return Response(serialize_documents(documents))
 
     @action(detail=False, methods=['get'])
+    @method_decorator(conditional(Document, Team))
     def stats(self, request):
         """Get document statistics"""
         from django.db.models import Count, Sum
         total_docs = Document.objects.count()
         by_type = Document.objects.values('file_type').annotate(count=Count('id'))
-        by_team = Document.objects.values('team__name').annotate(count=Count('id'))
+        team_counts = {}
+        for team_id, count in Document.objects.values_list('team_id').annotate(count=Count('id')).order_by():
+            name = taxonomy.name('team', team_id)
+            team_counts[name] = team_counts.get(name, 0) + count
+        by_team = [{'team__name': name, 'count': count} for name, count in sorted(team_counts.items())]
         by_status = Document.objects.values('status').annotate(count=Count('id'))
         total_size = Document.objects.aggregate(total_size=Sum('file_size'))['total_size'] or 0
 
@@ -180,10 +249,47 @@ class DocumentViewSet(viewsets.ModelViewSet):
             'total_documents': total_docs,
             'total_size_mb': round(total_size / (1024 * 1024), 2),
             'by_file_type': list(by_type),
-            'by_team': list(by_team),
+            'by_team': by_team,
             'by_status': list(by_status),
         })
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream documents with their extracted text as NDJSON (see documents/export.py)"""
+        chunks, compress, errors = prepare_export(request.query_params, request)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        # Under ASGI, use the async variant; this one is buffered there
+        return export_response(chunks, compress)
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser], permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        """Add/remove topics, move or delete many documents at once (see documents/bulk.py)"""
+        serializer = BulkOperationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+
+        try:
+            document_ids = bulk.select_documents(
+                data.get('ids'), data.get('query'), data.get('filters'), select_all=data['all'],
+            )
+        except bulk.BulkSelectionError as e:
+            return Response({'filters': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        if data['dry_run']:
+            return Response({'action': data['action'], 'matched': len(document_ids), 'dry_run': True})
+        if 'expected_count' in data and data['expected_count'] != len(document_ids):
+            return Response(
+                {'expected_count': ['The selection changed since the dry run.'], 'matched': len(document_ids)},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        affected = bulk.run_operation(
+            data['action'], document_ids, topics=data.get('topics'), team=data.get('team'), project=data.get('project'),
+        )
+        return Response({'action': data['action'], 'matched': len(document_ids), 'affected': affected})
+
     @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser])
     def upload(self, request):
         """Custom upload endpoint with better error handling"""
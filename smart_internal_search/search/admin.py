@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import QueryLog
 
-# Register your models here.
+
+@admin.register(QueryLog)
+class QueryLogAdmin(admin.ModelAdmin):
+    list_display = ['query', 'event', 'result_count', 'latency_ms', 'clicked_document', 'created_at']
+    list_filter = ['event', 'created_at']
+    search_fields = ['query']
+    raw_id_fields = ['clicked_document']
@@ -0,0 +1,279 @@
+"""
+Text analysis shared by indexing and querying.
+
+An Analyzer splits text with the TOKEN_PATTERN regex and passes each token
+through FILTERS, in order:
+
+* ``lowercase``: case-insensitive matching.
+* ``asciifold``: strips accents, so "café" and "cafe" are the same term.
+* ``stop``: drops STOPWORDS, which match nearly every document and only
+  inflate postings lists.
+* ``porter``: Porter stemming, so "reports", "reporting" and "report"
+  share one term.
+* ``synonyms``: maps every word of a SYNONYMS group to the group's first
+  word, on both sides, so no query-time expansion is needed. Groups hold
+  single words and go through the filters before this one, so "cv" and
+  "résumé" also cover "résumés".
+
+Every filter works on one token at a time, so the output for a token is
+memoized in the analyzer. Document text has a Zipfian vocabulary, so
+nearly every token after the first few documents is one dict lookup.
+``get_analyzer()`` returns one compiled analyzer per process.
+
+The segment index stores analyzed terms. After changing the analyzer,
+run ``manage.py reindex_search``. ``manage.py benchmark_analyzer``
+compares postings size and query cost with the plain lowercase tokenizer.
+"""
+import hashlib
+import json
+import re
+import unicodedata
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+ENGLISH_STOPWORDS = (
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into', 'is', 'it',
+    'no', 'not', 'of', 'on', 'or', 'such', 'that', 'the', 'their', 'then', 'there', 'these', 'they',
+    'this', 'to', 'was', 'will', 'with',
+)
+
+DEFAULT_ANALYZER_CONFIG = {
+    'TOKEN_PATTERN': r'\b\w+\b',
+    'MIN_TOKEN_LENGTH': 2,
+    'FILTERS': ['lowercase', 'asciifold', 'stop', 'porter', 'synonyms'],
+    'STOPWORDS': ENGLISH_STOPWORDS,
+    'SYNONYMS': [],
+    'MAX_CACHED_TOKENS': 100000,
+}
+
+FILTERS = ('lowercase', 'asciifold', 'stop', 'porter', 'synonyms')
+
+
+class PorterStemmer:
+    """The original Porter (1980) suffix-stripping algorithm for English"""
+
+    STEP2 = (
+        ('ational', 'ate'), ('tional', 'tion'), ('enci', 'ence'), ('anci', 'ance'), ('izer', 'ize'),
+        ('abli', 'able'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'), ('ousli', 'ous'),
+        ('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate'), ('alism', 'al'), ('iveness', 'ive'),
+        ('fulness', 'ful'), ('ousness', 'ous'), ('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble'),
+    )
+    STEP3 = (
+        ('icate', 'ic'), ('ative', ''), ('alize', 'al'), ('iciti', 'ic'), ('ical', 'ic'), ('ful', ''),
+        ('ness', ''),
+    )
+    STEP4 = (
+        'al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment', 'ent', 'ion', 'ou',
+        'ism', 'ate', 'iti', 'ous', 'ive', 'ize',
+    )
+
+    def stem(self, word):
+        if len(word) <= 2 or not word.isalpha():
+            return word
+        word = self._step1ab(word)
+        word = self._step1c(word)
+        word = self._replace(word, self.STEP2, 0)
+        word = self._replace(word, self.STEP3, 0)
+        word = self._step4(word)
+        return self._step5(word)
+
+    @staticmethod
+    def _consonant(word, i):
+        letter = word[i]
+        if letter in 'aeiou':
+            return False
+        if letter == 'y':
+            return i == 0 or not PorterStemmer._consonant(word, i - 1)
+        return True
+
+    def _measure(self, stem):
+        """Number of vowel-consonant sequences in ``stem``"""
+        length = len(stem)
+        i = 0
+        while i < length and self._consonant(stem, i):
+            i += 1
+        measure = 0
+        while i < length:
+            while i < length and not self._consonant(stem, i):
+                i += 1
+            if i >= length:
+                break
+            measure += 1
+            while i < length and self._consonant(stem, i):
+                i += 1
+        return measure
+
+    def _has_vowel(self, stem):
+        return any(not self._consonant(stem, i) for i in range(len(stem)))
+
+    def _double_consonant(self, word):
+        return len(word) >= 2 and word[-1] == word[-2] and self._consonant(word, len(word) - 1)
+
+    def _cvc(self, word):
+        return (
+            len(word) >= 3
+            and self._consonant(word, len(word) - 3)
+            and not self._consonant(word, len(word) - 2)
+            and self._consonant(word, len(word) - 1)
+            and word[-1] not in 'wxy'
+        )
+
+    def _step1ab(self, word):
+        if word.endswith('sses') or word.endswith('ies'):
+            word = word[:-2]
+        elif word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+
+        if word.endswith('eed'):
+            if self._measure(word[:-3]) > 0:
+                word = word[:-1]
+            return word
+        for suffix in ('ed', 'ing'):
+            if word.endswith(suffix) and self._has_vowel(word[:-len(suffix)]):
+                word = word[:-len(suffix)]
+                if word.endswith(('at', 'bl', 'iz')):
+                    return word + 'e'
+                if self._double_consonant(word) and word[-1] not in 'lsz':
+                    return word[:-1]
+                if self._measure(word) == 1 and self._cvc(word):
+                    return word + 'e'
+                return word
+        return word
+
+    def _step1c(self, word):
+        if word.endswith('y') and self._has_vowel(word[:-1]):
+            return word[:-1] + 'i'
+        return word
+
+    def _replace(self, word, rules, min_measure):
+        # Only the first matching suffix is considered, as in the reference implementation
+        for suffix, replacement in rules:
+            if word.endswith(suffix):
+                stem = word[:-len(suffix)]
+                return stem + replacement if self._measure(stem) > min_measure else word
+        return word
+
+    def _step4(self, word):
+        for suffix in self.STEP4:
+            if word.endswith(suffix):
+                stem = word[:-len(suffix)]
+                if self._measure(stem) <= 1:
+                    return word
+                if suffix == 'ion' and not stem.endswith(('s', 't')):
+                    return word
+                return stem
+        return word
+
+    def _step5(self, word):
+        if word.endswith('e'):
+            stem = word[:-1]
+            measure = self._measure(stem)
+            if measure > 1 or (measure == 1 and not self._cvc(stem)):
+                word = stem
+        if word.endswith('ll') and self._measure(word) > 1:
+            word = word[:-1]
+        return word
+
+
+def fold_ascii(token):
+    if token.isascii():
+        return token
+    return ''.join(char for char in unicodedata.normalize('NFKD', token) if not unicodedata.combining(char))
+
+
+class Analyzer:
+    """A compiled tokenizer and token filter chain"""
+
+    def __init__(self, config=None):
+        self.config = {
+            **DEFAULT_ANALYZER_CONFIG,
+            **getattr(settings, 'SEARCH_CONFIG', {}).get('ANALYZER', {}),
+            **(config or {}),
+        }
+        unknown = set(self.config['FILTERS']) - set(FILTERS)
+        if unknown:
+            raise ImproperlyConfigured(f"Unknown search analyzer filters: {', '.join(sorted(unknown))}")
+
+        self.filters = tuple(self.config['FILTERS'])
+        self.pattern = re.compile(self.config['TOKEN_PATTERN'])
+        self.min_length = self.config['MIN_TOKEN_LENGTH']
+        self.stemmer = PorterStemmer()
+        self.stopwords = frozenset(self._prepare(word, 'stop') for word in self.config['STOPWORDS'])
+        self.synonyms = {}
+        for group in self.config['SYNONYMS']:
+            words = [self._prepare(word, 'synonyms') for word in group]
+            for word in words:
+                self.synonyms[word] = words[0]
+        self._terms = {}
+
+    @property
+    def signature(self):
+        """Short digest of everything that affects the terms produced"""
+        settings_that_matter = {key: self.config[key] for key in (
+            'TOKEN_PATTERN', 'MIN_TOKEN_LENGTH', 'FILTERS', 'STOPWORDS', 'SYNONYMS',
+        )}
+        encoded = json.dumps(settings_that_matter, sort_keys=True, default=list).encode('utf-8')
+        return hashlib.sha1(encoded).hexdigest()[:12]
+
+    def analyze(self, text):
+        """Terms of ``text`` in order, with repeats"""
+        terms = []
+        cache = self._terms
+        for token in self.pattern.findall(text or ''):
+            term = cache.get(token, False)
+            if term is False:
+                term = self._term(token)
+            if term is not None:
+                terms.append(term)
+        return terms
+
+    def substring_terms(self, text):
+        """
+        Words of a query for substring (icontains) matching.
+
+        Stopwords are dropped, and a word is replaced by its stem only when
+        the stem is a prefix of it. "reports" becomes "report", which also
+        matches "reporting"; "happy" stays "happy" instead of "happi".
+        """
+        words = []
+        for token in self.pattern.findall((text or '').lower()):
+            if len(token) < self.min_length or token in self.stopwords:
+                continue
+            stem = self.stemmer.stem(token) if 'porter' in self.filters else token
+            words.append(stem if token.startswith(stem) and len(stem) >= self.min_length else token)
+        return words
+
+    def _prepare(self, word, until):
+        """Run a configured stopword or synonym through the filters listed before ``until``"""
+        filters = self.filters[:self.filters.index(until)] if until in self.filters else ()
+        return self._apply([name for name in filters if name not in ('stop', 'synonyms')], word)
+
+    def _term(self, token):
+        term = self._apply(self.filters, token) if len(token) >= self.min_length else None
+        if len(self._terms) >= self.config['MAX_CACHED_TOKENS']:
+            self._terms = {}
+        self._terms[token] = term
+        return term
+
+    def _apply(self, filters, term):
+        for name in filters:
+            if name == 'lowercase':
+                term = term.lower()
+            elif name == 'asciifold':
+                term = fold_ascii(term)
+            elif name == 'stop':
+                if term in self.stopwords:
+                    return None
+            elif name == 'porter':
+                term = self.stemmer.stem(term)
+            elif name == 'synonyms':
+                term = self.synonyms.get(term, term)
+        return term
+
+
+@lru_cache(maxsize=None)
+def get_analyzer():
+    """Return the analyzer configured in SEARCH_CONFIG['ANALYZER']"""
+    return Analyzer()
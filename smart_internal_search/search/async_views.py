@@ -0,0 +1,144 @@
+"""
+Native async versions of the search endpoints for the ASGI deployment.
+
+DRF 3.14 function views are synchronous, so these are plain Django async
+views returning JsonResponse with the same payloads as search/views.py.
+Django 4.2 runs each async ORM call through sync_to_async on the one
+thread-sensitive executor, so the queries of a request run one after
+another. The gain is that waiting on them does not tie up a worker
+thread per request, and core.asgi can cancel the view between queries
+when the client disconnects mid-typeahead.
+"""
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from django.db.models import Count
+from django.http import JsonResponse
+from .querylog import query_logger
+from .utils import document_search
+from documents.models import Document
+from documents.serializers import DocumentListSerializer
+from documents.taxonomy import taxonomy
+
+
+async def _collect(queryset):
+    return [row async for row in queryset]
+
+
+# The taxonomy cache may need to (re)load from the database
+_with_names = sync_to_async(taxonomy.with_names)
+
+
+async def search_documents(request):
+    """
+    Async document search endpoint with facet counts
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({
+            'error': 'Search query is required'
+        }, status=400)
+
+    # Get filters from query parameters
+    filters = {
+        'team': request.GET.get('team'),
+        'project': request.GET.get('project'),
+        'file_type': request.GET.get('file_type'),
+        'topic': request.GET.get('topic'),
+        'status': request.GET.get('status'),
+    }
+
+    # Remove empty filters
+    filters = {k: v for k, v in filters.items() if v}
+
+    try:
+        started = time.perf_counter()
+        matches = await document_search.asearch_documents(query, filters)
+        page = matches.select_related(
+            'team', 'project', 'uploaded_by'
+        ).prefetch_related('topics')[:document_search.max_results]
+
+        documents = await _collect(page)
+        count = await matches[:document_search.max_results].acount()
+        by_type = await _collect(matches.order_by().values('file_type').annotate(count=Count('id', distinct=True)))
+        by_team = await _collect(matches.order_by().values('team__id').annotate(count=Count('id', distinct=True)))
+        by_team = await _with_names(by_team, 'team', 'team__id', 'team__name')
+
+        # Everything the serializer touches is already loaded
+        serializer = DocumentListSerializer(documents, many=True)
+        results = serializer.data
+
+        search_id = uuid.uuid4()
+        latency_ms = (time.perf_counter() - started) * 1000
+        query_logger.record(query, filters, latency_ms, count, search_id=search_id)
+
+        return JsonResponse({
+            'query': query,
+            'filters': filters,
+            'count': count,
+            'facets': {
+                'file_types': by_type,
+                'teams': by_team,
+            },
+            'results': results,
+            'search_id': str(search_id),
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Search failed: {str(e)}'
+        }, status=500)
+
+
+async def search_suggestions(request):
+    """
+    Get search suggestions based on partial query
+    """
+    query = request.GET.get('q', '').strip()
+    if not query or len(query) < 2:
+        return JsonResponse({'suggestions': []})
+
+    try:
+        suggestions = await document_search.aget_search_suggestions(query)
+        return JsonResponse({'suggestions': suggestions})
+
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Failed to get suggestions: {str(e)}'
+        }, status=500)
+
+
+async def search_stats(request):
+    """
+    Get search statistics and available filters
+    """
+    teams = await _collect(Document.objects.values('team__id').annotate(
+        count=Count('id')
+    ).filter(count__gt=0))
+    projects = await _collect(Document.objects.values('project__id').annotate(
+        count=Count('id')
+    ).filter(count__gt=0))
+    file_types = await _collect(Document.objects.values('file_type').annotate(
+        count=Count('id')
+    ).filter(count__gt=0))
+    topics = await _collect(Document.objects.values('topics__id').annotate(
+        count=Count('id')
+    ).filter(count__gt=0))
+    total = await Document.objects.acount()
+    searchable = await Document.objects.filter(content_extracted=True).acount()
+
+    teams = await _with_names(teams, 'team', 'team__id', 'team__name')
+    projects = await _with_names(projects, 'project', 'project__id', 'project__name')
+    topics = await _with_names(topics, 'topic', 'topics__id', 'topics__name')
+
+    return JsonResponse({
+        'available_filters': {
+            'teams': teams,
+            'projects': projects,
+            'file_types': file_types,
+            'topics': topics,
+        },
+        'total_documents': total,
+        'searchable_documents': searchable,
+        'search_engine': document_search.backend.name
+    })
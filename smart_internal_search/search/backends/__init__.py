@@ -0,0 +1,14 @@
+from functools import lru_cache
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+DEFAULT_BACKEND = 'search.backends.sqlite.SQLiteSearchBackend'
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """Return the search backend configured in SEARCH_CONFIG['BACKEND']"""
+    config = getattr(settings, 'SEARCH_CONFIG', {})
+    backend_class = import_string(config.get('BACKEND', DEFAULT_BACKEND))
+    return backend_class(config)
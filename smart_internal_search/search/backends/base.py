@@ -0,0 +1,68 @@
+class BaseSearchBackend:
+    """
+    Interface for full-text search backends.
+
+    A backend turns a query into one or more candidate querysets, best
+    strategy first; DocumentSearch uses the first one that has results.
+    Backends that keep their own index also receive indexing callbacks.
+    """
+
+    name = 'Base'
+    # Backends with their own index return ranked ids instead of querysets
+    uses_index = False
+    # Backends that can find related documents from an index (see search/related.py)
+    supports_related = False
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.min_search_length = config.get('MIN_SEARCH_LENGTH', 2)
+
+    def search_querysets(self, queryset, query):
+        """Yield querysets of matching documents, ordered by relevance"""
+        raise NotImplementedError('Search backends must implement search_querysets()')
+
+    def ranked_ids(self, query):
+        """Yield lists of matching document ids in rank order, best strategy first"""
+        raise NotImplementedError('Index backends must implement ranked_ids()')
+
+    def index_search(self, queryset, query):
+        """
+        Narrow ``queryset`` to documents matching every query term using the
+        backend's own index, or return None if it has no index over the
+        extracted text (callers then fall back to cheaper field lookups).
+        """
+        return None
+
+    def term_vector(self, document):
+        """
+        Weighted term frequencies of a document, read from the backend's
+        index. Only backends with ``supports_related`` implement this and
+        the two methods below; without an index every one of them would
+        scan the documents table.
+        """
+        raise NotImplementedError('This search backend does not support related documents')
+
+    def doc_freqs(self, terms):
+        """(document count, {term: number of documents containing it})"""
+        raise NotImplementedError('This search backend does not support related documents')
+
+    def similar_ids(self, weights, limit, exclude=None):
+        """
+        Ids of the ``limit`` documents with the highest total weight of the
+        ``weights`` terms they contain, best first.
+        """
+        raise NotImplementedError('This search backend does not support related documents')
+
+    def index_document(self, document):
+        """Add or refresh a document in the backend's index"""
+
+    def remove_document(self, document_id):
+        """Drop a document from the backend's index"""
+
+    def flush(self):
+        """Make buffered index changes visible to other processes"""
+
+    def reindex(self, documents):
+        """Rebuild the index from an iterable of documents"""
+        for document in documents:
+            self.index_document(document)
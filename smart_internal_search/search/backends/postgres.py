@@ -0,0 +1,115 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, connections, router
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from documents.models import Document
+from .base import BaseSearchBackend
+from .sqlite import SQLiteSearchBackend
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL full-text search over the generated ``search_vector`` column.
+
+    The column is added by documents migration 0003 as a stored, weighted
+    tsvector (A=title, B=content, C=description, D=filename) with a GIN
+    index. Matches are ranked with ts_rank_cd; if nothing matches, the
+    icontains strategy still catches partial words such as typeahead input.
+    """
+
+    name = 'PostgreSQL (Full-Text Search)'
+    supports_related = True
+
+    # Field weights of search_vector labels, as in search/segments.py
+    LABEL_WEIGHTS = {'A': 4, 'B': 3, 'C': 2, 'D': 1}
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        config = config or {}
+        if connection.vendor != 'postgresql':
+            raise ImproperlyConfigured(
+                'PostgresSearchBackend requires a PostgreSQL default database.'
+            )
+        # Must match the configuration used in the search_vector migration
+        self.text_search_config = config.get('TEXT_SEARCH_CONFIG', 'english')
+        self.fallback = SQLiteSearchBackend(config)
+
+    def search_querysets(self, queryset, query):
+        column = f'"{Document._meta.db_table}"."search_vector"'
+        tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = (self.text_search_config, query)
+
+        yield queryset.filter(
+            RawSQL(f'{column} @@ {tsquery}', params, output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f'ts_rank_cd({column}, {tsquery})', params, output_field=FloatField())
+        ).order_by('-rank', '-uploaded_at')
+
+        yield from self.fallback.search_querysets(queryset, query)
+
+    def index_search(self, queryset, query):
+        column = f'"{Document._meta.db_table}"."search_vector"'
+        return queryset.filter(RawSQL(
+            f'{column} @@ websearch_to_tsquery(%s::regconfig, %s)',
+            (self.text_search_config, query), output_field=BooleanField(),
+        ))
+
+    # Related documents (see search/related.py) read the stored tsvector.
+    # Terms are its lexemes, and every lookup goes through the GIN index.
+
+    def term_vector(self, document):
+        weights = {}
+        with connections[router.db_for_read(Document)].cursor() as cursor:
+            cursor.execute(
+                f'SELECT lexeme, weights FROM "{Document._meta.db_table}", unnest(search_vector) '
+                f'WHERE id = %s',
+                [document.id],
+            )
+            for lexeme, labels in cursor.fetchall():
+                weights[lexeme] = sum(self.LABEL_WEIGHTS.get(label, 1) for label in labels)
+        return weights
+
+    def doc_freqs(self, terms):
+        terms = list(terms)
+        table = f'"{Document._meta.db_table}"'
+        freqs = {}
+        with connections[router.db_for_read(Document)].cursor() as cursor:
+            # The planner's row estimate is close enough for idf, and free
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [Document._meta.db_table]
+            )
+            total = max(cursor.fetchone()[0], 0) or Document.objects.count()
+            if terms:
+                cursor.execute(
+                    ' UNION ALL '.join(
+                        f'SELECT %s, count(*) FROM {table} WHERE search_vector @@ %s::tsquery' for _ in terms
+                    ),
+                    [value for term in terms for value in (term, self._lexeme_query(term))],
+                )
+                freqs = dict(cursor.fetchall())
+        return total, freqs
+
+    def similar_ids(self, weights, limit, exclude=None):
+        if not weights:
+            return []
+        column = f'"{Document._meta.db_table}"."search_vector"'
+        any_term = ' | '.join(self._lexeme_query(term) for term in weights)
+        score = ' + '.join(f'(CASE WHEN {column} @@ %s::tsquery THEN %s ELSE 0 END)' for _ in weights)
+        score_params = [
+            value for term, weight in weights.items() for value in (self._lexeme_query(term), float(weight))
+        ]
+        queryset = Document.objects.filter(
+            RawSQL(f'{column} @@ %s::tsquery', (any_term,), output_field=BooleanField())
+        )
+        if exclude is not None:
+            queryset = queryset.exclude(pk=exclude)
+        return list(
+            queryset.annotate(related_score=RawSQL(score, score_params, output_field=FloatField()))
+            .order_by('-related_score', '-uploaded_at')
+            .values_list('pk', flat=True)[:limit]
+        )
+
+    @staticmethod
+    def _lexeme_query(term):
+        """A tsquery literal matching exactly the lexeme ``term``"""
+        return "'" + term.replace('\\', '\\\\').replace("'", "''") + "'"
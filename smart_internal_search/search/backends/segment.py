@@ -0,0 +1,77 @@
+import logging
+from django.conf import settings
+from ..analysis import get_analyzer
+from ..segment_writer import IndexWriter
+from ..segments import SegmentIndex, document_columns, document_terms, tokenize
+from .base import BaseSearchBackend
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentSearchBackend(BaseSearchBackend):
+    """
+    Inverted index in memory-mapped segment files under SEARCH_INDEX_DIR.
+
+    Matches whole words; documents must contain every query term, falling
+    back to any term. Results are ordered newest first using the
+    uploaded_at doc-values column, without touching the database.
+    Writes are buffered and flushed as small segments that are merged in
+    the background.
+    """
+
+    name = 'Segment Index (mmap)'
+    uses_index = True
+    supports_related = True
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        config = config or {}
+        analyzer = get_analyzer().signature
+        self.index = SegmentIndex(config.get('INDEX_DIR') or settings.SEARCH_INDEX_DIR, analyzer=analyzer)
+        self.writer = IndexWriter(self.index, config.get('SEGMENT_WRITER'))
+        self.max_candidates = config.get('MAX_CANDIDATES', 10000)
+        if self.index.segment_stats() and self.index.built_with != analyzer:
+            logger.warning(
+                'The search index was built with a different analyzer; run "manage.py reindex_search"'
+            )
+
+    def ranked_ids(self, query):
+        terms = tokenize(query)
+        yield self.writer.search(terms, require_all=True)
+        yield self.writer.search(terms, require_all=False)
+
+    def search_querysets(self, queryset, query):
+        for ids in self.ranked_ids(query):
+            yield queryset.filter(pk__in=ids[:self.max_candidates]).order_by('-uploaded_at')
+
+    def index_search(self, queryset, query):
+        ids = self.writer.search(tokenize(query), require_all=True)
+        return queryset.filter(pk__in=ids[:self.max_candidates])
+
+    def term_vector(self, document):
+        vector = self.writer.term_vector(document.id)
+        # Not indexed yet, or indexed in a version 1 segment
+        return vector if vector is not None else document_terms(document)
+
+    def doc_freqs(self, terms):
+        return self.index.doc_freqs(terms)
+
+    def similar_ids(self, weights, limit, exclude=None):
+        return self.writer.similar(weights, limit, exclude)
+
+    def index_document(self, document):
+        self.writer.add_document(self._entry(document))
+
+    def remove_document(self, document_id):
+        self.writer.delete_document(document_id)
+
+    def flush(self):
+        self.writer.flush()
+
+    def reindex(self, documents):
+        self.writer.discard_buffer()
+        self.index.rebuild(self._entry(document) for document in documents.iterator(chunk_size=500))
+
+    @staticmethod
+    def _entry(document):
+        return document.id, document_terms(document), document_columns(document)
@@ -0,0 +1,75 @@
+from typing import List
+from django.db.models import Q
+from documents.models import Document
+from ..analysis import get_analyzer
+from .base import BaseSearchBackend
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """Portable icontains search; works on any database Django supports"""
+
+    name = 'SQLite (Basic Search)'
+
+    def search_querysets(self, queryset, query):
+        yield self._weighted_search(queryset, query)
+        yield self._basic_icontains_search(queryset, query)
+
+    def _weighted_search(self, queryset, query):
+        """
+        Weighted search that prioritizes different fields
+        """
+        words = self._split_query(query)
+
+        if not words:
+            return Document.objects.none()
+
+        # Build weighted Q objects
+        q_objects = Q()
+        for word in words:
+            # Title matches are most important (weight 4)
+            title_q = Q(title__icontains=word)
+            # Content matches are important (weight 3)
+            content_q = Q(content_text__icontains=word)
+            # Description matches are medium importance (weight 2)
+            desc_q = Q(description__icontains=word)
+            # Filename matches are less important (weight 1)
+            filename_q = Q(original_filename__icontains=word)
+
+            # Combine with OR for this word
+            word_q = title_q | content_q | desc_q | filename_q
+            q_objects &= word_q  # Use AND between words
+
+        if q_objects:
+            # Exact matches ordered by relevance; the caller checks for hits
+            return queryset.filter(q_objects).order_by('-uploaded_at')
+
+        return Document.objects.none()
+
+    def _basic_icontains_search(self, queryset, query):
+        """Fallback to basic case-insensitive search"""
+        words = self._split_query(query)
+
+        # Build Q objects for each word
+        q_objects = Q()
+        for word in words:
+            if len(word) >= self.min_search_length:
+                q_objects |= (
+                        Q(title__icontains=word) |
+                        Q(content_text__icontains=word) |
+                        Q(description__icontains=word) |
+                        Q(original_filename__icontains=word)
+                )
+
+        if q_objects:
+            return queryset.filter(q_objects).order_by('-uploaded_at')
+
+        return Document.objects.none()
+
+    def _split_query(self, query: str) -> List[str]:
+        """Split query into meaningful words, without stopwords and with safe stems"""
+        analyzer = get_analyzer()
+        words = analyzer.substring_terms(query)
+        if not words:
+            # A query made only of stopwords ("IT", "to be or not") is matched as typed
+            words = analyzer.pattern.findall((query or '').lower())
+        return [word for word in words if len(word) >= self.min_search_length]
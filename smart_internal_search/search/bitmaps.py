@@ -0,0 +1,175 @@
+"""
+Compressed integer bitmaps in the style of Roaring.
+
+Values are split into a 16-bit high key and a 16-bit low part. Each high
+key owns a container holding the low parts: a sorted ``array('H')`` while
+it has at most ARRAY_MAX_SIZE entries, otherwise an 8KB bitset stored as a
+Python int so that intersections and unions are single C-level operations.
+"""
+from array import array
+from bisect import bisect_left
+
+
+ARRAY_MAX_SIZE = 4096
+BITSET_BYTES = 65536 // 8
+
+
+def _bitset_from_lows(lows):
+    buffer = bytearray(BITSET_BYTES)
+    for low in lows:
+        buffer[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _lows_from_bitset(bits):
+    lows = []
+    for index, byte in enumerate(bits.to_bytes(BITSET_BYTES, 'little')):
+        if byte:
+            base = index << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    lows.append(base + bit)
+    return lows
+
+
+def _container(lows):
+    """Pick the representation for a sorted list of unique low values"""
+    if len(lows) <= ARRAY_MAX_SIZE:
+        return array('H', lows)
+    return _bitset_from_lows(lows)
+
+
+def _normalize(bits):
+    """Shrink a bitset back to an array once it becomes sparse"""
+    if bits.bit_count() <= ARRAY_MAX_SIZE:
+        return array('H', _lows_from_bitset(bits))
+    return bits
+
+
+def _cardinality(container):
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def _intersect(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return _normalize(a & b)
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        return array('H', [low for low in a if b >> low & 1])
+    if len(a) > len(b):
+        a, b = b, a
+    other = set(b)
+    return array('H', [low for low in a if low in other])
+
+
+def _union(a, b):
+    if isinstance(a, int) or isinstance(b, int):
+        a_bits = a if isinstance(a, int) else _bitset_from_lows(a)
+        b_bits = b if isinstance(b, int) else _bitset_from_lows(b)
+        return a_bits | b_bits
+    return _container(sorted(set(a).union(b)))
+
+
+class Bitmap:
+    """A set of non-negative integers (document ids) with fast set algebra"""
+
+    __slots__ = ('_containers',)
+
+    def __init__(self, values=()):
+        self._containers = {}
+        groups = {}
+        for value in values:
+            groups.setdefault(value >> 16, set()).add(value & 0xFFFF)
+        for high, lows in groups.items():
+            self._containers[high] = _container(sorted(lows))
+
+    def add(self, value):
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = array('H', [low])
+        elif isinstance(container, int):
+            self._containers[high] = container | (1 << low)
+        else:
+            position = bisect_left(container, low)
+            if position == len(container) or container[position] != low:
+                container.insert(position, low)
+                if len(container) > ARRAY_MAX_SIZE:
+                    self._containers[high] = _bitset_from_lows(container)
+
+    def discard(self, value):
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = _normalize(container & ~(1 << low))
+        else:
+            position = bisect_left(container, low)
+            if position < len(container) and container[position] == low:
+                del container[position]
+        if _cardinality(container):
+            self._containers[high] = container
+        else:
+            del self._containers[high]
+
+    def __contains__(self, value):
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        position = bisect_left(container, low)
+        return position < len(container) and container[position] == low
+
+    def __and__(self, other):
+        result = Bitmap()
+        for high in self._containers.keys() & other._containers.keys():
+            container = _intersect(self._containers[high], other._containers[high])
+            if _cardinality(container):
+                result._containers[high] = container
+        return result
+
+    def __or__(self, other):
+        result = Bitmap()
+        result._containers = dict(self._containers)
+        for high, container in other._containers.items():
+            mine = result._containers.get(high)
+            result._containers[high] = container if mine is None else _union(mine, container)
+        # Containers may be shared with the operands, so copy mutable arrays
+        for high, container in result._containers.items():
+            if not isinstance(container, int):
+                result._containers[high] = array('H', container)
+        return result
+
+    def __len__(self):
+        return sum(_cardinality(container) for container in self._containers.values())
+
+    def __bool__(self):
+        return bool(self._containers)
+
+    def __iter__(self):
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            lows = _lows_from_bitset(container) if isinstance(container, int) else container
+            base = high << 16
+            for low in lows:
+                yield base + low
+
+    def __repr__(self):
+        return f'<Bitmap cardinality={len(self)}>'
+
+    @staticmethod
+    def intersect_all(bitmaps):
+        """Intersect bitmaps smallest first so the working set shrinks quickly"""
+        bitmaps = sorted(bitmaps, key=len)
+        if not bitmaps:
+            return Bitmap()
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            if not result:
+                break
+            result = result & bitmap
+        return result
@@ -0,0 +1,176 @@
+"""
+Result and suggestion caching for the search endpoints.
+
+Response payloads are cached in the shared 'search' cache. Every key
+includes the TableVersion counters of the tables a payload is built from
+(see documents/conditional.py): documents, their topics, the team, project
+and topic names, and for collapsed results the near-duplicate clusters. A
+change to one of them retires the affected pages at once, without scanning
+keys, while writes elsewhere, such as views and logins, keep them.
+
+access_count and last_accessed change on every view of a document
+without a version bump, so cached rows hold them as null. They are filled
+in from the database (one query by primary key) each time a payload is
+served, so the response has the same shape and values as an uncached one.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+from django.utils import timezone
+from documents.conditional import table_versions
+from documents.dedup import near_duplicates
+from documents.fast_serializers import format_datetime, serialize_documents
+from documents.models import Document, DocumentFingerprint, Project, Team, Topic
+from .models import QueryLog
+from .querylog import normalize_query
+from .utils import document_search
+
+
+DEFAULT_RESULT_CACHE_CONFIG = {
+    'ENABLED': True,
+    'TTL': 300,
+    'CACHE_ALIAS': 'search',
+    'PREWARM_QUERIES': 50,
+    'PREWARM_DAYS': 7,
+}
+
+# Tables whose changes alter a search or suggestions payload
+RESULT_MODELS = (Document, Team, Project, Topic, Document.topics.through)
+COLLAPSED_MODELS = RESULT_MODELS + (DocumentFingerprint,)
+
+# Changed by every view, without a version bump
+VOLATILE_FIELDS = ('access_count', 'last_accessed')
+
+
+def search_payload(query, filters, collapse=False):
+    """
+    The body of a search response. ``collapse`` keeps one document per
+    near-duplicate cluster in ``results`` and reports how many were dropped
+    as ``collapsed``; ``count`` stays the number of matching documents.
+    """
+    documents = document_search.search_documents(query, filters)
+    count = documents.count()
+    results = serialize_documents(documents)
+    payload = {
+        'query': query,
+        'filters': filters,
+        'count': count,
+        'results': results,
+    }
+    if collapse:
+        # Results are in rank order, so each cluster keeps its best-ranked member
+        kept = set(near_duplicates.collapse([row['id'] for row in results]))
+        payload['results'] = [row for row in results if row['id'] in kept]
+        payload['collapsed'] = len(results) - len(kept)
+    return payload
+
+
+def without_volatile_fields(payload):
+    """A copy of a search payload to cache, with the volatile fields nulled"""
+    results = [{**row, **dict.fromkeys(VOLATILE_FIELDS)} for row in payload['results']]
+    return {**payload, 'results': results}
+
+
+def with_volatile_fields(payload):
+    """Fill in the current volatile fields of a cached search payload"""
+    current = {
+        document_id: (access_count, format_datetime(last_accessed))
+        for document_id, access_count, last_accessed in Document.objects.filter(
+            pk__in=[row['id'] for row in payload['results']]
+        ).values_list('id', *VOLATILE_FIELDS)
+    }
+    results = []
+    for row in payload['results']:
+        row = dict(row)
+        if row['id'] in current:
+            # Assigning existing keys keeps the serializer's field order
+            row['access_count'], row['last_accessed'] = current[row['id']]
+        results.append(row)
+    return {**payload, 'results': results}
+
+
+def suggestions_payload(query):
+    """The body of a suggestions response"""
+    return {'suggestions': document_search.get_search_suggestions(query)}
+
+
+class SearchResultCache:
+    """Caches search and suggestion payloads per version of the tables they read"""
+
+    def __init__(self, config=None):
+        self.config = {
+            **DEFAULT_RESULT_CACHE_CONFIG,
+            **getattr(settings, 'SEARCH_CONFIG', {}).get('RESULT_CACHE', {}),
+            **(config or {}),
+        }
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    def results(self, query, filters, collapse=False):
+        """Return (payload, cache hit) for a search"""
+        if not self.config['ENABLED']:
+            return search_payload(query, filters, collapse), False
+        if collapse:
+            key = self._key('collapsed', COLLAPSED_MODELS, query, filters)
+        else:
+            key = self._key('results', RESULT_MODELS, query, filters)
+        payload = self.cache.get(key)
+        if payload is not None:
+            # Queries that differ only in case or spacing share an entry
+            return with_volatile_fields(dict(payload, query=query)), True
+        payload = search_payload(query, filters, collapse)
+        self.cache.set(key, without_volatile_fields(payload), self.config['TTL'])
+        return payload, False
+
+    def suggestions(self, query):
+        if not self.config['ENABLED']:
+            return suggestions_payload(query)
+        key = self._key('suggestions', (Document,), query)
+        payload = self.cache.get(key)
+        if payload is None:
+            payload = suggestions_payload(query)
+            self.cache.set(key, payload, self.config['TTL'])
+        return payload
+
+    def prewarm(self, limit=None, days=None):
+        """
+        Compute results for the most frequent logged searches, and
+        suggestions for their typeahead prefixes. Returns the number of
+        searches warmed.
+        """
+        limit = limit or self.config['PREWARM_QUERIES']
+        since = timezone.now() - timedelta(days=days or self.config['PREWARM_DAYS'])
+        top_searches = (
+            QueryLog.objects.filter(event='SEARCH', created_at__gte=since, result_count__gt=0)
+            .values('query', 'filters')
+            .annotate(count=Count('id'))
+            .order_by('-count')[:limit]
+        )
+
+        warmed = 0
+        prefixes = set()
+        for row in top_searches:
+            self.results(row['query'], row['filters'] or {})
+            warmed += 1
+            if not row['filters']:
+                min_length = document_search.backend.min_search_length
+                prefixes.update(row['query'][:end] for end in range(min_length, len(row['query']) + 1))
+
+        for prefix in sorted(prefixes):
+            self.suggestions(prefix)
+        return warmed
+
+    def _key(self, kind, models, query, filters=None):
+        versions = sorted((table, version) for table, (version, _) in table_versions(models).items())
+        fingerprint = json.dumps([versions, normalize_query(query), filters or {}], sort_keys=True)
+        digest = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:32]
+        return f'search:{kind}:{digest}'
+
+
+# Global result cache instance
+search_cache = SearchResultCache()
@@ -0,0 +1,313 @@
+"""
+Bitmap filter index for the search facets.
+
+One Bitmap of document ids per facet value (team, project, file_type,
+status, topic). Search filters become bitmap intersections that are checked
+against text-match candidate ids, so no filter joins, DISTINCT or row
+fetches happen before the final page is known.
+
+The bitmaps live in each process. The process that indexes a change
+updates its bitmaps in place and publishes a new generation token in the
+shared 'search' cache. Other web and Celery processes check the token at
+most every REFRESH_INTERVAL seconds. When it has changed, they read the
+document change feed (documents/changes.py) after the last event they
+applied, and move only the documents named there. The change feed
+publishes its own token after commit, and that token is watched too, so
+an event committed after a process's read is still picked up.
+
+A full rebuild happens only at startup, after MAX_AGE seconds as a safety
+net, when more than MAX_DELTA events are pending, or when ``invalidate()``
+is called for a change the feed cannot describe. Change events are kept
+far longer than MAX_AGE, so pruning never removes events a process still
+needs.
+
+Only the first build runs on the request that needs it. Later rebuilds
+scan the documents table on a background thread (with
+BACKGROUND_REBUILD), while searches keep using the current bitmaps and
+the deltas applied to them. The new bitmaps are swapped in when complete,
+and the change events committed since the rebuild started are applied to
+them at the next check.
+"""
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.db.models import Max
+from documents.changes import LATEST_KEY, change_feed
+from documents.models import ChangeEvent, Document
+from .bitmaps import Bitmap
+
+logger = logging.getLogger(__name__)
+
+FACETS = ('team', 'project', 'file_type', 'status', 'topic')
+
+DEFAULT_FACET_CONFIG = {
+    'ENABLED': True,
+    'REFRESH_INTERVAL': 2,
+    'MAX_AGE': 300,
+    'MAX_DELTA': 5000,
+    'BACKGROUND_REBUILD': True,
+    'CACHE_ALIAS': 'search',
+}
+
+GENERATION_KEY = 'search:facets:generation'
+REBUILD_KEY = 'search:facets:rebuild'
+
+
+class FacetIndex:
+    """Per-facet-value bitmaps of document ids"""
+
+    def __init__(self, config=None):
+        self.config = {
+            **DEFAULT_FACET_CONFIG,
+            **getattr(settings, 'SEARCH_CONFIG', {}).get('FACET_INDEX', {}),
+            **(config or {}),
+        }
+        self._bitmaps = None
+        self._generation = None
+        self._rebuild_token = None
+        self._feed_token = None
+        self._seq = 0
+        self._built_at = 0.0
+        self._checked_at = 0.0
+        self._catch_up = False
+        self._rebuilding = None
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    def candidates(self, filters):
+        """
+        Return the Bitmap of documents matching every facet filter, or None
+        when no facet filter is set.
+        """
+        selected = [(facet, filters[facet]) for facet in FACETS if filters.get(facet)]
+        if not selected:
+            return None
+
+        bitmaps = self._current()
+        with self._lock:
+            matches = [bitmaps[facet].get(str(value), Bitmap()) for facet, value in selected]
+            # Copy so callers never hold a bitmap that the indexer mutates
+            return Bitmap() | Bitmap.intersect_all(matches)
+
+    def counts(self, facet):
+        """Document count per value of a facet"""
+        bitmaps = self._current()
+        with self._lock:
+            return {value: len(bitmap) for value, bitmap in bitmaps[facet].items() if bitmap}
+
+    def update_document(self, document, topic_ids=None):
+        """Move a document to the bitmaps of its current facet values"""
+        if topic_ids is None:
+            topic_ids = list(document.topics.values_list('id', flat=True))
+        self._update({document.id: (document, topic_ids)})
+
+    def update_documents(self, documents):
+        """Like update_document for many documents, with one topics query and one publish"""
+        documents = {document.id: (document, []) for document in documents}
+        if not documents:
+            return
+        through = Document.topics.through.objects.filter(document_id__in=list(documents))
+        for document_id, topic_id in through.values_list('document_id', 'topic_id'):
+            documents[document_id][1].append(topic_id)
+        self._update(documents)
+
+    def set_topics(self, document_id, topic_ids):
+        with self._lock:
+            stale = self._bitmaps is None or self._is_outdated()
+            if self._bitmaps is not None:
+                self._move('topic', document_id, topic_ids)
+            self._publish(stale)
+
+    def remove_document(self, document_id):
+        with self._lock:
+            stale = self._bitmaps is None or self._is_outdated()
+            if self._bitmaps is not None:
+                for facet in FACETS:
+                    self._move(facet, document_id, [])
+            self._publish(stale)
+
+    def set_values(self, facet, values_by_document):
+        """Set one facet's values for many documents, with one publish"""
+        with self._lock:
+            stale = self._bitmaps is None or self._is_outdated()
+            if self._bitmaps is not None:
+                for document_id, values in values_by_document.items():
+                    self._move(facet, document_id, values)
+            self._publish(stale)
+
+    def remove_documents(self, document_ids):
+        with self._lock:
+            stale = self._bitmaps is None or self._is_outdated()
+            if self._bitmaps is not None:
+                for document_id in document_ids:
+                    for facet in FACETS:
+                        self._move(facet, document_id, [])
+            self._publish(stale)
+
+    def invalidate(self):
+        """Force every process to rebuild on its next check"""
+        with self._lock:
+            self.cache.set(REBUILD_KEY, uuid.uuid4().hex, None)
+            self._publish(stale=True)
+
+    def rebuild(self):
+        bitmaps = {facet: {} for facet in FACETS}
+        columns = Document.objects.order_by().values_list('id', 'team_id', 'project_id', 'file_type', 'status')
+        groups = {facet: {} for facet in FACETS}
+        for document_id, *row in columns.iterator(chunk_size=5000):
+            for facet, values in self._column_values(row).items():
+                for value in values:
+                    groups[facet].setdefault(value, []).append(document_id)
+
+        through = Document.topics.through.objects.order_by().values_list('document_id', 'topic_id')
+        for document_id, topic_id in through.iterator(chunk_size=5000):
+            groups['topic'].setdefault(str(topic_id), []).append(document_id)
+
+        for facet, values in groups.items():
+            for value, ids in values.items():
+                bitmaps[facet][value] = Bitmap(ids)
+        return bitmaps
+
+    def apply_changes(self):
+        """
+        Move the documents named in change events after the last one
+        applied; returns False when there are too many to be worth it
+        """
+        events = list(
+            ChangeEvent.objects.filter(id__gt=self._seq).order_by('id')
+            .values_list('id', 'document_id')[:self.config['MAX_DELTA'] + 1]
+        )
+        if len(events) > self.config['MAX_DELTA']:
+            return False
+        if not events:
+            return True
+        document_ids = {document_id for _, document_id in events}
+        values = {
+            document_id: {**self._column_values(columns), 'topic': []}
+            for document_id, *columns in Document.objects.filter(pk__in=document_ids).values_list(
+                'id', 'team_id', 'project_id', 'file_type', 'status'
+            )
+        }
+        through = Document.topics.through.objects.filter(document_id__in=list(values))
+        for document_id, topic_id in through.values_list('document_id', 'topic_id'):
+            values[document_id]['topic'].append(topic_id)
+        with self._lock:
+            for document_id in document_ids:
+                for facet in FACETS:
+                    # Deleted documents leave every bitmap
+                    self._move(facet, document_id, values.get(document_id, {}).get(facet, []))
+            self._seq = events[-1][0]
+        return True
+
+    @staticmethod
+    def _column_values(columns):
+        team_id, project_id, file_type, status = columns
+        return {
+            'team': [str(team_id)],
+            'project': [str(project_id)] if project_id else [],
+            'file_type': [file_type],
+            'status': [status],
+        }
+
+    def _update(self, documents):
+        with self._lock:
+            stale = self._bitmaps is None or self._is_outdated()
+            if self._bitmaps is not None:
+                for document_id, (document, topic_ids) in documents.items():
+                    values = self._column_values(
+                        (document.team_id, document.project_id, document.file_type, document.status)
+                    )
+                    values['topic'] = topic_ids
+                    for facet in FACETS:
+                        self._move(facet, document_id, values[facet])
+            self._publish(stale)
+
+    def _move(self, facet, document_id, values):
+        values = {str(value) for value in values}
+        for value, bitmap in self._bitmaps[facet].items():
+            if value not in values:
+                bitmap.discard(document_id)
+        for value in values:
+            self._bitmaps[facet].setdefault(value, Bitmap()).add(document_id)
+
+    def _publish(self, stale):
+        token = uuid.uuid4().hex
+        self.cache.set(GENERATION_KEY, token, None)
+        if not stale:
+            # This process applied the change itself and was up to date
+            self._generation = token
+
+    def _is_outdated(self):
+        return self.cache.get(GENERATION_KEY) != self._generation
+
+    def _current(self):
+        now = time.monotonic()
+        if self._bitmaps is None or now - self._checked_at > self.config['REFRESH_INTERVAL']:
+            with self._lock:
+                self._checked_at = now
+                # Read the tokens first, so a change made during the update is seen next time
+                tokens = self.cache.get_many([GENERATION_KEY, REBUILD_KEY, LATEST_KEY])
+                generation, rebuild_token, feed_token = (
+                    tokens.get(key) for key in (GENERATION_KEY, REBUILD_KEY, LATEST_KEY)
+                )
+                changed = generation != self._generation or feed_token != self._feed_token or self._catch_up
+                full = (
+                    now - self._built_at > self.config['MAX_AGE']
+                    or rebuild_token != self._rebuild_token
+                    or (changed and not change_feed.enabled)
+                )
+                if self._bitmaps is not None and not full and changed:
+                    self._catch_up = False
+                    full = not self.apply_changes()
+                if self._bitmaps is None:
+                    self._swap(*self._build())
+                elif full:
+                    self._start_rebuild()
+                self._generation, self._rebuild_token, self._feed_token = generation, rebuild_token, feed_token
+        return self._bitmaps
+
+    def _build(self):
+        """Return (last change event id, bitmaps) from a full scan"""
+        # Events from here on are applied again on top of the rebuild
+        seq = ChangeEvent.objects.aggregate(seq=Max('id'))['seq'] or 0
+        return seq, self.rebuild()
+
+    def _swap(self, seq, bitmaps):
+        with self._lock:
+            self._bitmaps, self._seq, self._built_at = bitmaps, seq, time.monotonic()
+            # Changes made to the old bitmaps during the rebuild are in the feed
+            self._catch_up = True
+            self._checked_at = 0.0
+
+    def _start_rebuild(self):
+        if not self.config['BACKGROUND_REBUILD']:
+            self._swap(*self._build())
+            return
+        if self._rebuilding is not None:
+            return
+        self._rebuilding = threading.Thread(target=self._background_rebuild, name='facet-rebuild', daemon=True)
+        self._rebuilding.start()
+
+    def _background_rebuild(self):
+        try:
+            self._swap(*self._build())
+        except Exception:
+            logger.exception('Rebuilding the facet bitmaps failed')
+        finally:
+            self._rebuilding = None
+            close_old_connections()
+
+
+# Global facet index instance
+facet_index = FacetIndex()
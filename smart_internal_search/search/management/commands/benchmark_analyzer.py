@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from documents.models import Document
+from search.analysis import Analyzer, get_analyzer
+from search.models import QueryLog
+from search.segments import FIELD_WEIGHTS, SegmentIndex
+
+
+SEARCH_TERMS = [
+    'reports', 'marketing strategy', 'the seo reports', 'campaign budgets', 'content calendar',
+    'social media growth', 'analytics report for the quarter', 'revenue',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare index size and query cost of the configured analyzer with the plain lowercase tokenizer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=5000, help='Index at most this many documents')
+        parser.add_argument('--queries', type=int, default=20, help='Most frequent logged queries to run')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs of each query')
+
+    def handle(self, *args, **options):
+        documents = list(
+            Document.objects.order_by('-uploaded_at').values_list(
+                'id', *FIELD_WEIGHTS
+            )[:options['documents']]
+        )
+        queries = list(
+            QueryLog.objects.filter(event='SEARCH').values_list('query', flat=True)
+            .annotate(count=Count('id')).order_by('-count')[:options['queries']]
+        ) or SEARCH_TERMS
+
+        analyzers = (
+            ('plain', Analyzer({'FILTERS': ['lowercase'], 'STOPWORDS': (), 'SYNONYMS': []})),
+            ('configured', get_analyzer()),
+        )
+        workdir = tempfile.mkdtemp(prefix='analyzer-bench-')
+        try:
+            results = [
+                (name, self._measure(analyzer, documents, queries, os.path.join(workdir, name), options['repeat']))
+                for name, analyzer in analyzers
+            ]
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(
+            f"{len(documents)} documents, {len(queries)} queries, filters: {' > '.join(get_analyzer().filters)}"
+        )
+        self.stdout.write(
+            f"{'analyzer':<12}{'analyze (ms)':>14}{'terms':>10}{'postings':>11}{'index (KB)':>12}"
+            f"{'query (us)':>12}{'avg hits':>10}"
+        )
+        for name, result in results:
+            self.stdout.write(
+                f"{name:<12}{result['analyze_seconds'] * 1000:>14.1f}{result['terms']:>10}"
+                f"{result['postings']:>11}{result['bytes'] / 1024:>12.1f}"
+                f"{result['query_seconds'] * 1_000_000:>12.1f}{result['hits']:>10.1f}"
+            )
+
+        plain, configured = results[0][1], results[1][1]
+        if plain['postings'] and plain['bytes']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Postings: {configured['postings'] / plain['postings']:.0%} of plain, "
+                f"index size: {configured['bytes'] / plain['bytes']:.0%}, "
+                f"average hits: {configured['hits']:.1f} vs {plain['hits']:.1f}"
+            ))
+
+    def _measure(self, analyzer, documents, queries, directory, repeat):
+        started = time.perf_counter()
+        entries = []
+        for document_id, *fields in documents:
+            terms = {}
+            for weight, text in zip(FIELD_WEIGHTS.values(), fields):
+                for term in analyzer.analyze(text):
+                    terms[term] = terms.get(term, 0) + weight
+            entries.append((document_id, terms, {'uploaded_at': 0}))
+        analyze_seconds = time.perf_counter() - started
+
+        index = SegmentIndex(directory)
+        index.rebuild(entries)
+
+        hits = 0
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query in queries:
+                hits += len(index.search(analyzer.analyze(query), require_all=True))
+        runs = repeat * len(queries)
+
+        return {
+            'analyze_seconds': analyze_seconds,
+            'terms': len({term for _, terms, _ in entries for term in terms}),
+            'postings': sum(len(terms) for _, terms, _ in entries),
+            'bytes': sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)),
+            'query_seconds': (time.perf_counter() - started) / max(runs, 1),
+            'hits': hits / max(runs, 1),
+        }
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from search.caching import search_cache
+
+
+class Command(BaseCommand):
+    help = 'Cache results and suggestions for the most frequent logged search queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Number of top queries to warm')
+        parser.add_argument('--days', type=int, help='Look back this many days in the query log')
+        parser.add_argument(
+            '--background',
+            action='store_true',
+            help='Run pre-warming as a background task',
+        )
+
+    def handle(self, *args, **options):
+        if options['background']:
+            from search.tasks import prewarm_search_cache_task
+            task = prewarm_search_cache_task.delay(limit=options['limit'], days=options['days'])
+            self.stdout.write(
+                self.style.SUCCESS(f'Started background pre-warming task: {task.id}')
+            )
+        else:
+            warmed = search_cache.prewarm(limit=options['limit'], days=options['days'])
+            self.stdout.write(
+                self.style.SUCCESS(f'Pre-warmed {warmed} searches')
+            )
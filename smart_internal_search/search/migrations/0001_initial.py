@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('documents', '0003_document_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('SEARCH', 'Search'), ('CLICK', 'Result Click')], default='SEARCH', max_length=10)),
+                ('search_id', models.UUIDField(db_index=True, default=uuid.uuid4)),
+                ('query', models.CharField(db_index=True, max_length=255)),
+                ('filters', models.JSONField(blank=True, default=dict)),
+                ('latency_ms', models.FloatField(default=0)),
+                ('result_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('clicked_document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='query_clicks', to='documents.document')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['event', 'created_at'], name='search_quer_event_d7f0a6_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,33 @@
+import uuid
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class QueryLog(models.Model):
+    """Append-only record of a served search or a click on one of its results"""
+
+    EVENT_CHOICES = [
+        ('SEARCH', 'Search'),
+        ('CLICK', 'Result Click'),
+    ]
+
+    event = models.CharField(max_length=10, choices=EVENT_CHOICES, default='SEARCH')
+    # Shared by a search and the clicks on its results
+    search_id = models.UUIDField(default=uuid.uuid4, db_index=True)
+    query = models.CharField(max_length=255, db_index=True)
+    filters = models.JSONField(default=dict, blank=True)
+    latency_ms = models.FloatField(default=0)
+    result_count = models.PositiveIntegerField(default=0)
+    clicked_document = models.ForeignKey(
+        'documents.Document', on_delete=models.SET_NULL, related_name='query_clicks', null=True, blank=True
+    )
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['event', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.event}: {self.query}'
@@ -0,0 +1,173 @@
+"""
+Low-overhead query logging.
+
+Views call ``query_logger.record(...)``, which only appends a row to an
+in-memory queue. A background thread writes queued rows with bulk_create
+every FLUSH_INTERVAL seconds or BATCH_SIZE rows, so logging never adds a
+database write to the request. If the queue is full (the database is
+stalled), new rows are dropped instead of blocking requests.
+"""
+import atexit
+import logging
+import queue
+import re
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Avg, Count, Max
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_QUERY_LOG_CONFIG = {
+    'ENABLED': True,
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 2.0,
+    'MAX_QUEUE': 10000,
+}
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so equivalent queries group together"""
+    return WHITESPACE_RE.sub(' ', (query or '').strip().lower())[:255]
+
+
+class QueryLogger:
+    """Queues QueryLog rows and writes them from a background thread"""
+
+    def __init__(self, config=None):
+        self.config = {
+            **DEFAULT_QUERY_LOG_CONFIG,
+            **getattr(settings, 'SEARCH_CONFIG', {}).get('QUERY_LOG', {}),
+            **(config or {}),
+        }
+        self._queue = queue.Queue(maxsize=self.config['MAX_QUEUE'])
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.dropped = 0
+
+    def record(self, query, filters=None, latency_ms=0.0, result_count=0, search_id=None,
+               event='SEARCH', clicked_document_id=None):
+        if not self.config['ENABLED']:
+            return
+        row = {
+            'event': event,
+            'query': normalize_query(query),
+            'filters': filters or {},
+            'latency_ms': round(latency_ms, 3),
+            'result_count': result_count,
+            'clicked_document_id': clicked_document_id,
+            'created_at': timezone.now(),
+        }
+        if search_id is not None:
+            row['search_id'] = search_id
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._start()
+
+    def record_click(self, query, document_id, search_id=None):
+        self.record(query, search_id=search_id, event='CLICK', clicked_document_id=document_id)
+
+    def flush(self):
+        """Write every queued row; returns how many were written"""
+        from .models import QueryLog
+
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if rows:
+            QueryLog.objects.bulk_create([QueryLog(**row) for row in rows], batch_size=self.config['BATCH_SIZE'])
+        return len(rows)
+
+    def _start(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='query-log-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            rows = [self._queue.get()]
+            deadline = time.monotonic() + self.config['FLUSH_INTERVAL']
+            while len(rows) < self.config['BATCH_SIZE']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(rows)
+
+    def _write(self, rows):
+        from .models import QueryLog
+
+        close_old_connections()
+        try:
+            QueryLog.objects.bulk_create([QueryLog(**row) for row in rows])
+        except Exception:
+            logger.exception('Writing %d query log rows failed', len(rows))
+        finally:
+            close_old_connections()
+
+
+def query_analytics(days=7, limit=20):
+    """Top, zero-result and slowest queries over the last ``days`` days"""
+    from .models import QueryLog
+
+    since = timezone.now() - timedelta(days=days)
+    searches = QueryLog.objects.filter(event='SEARCH', created_at__gte=since)
+    clicks = dict(
+        QueryLog.objects.filter(event='CLICK', created_at__gte=since)
+        .values('query').annotate(count=Count('id')).order_by().values_list('query', 'count')
+    )
+
+    top_queries = list(
+        searches.values('query')
+        .annotate(count=Count('id'), avg_results=Avg('result_count'), avg_latency_ms=Avg('latency_ms'))
+        .order_by('-count', 'query')[:limit]
+    )
+    for row in top_queries:
+        row['clicks'] = clicks.get(row['query'], 0)
+        row['click_through_rate'] = round(row['clicks'] / row['count'], 3)
+
+    zero_result_queries = list(
+        searches.filter(result_count=0).values('query')
+        .annotate(count=Count('id'), last_seen=Max('created_at'))
+        .order_by('-count', 'query')[:limit]
+    )
+    slowest_queries = list(
+        searches.values('query')
+        .annotate(count=Count('id'), avg_latency_ms=Avg('latency_ms'), max_latency_ms=Max('latency_ms'))
+        .order_by('-avg_latency_ms', 'query')[:limit]
+    )
+
+    total = searches.count()
+    zero_results = searches.filter(result_count=0).count()
+    return {
+        'days': days,
+        'total_searches': total,
+        'total_clicks': sum(clicks.values()),
+        'zero_result_rate': round(zero_results / total, 3) if total else 0.0,
+        'top_queries': top_queries,
+        'zero_result_queries': zero_result_queries,
+        'slowest_queries': slowest_queries,
+    }
+
+
+# Global query logger instance
+query_logger = QueryLogger()
+
+atexit.register(query_logger.flush)
@@ -0,0 +1,106 @@
+"""
+"More like this": documents related to a given document.
+
+The document's term vector gives each term a weighted frequency. Only
+backends with an index support this (``supports_related``): the segment
+index stores term vectors, and PostgreSQL reads the stored tsvector and
+counts matches through its GIN index. On other backends every step would
+scan the documents table, so the endpoint answers 501. Candidate terms are
+the CANDIDATE_TERMS most frequent ones. Each is scored tf * idf using the
+backend's document frequencies. Terms found only in this document, or in
+more than MAX_DOC_RATIO of all documents, say nothing about similarity and
+are dropped. The best MAX_TERMS terms then go to the backend as one
+weighted OR query, and only the final page is read from the database.
+
+Payloads are cached per document in the shared 'search' cache. Keys
+include the facet index generation token (see search/caching.py) and the
+document's updated_at. An edit of the document, or any change to the
+corpus, therefore retires the entry.
+"""
+import math
+from django.conf import settings
+from django.core.cache import caches
+from documents.fast_serializers import serialize_documents
+from documents.models import Document
+from .backends import get_search_backend
+from .facets import GENERATION_KEY, facet_index
+
+
+DEFAULT_RELATED_CONFIG = {
+    'ENABLED': True,
+    'MAX_TERMS': 12,
+    'CANDIDATE_TERMS': 40,
+    'MAX_DOC_RATIO': 0.5,
+    'LIMIT': 10,
+    'MAX_LIMIT': 50,
+    'TTL': 3600,
+    'CACHE_ALIAS': 'search',
+}
+
+
+class RelatedDocuments:
+    """Finds and caches documents similar to a document"""
+
+    def __init__(self, config=None):
+        self.config = {
+            **DEFAULT_RELATED_CONFIG,
+            **getattr(settings, 'SEARCH_CONFIG', {}).get('RELATED', {}),
+            **(config or {}),
+        }
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    def distinctive_terms(self, document):
+        """The document's most distinctive terms as [(term, weight)], best first"""
+        backend = get_search_backend()
+        vector = backend.term_vector(document)
+        candidates = sorted(vector.items(), key=lambda item: (-item[1], item[0]))[:self.config['CANDIDATE_TERMS']]
+        if not candidates:
+            return []
+
+        total, doc_freqs = backend.doc_freqs([term for term, _ in candidates])
+        scored = []
+        for term, frequency in candidates:
+            doc_freq = doc_freqs.get(term, 0)
+            if doc_freq <= 1 or doc_freq > total * self.config['MAX_DOC_RATIO']:
+                continue
+            scored.append((term, (1 + math.log(frequency)) * math.log(total / doc_freq)))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return [(term, round(weight, 4)) for term, weight in scored[:self.config['MAX_TERMS']]]
+
+    def payload(self, document, limit):
+        """The body of a related-documents response"""
+        terms = self.distinctive_terms(document)
+        ids = get_search_backend().similar_ids(dict(terms), limit, exclude=document.id) if terms else []
+        rows = {row['id']: row for row in serialize_documents(Document.objects.filter(pk__in=ids))}
+        results = [rows[document_id] for document_id in ids if document_id in rows]
+        return {
+            'document': document.id,
+            'terms': [term for term, _ in terms],
+            'count': len(results),
+            'results': results,
+        }
+
+    def related(self, document, limit=None):
+        """Return (payload, cache hit) for up to ``limit`` documents related to ``document``"""
+        limit = min(limit or self.config['LIMIT'], self.config['MAX_LIMIT'])
+        if not self.config['ENABLED']:
+            return self.payload(document, limit), False
+        key = self._key(document, limit)
+        payload = self.cache.get(key)
+        if payload is not None:
+            return payload, True
+        payload = self.payload(document, limit)
+        self.cache.set(key, payload, self.config['TTL'])
+        return payload, False
+
+    def _key(self, document, limit):
+        generation = facet_index.cache.get(GENERATION_KEY)
+        updated_at = int(document.updated_at.timestamp() * 1_000_000) if document.updated_at else 0
+        return f'search:related:{generation or 0}:{document.id}:{updated_at}:{limit}'
+
+
+# Global related documents instance
+related_documents = RelatedDocuments()
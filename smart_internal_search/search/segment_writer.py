@@ -0,0 +1,226 @@
+"""
+LSM-style writer for the segment index.
+
+Indexed documents go into an in-memory buffer (the "memtable") that
+searches in this process see immediately. The buffer is flushed as a small
+immutable segment once it holds MAX_BUFFERED_DOCS documents, or
+FLUSH_INTERVAL seconds after the first unflushed change, so a bulk load
+writes one segment per batch instead of one per document. Other processes
+see buffered documents after the flush.
+
+After each flush a background thread asks the TieredMergePolicy for merges:
+segments are grouped into size tiers and a tier holding SEGMENTS_PER_TIER
+segments is merged into one segment of the next tier, which keeps the
+segment count (and so query latency) logarithmic in the index size.
+Segments with more than DELETES_PCT_ALLOWED percent tombstones are
+rewritten on their own to purge deleted documents. Only one process merges
+at a time.
+"""
+import atexit
+import logging
+import math
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows development machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+MERGE_LOCK_NAME = 'merge.lock'
+
+DEFAULT_WRITER_CONFIG = {
+    'MAX_BUFFERED_DOCS': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'MERGE_IN_BACKGROUND': True,
+    'SEGMENTS_PER_TIER': 10,
+    'MAX_MERGE_AT_ONCE': 10,
+    'FLOOR_SEGMENT_DOCS': 1000,
+    'DELETES_PCT_ALLOWED': 20,
+}
+
+
+class TieredMergePolicy:
+    """Chooses which segments to merge from (name, doc count, deleted count) stats"""
+
+    def __init__(self, config):
+        self.segments_per_tier = max(2, config['SEGMENTS_PER_TIER'])
+        self.max_merge_at_once = max(2, config['MAX_MERGE_AT_ONCE'])
+        self.floor_segment_docs = max(1, config['FLOOR_SEGMENT_DOCS'])
+        self.deletes_pct_allowed = config['DELETES_PCT_ALLOWED']
+
+    def tier(self, live_docs):
+        """Tier 0 holds segments up to the floor size; each tier above is SEGMENTS_PER_TIER times larger"""
+        if live_docs <= self.floor_segment_docs:
+            return 0
+        return int(math.log(live_docs / self.floor_segment_docs, self.segments_per_tier)) + 1
+
+    def find_merges(self, stats):
+        """Return lists of segment names, each to be merged into one segment"""
+        tiers = {}
+        for name, doc_count, deleted in stats:
+            tiers.setdefault(self.tier(doc_count - deleted), []).append((doc_count - deleted, name))
+
+        merges = []
+        merging = set()
+        for tier in sorted(tiers):
+            segments = sorted(tiers[tier])
+            while len(segments) >= self.segments_per_tier:
+                batch = [name for _, name in segments[:self.max_merge_at_once]]
+                segments = segments[self.max_merge_at_once:]
+                merges.append(batch)
+                merging.update(batch)
+
+        for name, doc_count, deleted in stats:
+            if name in merging or not doc_count:
+                continue
+            if deleted * 100 / doc_count > self.deletes_pct_allowed:
+                merges.append([name])
+        return merges
+
+
+class IndexWriter:
+    """Buffers index changes in memory and flushes them as new segments"""
+
+    def __init__(self, index, config=None):
+        self.index = index
+        self.config = {**DEFAULT_WRITER_CONFIG, **(config or {})}
+        self.merge_policy = TieredMergePolicy(self.config)
+        self._buffer = {}
+        self._deleted = set()
+        self._lock = threading.RLock()
+        self._flush_timer = None
+        self._merge_requested = False
+        self._merge_thread = None
+        self._merge_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    # Buffering
+
+    def add_document(self, entry):
+        """Buffer a (document_id, {term: tf}, {column: int}) entry"""
+        with self._lock:
+            self._buffer[entry[0]] = entry
+            self._deleted.discard(entry[0])
+            if len(self._buffer) >= self.config['MAX_BUFFERED_DOCS']:
+                self.flush()
+            else:
+                self._schedule_flush()
+
+    def delete_document(self, document_id):
+        with self._lock:
+            self._buffer.pop(document_id, None)
+            self._deleted.add(document_id)
+            self._schedule_flush()
+
+    def search(self, terms, require_all=True):
+        """Search the segments and the unflushed buffer together"""
+        with self._lock:
+            buffered = list(self._buffer.values())
+            hidden = frozenset(self._buffer) | frozenset(self._deleted)
+        return self.index.search(terms, require_all, buffered=buffered, hidden=hidden)
+
+    def term_vector(self, document_id):
+        """Term vector of a document from the buffer or the segments"""
+        with self._lock:
+            if document_id in self._buffer:
+                return self._buffer[document_id][1]
+            if document_id in self._deleted:
+                return None
+        return self.index.term_vector(document_id)
+
+    def similar(self, weights, limit, exclude=None):
+        """Rank the segments and the unflushed buffer together by ``weights``"""
+        with self._lock:
+            buffered = list(self._buffer.values())
+            hidden = frozenset(self._buffer) | frozenset(self._deleted)
+        return self.index.similar(weights, limit, exclude, buffered=buffered, hidden=hidden)
+
+    @property
+    def buffered_count(self):
+        return len(self._buffer)
+
+    def flush(self):
+        """Write buffered changes as one segment and one manifest commit"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._buffer and not self._deleted:
+                return
+            # The lock is held through the write so searches in this process
+            # never miss documents that are between the buffer and a segment
+            self.index.add_documents(self._buffer.values(), self._deleted)
+            self._buffer = {}
+            self._deleted = set()
+        self.request_merge()
+
+    def discard_buffer(self):
+        """Drop unflushed changes, e.g. before a full rebuild"""
+        with self._lock:
+            self._buffer = {}
+            self._deleted = set()
+
+    def _schedule_flush(self):
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.config['FLUSH_INTERVAL'], self._timed_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing the search index buffer failed')
+
+    # Merging
+
+    def request_merge(self):
+        if not self.config['MERGE_IN_BACKGROUND']:
+            self.maybe_merge()
+            return
+        with self._merge_lock:
+            self._merge_requested = True
+            if self._merge_thread is None:
+                self._merge_thread = threading.Thread(
+                    target=self._merge_loop, name='search-index-merge', daemon=True
+                )
+                self._merge_thread.start()
+
+    def maybe_merge(self):
+        """Run merges chosen by the policy until none remain; returns the number run"""
+        os.makedirs(self.index.directory, exist_ok=True)
+        with open(os.path.join(self.index.directory, MERGE_LOCK_NAME), 'a') as lock_file:
+            if fcntl:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another process is merging and will pick up our segments
+                    return 0
+            try:
+                merged = 0
+                while True:
+                    merges = self.merge_policy.find_merges(self.index.segment_stats())
+                    if not merges:
+                        return merged
+                    for names in merges:
+                        self.index.merge(names)
+                        merged += 1
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _merge_loop(self):
+        while True:
+            with self._merge_lock:
+                if not self._merge_requested:
+                    self._merge_thread = None
+                    return
+                self._merge_requested = False
+            try:
+                self.maybe_merge()
+            except Exception:
+                logger.exception('Merging search index segments failed')
@@ -0,0 +1,649 @@
+"""
+On-disk, memory-mapped search index segments stored in SEARCH_INDEX_DIR.
+
+A segment is an immutable file with the layout::
+
+    magic (8 bytes) | meta length (uint32) | meta JSON | sections...
+
+and these 8-byte aligned sections, whose offsets are recorded in the meta:
+
+* ``doc_ids``: document ids as int64, sorted ascending; a document's
+  position in this array is its ordinal inside the segment.
+* ``columns``: one int64 doc-values column per sort field, by ordinal.
+* ``term_offsets``/``term_blob``: the sorted term dictionary. Terms are
+  UTF-8 bytes concatenated in ``term_blob``; ``term_offsets`` holds
+  term_count + 1 uint64 start offsets, so lookups binary-search in place.
+* ``term_meta``: per term (postings offset uint64, doc freq uint32,
+  postings length uint32).
+* ``postings``: per term, (ordinal delta, term frequency) pairs as varints.
+* ``vector_offsets``/``vectors``: the stored term vector of each document,
+  as (term index delta, term frequency) varint pairs; ``vector_offsets``
+  holds doc_count + 1 uint64 start offsets into ``vectors``. Version 1
+  segments have no term vectors.
+
+``segments.json`` lists the live segments and the document ids deleted
+from each (tombstones), plus the signature of the analyzer that produced
+the terms (see search/analysis.py). It is replaced atomically, so readers in any process
+see either the old or the new set of segments. Readers mmap segment files
+read-only, which lets every web and Celery process share a single copy in
+the page cache.
+"""
+import bisect
+import heapq
+import json
+import os
+import struct
+import threading
+import uuid
+from contextlib import contextmanager
+from mmap import mmap, ACCESS_READ
+from .analysis import get_analyzer
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows development machines
+    fcntl = None
+
+
+MAGIC = b'SISEG\x00\x00\x01'
+MANIFEST_NAME = 'segments.json'
+LOCK_NAME = 'write.lock'
+TERM_META = struct.Struct('<QII')
+INT64 = struct.Struct('<q')
+UINT64 = struct.Struct('<Q')
+
+# Field weights folded into the stored term frequency
+FIELD_WEIGHTS = {
+    'title': 4,
+    'content_text': 3,
+    'description': 2,
+    'original_filename': 1,
+}
+SORT_COLUMNS = ('uploaded_at',)
+
+
+def tokenize(text):
+    """Index terms of ``text``; the same analyzer handles documents and queries"""
+    return get_analyzer().analyze(text)
+
+
+def document_terms(document):
+    """Weighted term frequencies for a Document"""
+    terms = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(getattr(document, field, '')):
+            terms[token] = terms.get(token, 0) + weight
+    return terms
+
+
+def document_columns(document):
+    """Doc-values for the sort columns (datetimes as epoch microseconds)"""
+    uploaded_at = document.uploaded_at
+    return {'uploaded_at': int(uploaded_at.timestamp() * 1_000_000) if uploaded_at else 0}
+
+
+def encode_varint(value, out):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_postings(buffer):
+    """Decode (ordinal, term frequency) pairs from a postings byte string"""
+    postings = []
+    ordinal = 0
+    numbers = []
+    value = shift = 0
+    for byte in buffer:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        numbers.append(value)
+        value = shift = 0
+        if len(numbers) == 2:
+            ordinal += numbers[0]
+            postings.append((ordinal, numbers[1]))
+            numbers = []
+    return postings
+
+
+def _pad(out):
+    out.extend(b'\x00' * (-len(out) % 8))
+
+
+def write_segment(path, documents):
+    """
+    Write an immutable segment file.
+
+    ``documents`` is an iterable of (document_id, {term: tf}, {column: int}).
+    The file is written under a temporary name and renamed into place.
+    """
+    documents = sorted(documents, key=lambda document: document[0])
+    postings = {}
+    for ordinal, (_, terms, _) in enumerate(documents):
+        for term, frequency in terms.items():
+            postings.setdefault(term.encode('utf-8'), []).append((ordinal, frequency))
+    terms = sorted(postings)
+    term_numbers = {term: index for index, term in enumerate(terms)}
+
+    body = bytearray()
+    sections = {}
+
+    sections['doc_ids'] = len(body)
+    for document_id, _, _ in documents:
+        body += INT64.pack(document_id)
+
+    sections['columns'] = {}
+    for column in SORT_COLUMNS:
+        sections['columns'][column] = len(body)
+        for _, _, columns in documents:
+            body += INT64.pack(columns.get(column, 0))
+
+    blob = bytearray()
+    sections['term_offsets'] = len(body)
+    for term in terms:
+        body += UINT64.pack(len(blob))
+        blob += term
+    body += UINT64.pack(len(blob))
+
+    sections['term_blob'] = len(body)
+    body += blob
+    _pad(body)
+
+    encoded = bytearray()
+    term_meta = bytearray()
+    for term in terms:
+        start = len(encoded)
+        previous = 0
+        for ordinal, frequency in postings[term]:
+            encode_varint(ordinal - previous, encoded)
+            encode_varint(frequency, encoded)
+            previous = ordinal
+        term_meta += TERM_META.pack(start, len(postings[term]), len(encoded) - start)
+
+    sections['term_meta'] = len(body)
+    body += term_meta
+    sections['postings'] = len(body)
+    body += encoded
+    _pad(body)
+
+    vectors = bytearray()
+    vector_offsets = bytearray()
+    for _, document_terms, _ in documents:
+        vector_offsets += UINT64.pack(len(vectors))
+        previous = 0
+        for index, frequency in sorted(
+            (term_numbers[term.encode('utf-8')], frequency) for term, frequency in document_terms.items()
+        ):
+            encode_varint(index - previous, vectors)
+            encode_varint(frequency, vectors)
+            previous = index
+    vector_offsets += UINT64.pack(len(vectors))
+
+    sections['vector_offsets'] = len(body)
+    body += vector_offsets
+    sections['vectors'] = len(body)
+    body += vectors
+
+    meta = json.dumps({
+        'version': 2,
+        'doc_count': len(documents),
+        'term_count': len(terms),
+        'sections': sections,
+    }).encode('utf-8')
+    header = bytearray(MAGIC + struct.pack('<I', len(meta)) + meta)
+    _pad(header)
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(header)
+        file.write(body)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    return len(documents)
+
+
+class SegmentReader:
+    """Read-only, memory-mapped view of one segment file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as file:
+            self._mm = mmap(file.fileno(), 0, access=ACCESS_READ)
+
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a search index segment')
+        meta_length = struct.unpack_from('<I', self._mm, len(MAGIC))[0]
+        meta_start = len(MAGIC) + 4
+        meta = json.loads(self._mm[meta_start:meta_start + meta_length])
+        base = meta_start + meta_length
+        base += -base % 8
+
+        self.doc_count = meta['doc_count']
+        self.term_count = meta['term_count']
+        sections = meta['sections']
+        self._doc_ids = base + sections['doc_ids']
+        self._columns = {name: base + offset for name, offset in sections['columns'].items()}
+        self._term_offsets = base + sections['term_offsets']
+        self._term_blob = base + sections['term_blob']
+        self._term_meta = base + sections['term_meta']
+        self._postings = base + sections['postings']
+        if 'vectors' in sections:
+            self._vector_offsets = base + sections['vector_offsets']
+            self._vectors = base + sections['vectors']
+        else:
+            self._vector_offsets = self._vectors = None
+
+    def doc_id(self, ordinal):
+        return INT64.unpack_from(self._mm, self._doc_ids + 8 * ordinal)[0]
+
+    def doc_value(self, column, ordinal):
+        return INT64.unpack_from(self._mm, self._columns[column] + 8 * ordinal)[0]
+
+    def ordinal(self, document_id):
+        """Ordinal of a document id in this segment, or None"""
+        low, high = 0, self.doc_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.doc_id(middle) < document_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.doc_count and self.doc_id(low) == document_id:
+            return low
+        return None
+
+    def term(self, index):
+        start = UINT64.unpack_from(self._mm, self._term_offsets + 8 * index)[0]
+        end = UINT64.unpack_from(self._mm, self._term_offsets + 8 * (index + 1))[0]
+        return self._mm[self._term_blob + start:self._term_blob + end]
+
+    def _term_index(self, term):
+        encoded = term.encode('utf-8')
+        index = bisect.bisect_left(_TermView(self), encoded)
+        if index < self.term_count and self.term(index) == encoded:
+            return index
+        return None
+
+    def doc_freq(self, term):
+        index = self._term_index(term)
+        if index is None:
+            return 0
+        return TERM_META.unpack_from(self._mm, self._term_meta + TERM_META.size * index)[1]
+
+    def postings(self, term):
+        """List of (ordinal, term frequency) for a term"""
+        index = self._term_index(term)
+        if index is None:
+            return []
+        return self._postings_at(index)
+
+    def _postings_at(self, index):
+        offset, _, length = TERM_META.unpack_from(self._mm, self._term_meta + TERM_META.size * index)
+        start = self._postings + offset
+        return decode_postings(self._mm[start:start + length])
+
+    def terms(self):
+        for index in range(self.term_count):
+            yield self.term(index).decode('utf-8')
+
+    @property
+    def has_vectors(self):
+        return self._vectors is not None
+
+    def term_vector(self, ordinal):
+        """Stored {term: tf} of the document at ``ordinal``, or None for version 1 segments"""
+        if self._vectors is None:
+            return None
+        start, end = struct.unpack_from('<QQ', self._mm, self._vector_offsets + 8 * ordinal)
+        vector = {}
+        # Same varint pair encoding as the postings, with term indexes for ordinals
+        for index, frequency in decode_postings(self._mm[self._vectors + start:self._vectors + end]):
+            vector[self.term(index).decode('utf-8')] = frequency
+        return vector
+
+    def documents(self, skip=frozenset()):
+        """
+        Rebuild (document_id, {term: tf}, {column: value}) entries, used when
+        merging segments. Version 1 segments are read by inverting the postings.
+        """
+        if self.has_vectors:
+            term_maps = (self.term_vector(ordinal) for ordinal in range(self.doc_count))
+        else:
+            term_maps = [{} for _ in range(self.doc_count)]
+            for index in range(self.term_count):
+                term = self.term(index).decode('utf-8')
+                for ordinal, frequency in self._postings_at(index):
+                    term_maps[ordinal][term] = frequency
+        for ordinal, terms in enumerate(term_maps):
+            document_id = self.doc_id(ordinal)
+            if document_id not in skip:
+                columns = {column: self.doc_value(column, ordinal) for column in self._columns}
+                yield document_id, terms, columns
+
+    @property
+    def size(self):
+        return len(self._mm)
+
+
+class _TermView:
+    """Sequence adapter so bisect can search the term dictionary in place"""
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def __len__(self):
+        return self.segment.term_count
+
+    def __getitem__(self, index):
+        return self.segment.term(index)
+
+
+class SegmentIndex:
+    """
+    The set of live segments in an index directory.
+
+    Writers serialize on an advisory file lock, write new segments, and then
+    atomically replace the manifest. Readers reload the manifest when its
+    modification time changes and reuse the mmaps of unchanged segments.
+    """
+
+    def __init__(self, directory, analyzer=None):
+        self.directory = str(directory)
+        # Signature recorded when the index is built from scratch
+        self.analyzer = analyzer
+        self._lock = threading.RLock()
+        self._manifest_mtime = None
+        self._manifest = {'generation': 0, 'segments': []}
+        self._readers = {}
+        self._deleted = {}
+
+    # Reading
+
+    def snapshot(self):
+        """Current list of (SegmentReader, deleted document ids)"""
+        self._refresh()
+        with self._lock:
+            return [(self._readers[name], self._deleted[name]) for name in self._segment_names()]
+
+    @property
+    def generation(self):
+        self._refresh()
+        return self._manifest['generation']
+
+    @property
+    def built_with(self):
+        """Analyzer signature of the indexed terms, or None if unknown"""
+        self._refresh()
+        return self._manifest.get('analyzer')
+
+    def search(self, terms, require_all=True, buffered=(), hidden=frozenset()):
+        """
+        Return matching document ids ordered by the uploaded_at doc-values
+        column, newest first.
+
+        ``buffered`` are unflushed (document_id, {term: tf}, {column: int})
+        entries searched alongside the segments; indexed documents whose id
+        is in ``hidden`` are skipped because a buffered change shadows them.
+        """
+        terms = list(dict.fromkeys(terms))
+        if not terms:
+            return []
+
+        matches = []
+        for document_id, entry_terms, columns in buffered:
+            found = [term in entry_terms for term in terms]
+            if all(found) if require_all else any(found):
+                matches.append((columns['uploaded_at'], document_id))
+
+        for segment, deleted in self.snapshot():
+            ordinals = None
+            for term in terms:
+                term_ordinals = {ordinal for ordinal, _ in segment.postings(term)}
+                if ordinals is None:
+                    ordinals = term_ordinals
+                elif require_all:
+                    ordinals &= term_ordinals
+                else:
+                    ordinals |= term_ordinals
+                if require_all and not ordinals:
+                    break
+            for ordinal in ordinals or ():
+                document_id = segment.doc_id(ordinal)
+                if document_id not in deleted and document_id not in hidden:
+                    matches.append((segment.doc_value('uploaded_at', ordinal), document_id))
+
+        matches.sort(reverse=True)
+        return [document_id for _, document_id in matches]
+
+    def term_vector(self, document_id):
+        """
+        Stored {term: tf} of a live document, or None when it is not indexed
+        or sits in a version 1 segment.
+        """
+        # Newer segments hold the current version of a re-indexed document
+        for segment, deleted in reversed(self.snapshot()):
+            if document_id in deleted:
+                continue
+            ordinal = segment.ordinal(document_id)
+            if ordinal is not None:
+                return segment.term_vector(ordinal)
+        return None
+
+    def doc_freqs(self, terms):
+        """
+        (document count, {term: document frequency}). Like the segment sizes,
+        the counts include tombstoned documents until their segment is merged.
+        """
+        snapshot = self.snapshot()
+        total = sum(segment.doc_count for segment, _ in snapshot)
+        return total, {term: sum(segment.doc_freq(term) for segment, _ in snapshot) for term in terms}
+
+    def similar(self, weights, limit, exclude=None, buffered=(), hidden=frozenset()):
+        """
+        Ids of the ``limit`` documents with the highest sum of term weight
+        times saturated term frequency, tf / (tf + 1), over ``weights``.
+
+        ``buffered`` and ``hidden`` work as in ``search``.
+        """
+        scores = {}
+        for document_id, entry_terms, _ in buffered:
+            for term, weight in weights.items():
+                frequency = entry_terms.get(term)
+                if frequency:
+                    scores[document_id] = scores.get(document_id, 0.0) + weight * frequency / (frequency + 1)
+
+        for segment, deleted in self.snapshot():
+            for term, weight in weights.items():
+                for ordinal, frequency in segment.postings(term):
+                    document_id = segment.doc_id(ordinal)
+                    if document_id not in deleted and document_id not in hidden:
+                        scores[document_id] = scores.get(document_id, 0.0) + weight * frequency / (frequency + 1)
+
+        scores.pop(exclude, None)
+        return [document_id for document_id, _ in heapq.nlargest(limit, scores.items(), key=lambda item: item[1])]
+
+    def doc_count(self):
+        return sum(segment.doc_count - len(deleted) for segment, deleted in self.snapshot())
+
+    def _segment_names(self):
+        return [entry['name'] for entry in self._manifest['segments']]
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _refresh(self):
+        for _ in range(5):
+            try:
+                stat = os.stat(self._manifest_path())
+            except FileNotFoundError:
+                return
+            # os.replace gives every manifest a new inode
+            version = (stat.st_ino, stat.st_mtime_ns)
+            if version == self._manifest_mtime:
+                return
+            try:
+                self._load(version)
+                return
+            except FileNotFoundError:
+                # A writer replaced the manifest and removed merged segments
+                # between our stat and open; read the newer manifest.
+                continue
+
+    def _load(self, version):
+        with self._lock:
+            with open(self._manifest_path()) as file:
+                manifest = json.load(file)
+            readers = {}
+            for entry in manifest['segments']:
+                name = entry['name']
+                readers[name] = self._readers.get(name) or SegmentReader(os.path.join(self.directory, name))
+            # Replaced readers are closed by garbage collection once no
+            # in-flight search still holds them
+            self._readers = readers
+            self._deleted = {entry['name']: frozenset(entry['deleted']) for entry in manifest['segments']}
+            self._manifest = manifest
+            self._manifest_mtime = version
+
+    # Writing
+
+    @contextmanager
+    def write_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            with open(os.path.join(self.directory, LOCK_NAME), 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._manifest_mtime = None
+                    self._refresh()
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add_documents(self, documents, deleted_ids=()):
+        """
+        Write documents as a new segment and tombstone their older versions,
+        plus any ``deleted_ids``, in a single manifest commit.
+        """
+        documents = list(documents)
+        deleted_ids = list(deleted_ids)
+        if not documents and not deleted_ids:
+            return
+        with self.write_lock():
+            manifest = self._copy_manifest()
+            if not manifest['segments']:
+                manifest['analyzer'] = self.analyzer
+            changed = self._tombstone(manifest, [document[0] for document in documents] + deleted_ids)
+            if documents:
+                manifest['segments'].append({'name': self._write_new_segment(documents), 'deleted': []})
+            if documents or changed:
+                self._commit(manifest)
+
+    def delete_documents(self, document_ids):
+        with self.write_lock():
+            manifest = self._copy_manifest()
+            if self._tombstone(manifest, document_ids):
+                self._commit(manifest)
+
+    def rebuild(self, documents):
+        """Replace the whole index with a single segment"""
+        with self.write_lock():
+            old_names = self._segment_names()
+            manifest = {'generation': self._manifest['generation'], 'analyzer': self.analyzer, 'segments': []}
+            documents = list(documents)
+            if documents:
+                manifest['segments'].append({'name': self._write_new_segment(documents), 'deleted': []})
+            self._commit(manifest)
+            self._remove_files(old_names)
+
+    def segment_stats(self):
+        """(name, document count, deleted count) for every live segment"""
+        return [(segment.name, segment.doc_count, len(deleted)) for segment, deleted in self.snapshot()]
+
+    def merge(self, names):
+        """
+        Merge segments into one, dropping tombstoned documents.
+
+        The merged segment is written without holding the write lock;
+        documents deleted from the sources in the meantime are carried over
+        as tombstones when the result is committed.
+        """
+        snapshot = {segment.name: (segment, deleted) for segment, deleted in self.snapshot()}
+        if not all(name in snapshot for name in names):
+            return None
+
+        documents = []
+        for name in names:
+            segment, deleted = snapshot[name]
+            documents.extend(segment.documents(skip=deleted))
+
+        os.makedirs(self.directory, exist_ok=True)
+        merged_name = self._write_new_segment(documents) if documents else None
+
+        with self.write_lock():
+            manifest = self._copy_manifest()
+            current = {entry['name']: entry for entry in manifest['segments']}
+            if not all(name in current for name in names):
+                # Another writer rebuilt or merged these segments first
+                if merged_name:
+                    self._remove_files([merged_name])
+                return None
+
+            newly_deleted = set()
+            for name in names:
+                newly_deleted.update(set(current[name]['deleted']) - snapshot[name][1])
+
+            manifest['segments'] = [entry for entry in manifest['segments'] if entry['name'] not in names]
+            if merged_name:
+                manifest['segments'].append({'name': merged_name, 'deleted': sorted(newly_deleted)})
+            self._commit(manifest)
+            self._remove_files(names)
+        return merged_name
+
+    def _copy_manifest(self):
+        return {
+            'generation': self._manifest['generation'],
+            'analyzer': self._manifest.get('analyzer'),
+            'segments': [dict(entry, deleted=list(entry['deleted'])) for entry in self._manifest['segments']],
+        }
+
+    def _tombstone(self, manifest, document_ids):
+        changed = False
+        for entry in manifest['segments']:
+            segment = self._readers[entry['name']]
+            deleted = set(entry['deleted'])
+            for document_id in document_ids:
+                if document_id not in deleted and segment.ordinal(document_id) is not None:
+                    deleted.add(document_id)
+                    changed = True
+            entry['deleted'] = sorted(deleted)
+        return changed
+
+    def _write_new_segment(self, documents):
+        name = f'seg_{uuid.uuid4().hex}.idx'
+        write_segment(os.path.join(self.directory, name), documents)
+        return name
+
+    def _commit(self, manifest):
+        manifest['generation'] += 1
+        temp_path = self._manifest_path() + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(manifest, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self._manifest_path())
+        self._manifest_mtime = None
+        self._refresh()
+
+    def _remove_files(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,197 @@
+"""
+Team-partitioned search with parallel shard fan-out.
+
+Documents are partitioned by team; teams larger than LARGE_TEAM_THRESHOLD
+are split further into hash buckets on the document id. Shards are spread
+over the database aliases in DATABASES, e.g. read replicas of the
+documents table. A team-filtered query only touches that team's shard(s).
+When the shards involved live on two or more databases, the strategy
+queryset runs on every shard in a thread pool, and the top k of each are
+merged by the strategy's own ordering.
+
+Shards on one database are not fanned out. Concurrent queries against the
+same server only compete for its CPU and I/O. So with DATABASES unset the
+query runs once, with the team filter if there is one. Sharding is off by
+default; turn it on together with DATABASES.
+"""
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from django.db import close_old_connections
+from django.db.models import Count
+from django.db.models.functions import Mod
+from documents.models import Document
+
+
+# Up to this many candidates, a bitmap filter is sent to SQL as an IN list.
+# Larger candidate sets are sent as the facet filters that produced them
+# (see DocumentSearch.search_documents), so the database applies them with
+# its indexes instead of Python scanning every text match.
+IN_LIST_MAX = 1000
+
+
+def top_rows(queryset, fields, candidates, limit):
+    """
+    Return up to ``limit`` (pk, *fields) rows of a queryset, in its order,
+    keeping only primary keys in the ``candidates`` Bitmap (None = all).
+    """
+    if candidates is not None:
+        queryset = queryset.filter(pk__in=list(candidates))
+    return list(queryset.values_list('pk', *fields)[:limit])
+
+
+DEFAULT_SHARD_CONFIG = {
+    'ENABLED': False,
+    'DATABASES': [],
+    'LARGE_TEAM_THRESHOLD': 5000,
+    'MAX_BUCKETS_PER_TEAM': 8,
+    'WORKERS': 4,
+    'MAP_TTL': 60,
+}
+
+
+@dataclass(frozen=True)
+class Shard:
+    team_id: int
+    bucket: int = 0
+    buckets: int = 1
+    # Database alias serving this shard; None for the default read database
+    database: str = None
+
+    def apply(self, queryset):
+        """Restrict a queryset to the documents in this shard"""
+        queryset = queryset.filter(team_id=self.team_id)
+        if self.buckets > 1:
+            queryset = queryset.alias(shard_bucket=Mod('id', self.buckets)).filter(shard_bucket=self.bucket)
+        if self.database is not None:
+            queryset = queryset.using(self.database)
+        return queryset
+
+
+class ShardMap:
+    """Assigns teams to shards from their document counts, refreshed every MAP_TTL seconds"""
+
+    def __init__(self, config):
+        self.config = config
+        self._shards = {}
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def all_shards(self):
+        return [shard for shards in self._team_shards().values() for shard in shards]
+
+    def shards_for_team(self, team_id):
+        try:
+            team_id = int(team_id)
+        except (TypeError, ValueError):
+            return []
+        return self._team_shards().get(team_id, [Shard(team_id, database=self._database(team_id, 0))])
+
+    def invalidate(self):
+        self._built_at = 0.0
+
+    def _team_shards(self):
+        if time.monotonic() - self._built_at > self.config['MAP_TTL']:
+            with self._lock:
+                if time.monotonic() - self._built_at > self.config['MAP_TTL']:
+                    self._shards = self._build()
+                    self._built_at = time.monotonic()
+        return self._shards
+
+    def _build(self):
+        threshold = self.config['LARGE_TEAM_THRESHOLD']
+        shards = {}
+        counts = Document.objects.order_by().values('team_id').annotate(count=Count('id'))
+        for row in counts:
+            buckets = min(self.config['MAX_BUCKETS_PER_TEAM'], max(1, math.ceil(row['count'] / threshold)))
+            shards[row['team_id']] = [
+                Shard(row['team_id'], bucket, buckets, self._database(row['team_id'], bucket))
+                for bucket in range(buckets)
+            ]
+        return shards
+
+    def _database(self, team_id, bucket):
+        databases = self.config['DATABASES']
+        if not databases:
+            return None
+        return databases[(team_id * self.config['MAX_BUCKETS_PER_TEAM'] + bucket) % len(databases)]
+
+
+class ShardedSearch:
+    """Runs search strategies across shards and merges the per-shard top k"""
+
+    def __init__(self, config=None):
+        self.config = {**DEFAULT_SHARD_CONFIG, **(config or {})}
+        self.shard_map = ShardMap(self.config)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    def search(self, strategies, team_id, limit, candidates=None):
+        """
+        Return the first strategy queryset with hits, restricted to the merged
+        top ``limit`` documents across the relevant shards. ``candidates`` is
+        an optional Bitmap of documents allowed by the facet filters.
+        """
+        shards = self.shard_map.shards_for_team(team_id) if team_id else self.shard_map.all_shards()
+        # Fanning out only pays when the shards are on different servers
+        fan_out = len({shard.database for shard in shards}) > 1
+
+        for strategy in strategies:
+            if fan_out:
+                top_ids = self._fan_out(strategy, shards, limit, candidates)
+            else:
+                if team_id:
+                    strategy = strategy.filter(team_id=team_id)
+                if shards and shards[0].database is not None:
+                    strategy = strategy.using(shards[0].database)
+                top_ids = [row[0] for row in top_rows(strategy, [], candidates, limit)]
+            if top_ids:
+                # Re-applying the strategy to a handful of primary keys keeps
+                # its ordering without re-sorting in Python.
+                return strategy.filter(pk__in=top_ids)[:limit]
+
+        return Document.objects.none()
+
+    def _fan_out(self, strategy, shards, limit, candidates):
+        ordering = self._ordering(strategy)
+        rows = []
+        shard_results = self.executor.map(
+            lambda shard: self._shard_rows(strategy, shard, limit, ordering, candidates), shards
+        )
+        for shard_rows in shard_results:
+            rows.extend(shard_rows)
+
+        # Stable multi-key sort, least significant key first
+        for position in reversed(range(len(ordering))):
+            descending = ordering[position].startswith('-')
+            rows.sort(key=lambda row: row[position + 1], reverse=descending)
+        return [row[0] for row in rows[:limit]]
+
+    def _shard_rows(self, strategy, shard, limit, ordering, candidates):
+        close_old_connections()
+        try:
+            fields = [field.lstrip('-') for field in ordering]
+            return top_rows(shard.apply(strategy), fields, candidates, limit)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def _ordering(queryset):
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        return ordering or ['-pk']
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.config['WORKERS'], thread_name_prefix='search-shard'
+                    )
+        return self._executor
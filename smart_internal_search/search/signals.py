@@ -0,0 +1,53 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from documents.models import Document
+from documents.signals import document_signals_muted
+from .backends import get_search_backend
+from .facets import facet_index
+
+
+FACET_FIELDS = {'team', 'team_id', 'project', 'project_id', 'file_type', 'status'}
+
+
+@receiver(post_save, sender=Document)
+def update_document_facets(sender, instance, update_fields=None, **kwargs):
+    # Access-count and content-only saves do not move a document between facets
+    if document_signals_muted():
+        return
+    if update_fields is not None and not FACET_FIELDS.intersection(update_fields):
+        return
+    facet_index.update_document(instance)
+
+
+@receiver(post_save, sender=Document)
+def index_document_metadata(sender, instance, update_fields=None, **kwargs):
+    # Full saves (uploads, metadata edits) refresh the index; partial saves
+    # are either access counters or mark_processed, which the task indexes.
+    if update_fields is None and not document_signals_muted():
+        get_search_backend().index_document(instance)
+
+
+@receiver(post_delete, sender=Document)
+def remove_document_facets(sender, instance, **kwargs):
+    if document_signals_muted():
+        return
+    facet_index.remove_document(instance.id)
+    get_search_backend().remove_document(instance.id)
+
+
+@receiver(m2m_changed, sender=Document.topics.through)
+def update_topic_facets(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear') or document_signals_muted():
+        return
+    if not reverse:
+        facet_index.set_topics(instance.id, list(instance.topics.values_list('id', flat=True)))
+    elif action == 'post_clear' or not pk_set:
+        # Topic.documents.clear() does not say which documents were affected
+        facet_index.invalidate()
+    else:
+        through = Document.topics.through.objects.filter(document_id__in=pk_set)
+        topics_by_document = {document_id: [] for document_id in pk_set}
+        for document_id, topic_id in through.values_list('document_id', 'topic_id'):
+            topics_by_document[document_id].append(topic_id)
+        for document_id, topic_ids in topics_by_document.items():
+            facet_index.set_topics(document_id, topic_ids)
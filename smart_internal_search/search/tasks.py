@@ -0,0 +1,19 @@
+from celery import shared_task
+from celery.signals import worker_ready
+from .caching import search_cache
+
+
+@shared_task
+def prewarm_search_cache_task(limit=None, days=None):
+    """Background task to cache results and suggestions for the most frequent queries"""
+    try:
+        warmed = search_cache.prewarm(limit=limit, days=days)
+        return f"Pre-warmed {warmed} searches"
+    except Exception as e:
+        return f"Error pre-warming search cache: {str(e)}"
+
+
+@worker_ready.connect
+def prewarm_search_cache_on_startup(sender=None, **kwargs):
+    # Freshly deployed caches start empty; warm them once a worker is up
+    prewarm_search_cache_task.delay()
@@ -1,3 +1,687 @@
-from django.test import TestCase
+import json
+import os
+import random
+import shutil
+import struct
+import tempfile
+import threading
+from unittest import mock, skipUnless
+from django.db import connection
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase
+from rest_framework.renderers import JSONRenderer
+from documents.changes import change_feed
+from documents.dedup import near_duplicates
+from documents.models import Document, Team
+from documents.serializers import DocumentListSerializer
+from documents.tests import DocumentTestCase, make_document
+from .analysis import Analyzer
+from .backends.segment import SegmentSearchBackend
+from .backends.sqlite import SQLiteSearchBackend
+from .bitmaps import ARRAY_MAX_SIZE, Bitmap
+from .caching import SearchResultCache, search_payload
+from .facets import FACETS, FacetIndex
+from .models import QueryLog
+from .querylog import query_logger
+from .related import RelatedDocuments
+from .segment_writer import IndexWriter, TieredMergePolicy
+from .segments import MAGIC, SegmentIndex, SegmentReader, document_terms, write_segment
+from .sharding import IN_LIST_MAX, ShardedSearch, top_rows
+from .utils import DocumentSearch
 
-# Create your tests here.
+
+class AnalyzerTests(TestCase):
+    def setUp(self):
+        self.analyzer = Analyzer({'SYNONYMS': [['cv', 'résumé']]})
+
+    def test_filters_run_in_order(self):
+        self.assertEqual(self.analyzer.analyze('The Reports of Café owners'), ['report', 'cafe', 'owner'])
+
+    def test_synonyms_cover_inflected_forms(self):
+        self.assertEqual(self.analyzer.analyze('CV résumés'), ['cv', 'cv'])
+
+    def test_substring_terms_keep_words_a_stem_would_break(self):
+        self.assertEqual(self.analyzer.analyze('happy reports'), ['happi', 'report'])
+        self.assertEqual(self.analyzer.substring_terms('the happy reports'), ['happy', 'report'])
+
+    def test_signature_follows_configuration(self):
+        self.assertEqual(self.analyzer.signature, Analyzer({'SYNONYMS': [['cv', 'résumé']]}).signature)
+        self.assertNotEqual(self.analyzer.signature, Analyzer().signature)
+
+
+class RelatedDocumentsTests(DocumentTestCase):
+    def make_backend(self):
+        directory = tempfile.mkdtemp(prefix='related-test-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        return SegmentSearchBackend({'INDEX_DIR': directory, 'SEGMENT_WRITER': {'MERGE_IN_BACKGROUND': False}})
+
+    def setUp(self):
+        self.backend = self.make_backend()
+        for target in ('search.related.get_search_backend', 'search.backends.get_search_backend'):
+            patcher = mock.patch(target, return_value=self.backend)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.related = RelatedDocuments({'ENABLED': False})
+        self.survey = make_document(self.marketing, self.user, 'Happy customers survey',
+                                    content_text='happy customers praise onboarding')
+        self.interviews = make_document(self.marketing, self.user, 'Customer interviews',
+                                        content_text='interviews with happy customers about onboarding')
+        self.budget = make_document(self.seo, self.user, 'Budget', content_text='quarterly budget forecast')
+        make_document(self.seo, self.user, 'Forecast', content_text='budget forecast for next year')
+        make_document(self.seo, self.user, 'Keywords', content_text='keyword rankings')
+        self.backend.reindex(Document.objects.all())
+
+    def test_term_vectors_come_from_the_index(self):
+        vector = self.backend.term_vector(self.survey)
+        self.assertEqual(vector, document_terms(self.survey))
+        self.assertIn('happi', vector)
+
+    def test_doc_freqs(self):
+        total, freqs = self.backend.doc_freqs(['happi', 'budget', 'missing'])
+        self.assertEqual(total, 5)
+        self.assertEqual(freqs, {'happi': 2, 'budget': 2, 'missing': 0})
+
+    def test_related_documents_share_terms(self):
+        terms = [term for term, _ in self.related.distinctive_terms(self.survey)]
+        self.assertIn('happi', terms)
+        payload, _ = self.related.related(self.survey, 5)
+        ids = [row['id'] for row in payload['results']]
+        self.assertEqual(ids[0], self.interviews.id)
+        self.assertNotIn(self.survey.id, ids)
+        self.assertNotIn(self.budget.id, ids)
+
+    def test_endpoint(self):
+        response = self.client.get(f'/api/documents/documents/{self.survey.id}/related/', {'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.interviews.id])
+        response = self.client.get(f'/api/documents/documents/{self.survey.id}/related/', {'limit': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_database_backends_without_an_index_refuse(self):
+        with mock.patch('search.backends.get_search_backend', return_value=SQLiteSearchBackend()):
+            response = self.client.get(f'/api/documents/documents/{self.survey.id}/related/')
+        self.assertEqual(response.status_code, 501)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+class PostgresRelatedDocumentsTests(RelatedDocumentsTests):
+    def make_backend(self):
+        from .backends.postgres import PostgresSearchBackend
+        return PostgresSearchBackend({'TEXT_SEARCH_CONFIG': 'english'})
+
+    def test_term_vectors_come_from_the_index(self):
+        vector = self.backend.term_vector(self.survey)
+        # Title lexemes carry weight A (4), content lexemes B (3)
+        self.assertEqual(vector['survey'], 4)
+        self.assertEqual(vector['happi'], 4 + 3)
+
+    def test_doc_freqs(self):
+        # The total is the planner's estimate
+        _, freqs = self.backend.doc_freqs(['happi', 'budget', 'missing'])
+        self.assertEqual(freqs, {'happi': 2, 'budget': 2, 'missing': 0})
+
+
+class SQLiteSearchBackendTests(DocumentTestCase):
+    def setUp(self):
+        self.backend = SQLiteSearchBackend()
+        self.reporting = make_document(self.marketing, self.user, 'Reporting guide')
+        self.it = make_document(self.seo, self.user, 'IT budget', content_text='whether to be or not to be')
+
+    def ids(self, query):
+        return {document.id for document in next(self.backend.search_querysets(Document.objects.all(), query))}
+
+    def test_words_match_by_their_safe_stems(self):
+        self.assertEqual(self.ids('reports'), {self.reporting.id})
+        self.assertEqual(self.ids('the reports'), {self.reporting.id})
+
+    def test_stopword_only_queries_match_as_typed(self):
+        self.assertEqual(self.ids('IT'), {self.it.id})
+        self.assertEqual(self.ids('to be or not'), {self.it.id})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+class PostgresSearchBackendTests(DocumentTestCase):
+    def setUp(self):
+        from .backends.postgres import PostgresSearchBackend
+
+        self.backend = PostgresSearchBackend({'TEXT_SEARCH_CONFIG': 'english'})
+        self.in_title = make_document(self.marketing, self.user, 'Quarterly reports', content_text='numbers')
+        self.in_content = make_document(self.marketing, self.user, 'Notes', content_text='reporting on the budget')
+        self.other = make_document(self.seo, self.user, 'Keywords', content_text='keyword rankings')
+
+    def ids(self, queryset):
+        return list(queryset.values_list('pk', flat=True))
+
+    def test_search_vector_is_generated_on_save(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT search_vector::text FROM documents_document WHERE id = %s', [self.in_title.id])
+            self.assertIn("'report':2A", cursor.fetchone()[0])
+        self.in_title.title = 'Summary'
+        self.in_title.save()
+        self.assertEqual(self.ids(self.backend.index_search(Document.objects.all(), 'reports')), [self.in_content.id])
+
+    def test_ranked_full_text_matches(self):
+        ranked = next(self.backend.search_querysets(Document.objects.all(), 'report'))
+        # Title lexemes carry weight A, so the title match ranks first
+        self.assertEqual(self.ids(ranked), [self.in_title.id, self.in_content.id])
+        excluded = next(self.backend.search_querysets(Document.objects.all(), 'report -budget'))
+        self.assertEqual(self.ids(excluded), [self.in_title.id])
+
+    def test_partial_words_fall_back_to_substrings(self):
+        full_text, *fallback = self.backend.search_querysets(Document.objects.all(), 'keyw')
+        self.assertFalse(full_text.exists())
+        self.assertIn(self.other.id, [pk for queryset in fallback for pk in self.ids(queryset)])
+
+    def test_document_search_uses_the_backend(self):
+        with mock.patch('search.utils.get_search_backend', return_value=self.backend):
+            results = DocumentSearch().search_documents('reports', {})
+        self.assertEqual({document.id for document in results}, {self.in_title.id, self.in_content.id})
+
+
+class SegmentFormatTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='segment-test-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        # Unsorted ids, multibyte terms and varints longer than one byte
+        self.entries = [
+            (900, {'report': 2, 'café': 1}, {'uploaded_at': 30}),
+            (7, {'report': 300, 'budget': 1}, {'uploaded_at': 10}),
+            (70000, {'budget': 4}, {'uploaded_at': 20}),
+        ]
+
+    def write(self, name='segment.idx', entries=None):
+        path = os.path.join(self.directory, name)
+        write_segment(path, self.entries if entries is None else entries)
+        return SegmentReader(path)
+
+    def test_round_trip(self):
+        segment = self.write()
+        self.assertEqual(segment.doc_count, 3)
+        self.assertEqual([segment.doc_id(ordinal) for ordinal in range(3)], [7, 900, 70000])
+        self.assertEqual([segment.doc_value('uploaded_at', ordinal) for ordinal in range(3)], [10, 30, 20])
+        self.assertEqual((segment.ordinal(900), segment.ordinal(8)), (1, None))
+        self.assertEqual(list(segment.terms()), sorted(['budget', 'café', 'report'], key=str.encode))
+        self.assertEqual(segment.postings('report'), [(0, 300), (1, 2)])
+        self.assertEqual((segment.doc_freq('budget'), segment.doc_freq('missing')), (2, 0))
+        self.assertEqual(segment.term_vector(1), {'report': 2, 'café': 1})
+        self.assertEqual(sorted(segment.documents(skip={7})), sorted(entry for entry in self.entries if entry[0] != 7))
+
+    def test_empty_segment(self):
+        segment = self.write(entries=[])
+        self.assertEqual((segment.doc_count, segment.postings('report'), list(segment.documents())), (0, [], []))
+
+    def test_rejects_other_files(self):
+        path = os.path.join(self.directory, 'other.idx')
+        with open(path, 'wb') as file:
+            file.write(b'not a segment at all')
+        with self.assertRaises(ValueError):
+            SegmentReader(path)
+
+    def test_version_1_segments_are_read_from_postings(self):
+        path = os.path.join(self.directory, 'segment.idx')
+        write_segment(path, self.entries)
+        with open(path, 'rb') as file:
+            data = file.read()
+        # Rewrite the header without the term vector sections
+        length = struct.unpack_from('<I', data, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        meta = json.loads(data[start:start + length])
+        body = data[start + length + (-(start + length) % 8):]
+        body = body[:meta['sections'].pop('vector_offsets')]
+        del meta['sections']['vectors']
+        meta['version'] = 1
+        encoded = json.dumps(meta).encode('utf-8')
+        header = MAGIC + struct.pack('<I', len(encoded)) + encoded
+        with open(path, 'wb') as file:
+            file.write(header + b'\x00' * (-len(header) % 8) + body)
+
+        segment = SegmentReader(path)
+        self.assertFalse(segment.has_vectors)
+        self.assertIsNone(segment.term_vector(0))
+        self.assertEqual(segment.postings('report'), [(0, 300), (1, 2)])
+        self.assertEqual(sorted(segment.documents()), sorted(self.entries))
+
+
+class SegmentIndexTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='segment-index-test-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.index = SegmentIndex(self.directory, analyzer='sig')
+        self.index.add_documents([
+            (1, {'report': 1, 'budget': 1}, {'uploaded_at': 10}),
+            (2, {'report': 1}, {'uploaded_at': 20}),
+        ])
+        self.index.add_documents([(3, {'budget': 2}, {'uploaded_at': 30})])
+
+    def files(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.idx'))
+
+    def test_search_orders_newest_first(self):
+        self.assertEqual(self.index.search(['report']), [2, 1])
+        self.assertEqual(self.index.search(['report', 'budget']), [1])
+        self.assertEqual(self.index.search(['report', 'budget'], require_all=False), [3, 2, 1])
+        self.assertEqual(self.index.search(['missing', 'report']), [])
+        self.assertEqual(self.index.built_with, 'sig')
+
+    def test_updates_and_deletes_tombstone_older_versions(self):
+        self.index.add_documents([(1, {'summary': 1}, {'uploaded_at': 10})])
+        self.index.delete_documents([2])
+        self.assertEqual(self.index.search(['report']), [])
+        self.assertEqual(self.index.search(['summary']), [1])
+        self.assertEqual(self.index.term_vector(1), {'summary': 1})
+        self.assertIsNone(self.index.term_vector(2))
+        self.assertEqual(self.index.doc_count(), 2)
+        self.assertEqual(sorted(deleted for _, _, deleted in self.index.segment_stats()), [0, 0, 2])
+
+    def test_other_readers_see_commits(self):
+        reader = SegmentIndex(self.directory)
+        self.assertEqual(reader.search(['budget']), [3, 1])
+        generation = reader.generation
+        self.index.delete_documents([3])
+        self.assertEqual(reader.search(['budget']), [1])
+        self.assertEqual(reader.generation, generation + 1)
+
+    def test_merge_drops_tombstones_and_files(self):
+        self.index.delete_documents([2])
+        before = self.files()
+        merged = self.index.merge([name for name, _, _ in self.index.segment_stats()])
+        self.assertEqual(self.files(), [merged])
+        self.assertNotIn(merged, before)
+        self.assertEqual(self.index.segment_stats(), [(merged, 2, 0)])
+        self.assertEqual(self.index.search(['report', 'budget'], require_all=False), [3, 1])
+        self.assertEqual(self.index.term_vector(1), {'report': 1, 'budget': 1})
+
+    def test_deletes_during_a_merge_are_kept(self):
+        names = [name for name, _, _ in self.index.segment_stats()]
+        write = self.index._write_new_segment
+
+        def write_while_another_process_deletes(documents):
+            SegmentIndex(self.directory).delete_documents([1])
+            return write(documents)
+
+        with mock.patch.object(self.index, '_write_new_segment', side_effect=write_while_another_process_deletes):
+            merged = self.index.merge(names)
+        self.assertEqual(self.index.segment_stats(), [(merged, 3, 1)])
+        self.assertEqual(self.index.search(['report']), [2])
+
+    def test_rebuild_replaces_everything(self):
+        self.index.rebuild([(5, {'fresh': 1}, {'uploaded_at': 1})])
+        self.assertEqual(len(self.files()), 1)
+        self.assertEqual((self.index.search(['report']), self.index.search(['fresh'])), ([], [5]))
+
+    def test_doc_freqs_and_similar(self):
+        self.assertEqual(self.index.doc_freqs(['report', 'budget', 'x']), (3, {'report': 2, 'budget': 2, 'x': 0}))
+        self.assertEqual(self.index.similar({'budget': 1.0, 'report': 0.1}, 2, exclude=3), [1, 2])
+        buffered = [(9, {'budget': 9}, {'uploaded_at': 0})]
+        self.assertEqual(self.index.similar({'budget': 1.0}, 1, buffered=buffered), [9])
+        self.assertEqual(self.index.search(['budget'], buffered=buffered, hidden={3}), [1, 9])
+
+
+class SegmentWriterTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='segment-writer-test-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.index = SegmentIndex(self.directory)
+        self.writer = IndexWriter(self.index, {
+            'MAX_BUFFERED_DOCS': 3, 'FLUSH_INTERVAL': 3600, 'MERGE_IN_BACKGROUND': False,
+            'SEGMENTS_PER_TIER': 3, 'FLOOR_SEGMENT_DOCS': 10,
+        })
+        self.addCleanup(self.writer.discard_buffer)
+        self.addCleanup(self.writer.flush)
+
+    def entry(self, document_id, *terms):
+        return document_id, {term: 1 for term in terms}, {'uploaded_at': document_id}
+
+    def test_buffered_changes_are_searchable_before_the_flush(self):
+        self.writer.add_document(self.entry(1, 'report'))
+        self.writer.flush()
+        self.writer.add_document(self.entry(2, 'report'))
+        self.writer.add_document(self.entry(1, 'budget'))
+        self.assertEqual(self.writer.buffered_count, 2)
+        self.assertEqual(self.writer.search(['report']), [2])
+        self.assertEqual(self.writer.term_vector(1), {'budget': 1})
+        self.assertEqual(self.index.search(['report']), [1])
+
+        self.writer.delete_document(2)
+        self.assertEqual(self.writer.search(['report']), [])
+        self.assertIsNone(self.writer.term_vector(2))
+        self.writer.flush()
+        self.assertEqual((self.index.search(['report']), self.index.search(['budget'])), ([], [1]))
+
+    def test_full_buffers_flush_as_one_segment(self):
+        for document_id in range(3):
+            self.writer.add_document(self.entry(document_id, 'report'))
+        self.assertEqual(self.writer.buffered_count, 0)
+        self.assertEqual([count for _, count, _ in self.index.segment_stats()], [3])
+
+    def test_a_full_tier_is_merged(self):
+        for document_id in range(9):
+            self.writer.add_document(self.entry(document_id, 'report'))
+        # Three flushed segments of tier 0 merge into one
+        self.assertEqual([count for _, count, _ in self.index.segment_stats()], [9])
+        self.assertEqual(self.index.search(['report']), list(range(8, -1, -1)))
+
+
+class TieredMergePolicyTests(TestCase):
+    def setUp(self):
+        self.policy = TieredMergePolicy({
+            'SEGMENTS_PER_TIER': 3, 'MAX_MERGE_AT_ONCE': 3, 'FLOOR_SEGMENT_DOCS': 10, 'DELETES_PCT_ALLOWED': 20,
+        })
+
+    def test_tiers(self):
+        self.assertEqual([self.policy.tier(docs) for docs in (1, 10, 11, 30, 31, 100)], [0, 0, 1, 2, 2, 3])
+
+    def test_merges_full_tiers_smallest_first(self):
+        stats = [('a', 5, 0), ('b', 2, 0), ('c', 8, 0), ('d', 1, 0), ('e', 20, 0), ('f', 25, 0)]
+        self.assertEqual(self.policy.find_merges(stats), [['d', 'b', 'a']])
+
+    def test_segments_with_many_deletes_are_rewritten(self):
+        stats = [('a', 100, 30), ('b', 100, 10), ('c', 0, 0)]
+        self.assertEqual(self.policy.find_merges(stats), [['a']])
+
+
+class BitmapTests(TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        # A dense container (bitset), a sparse one (array) and one past 2**16
+        self.a = set(range(0, 3 * ARRAY_MAX_SIZE, 2)) | {rng.randrange(70000, 200000) for _ in range(500)}
+        self.b = set(range(0, 3 * ARRAY_MAX_SIZE, 3)) | {rng.randrange(70000, 200000) for _ in range(500)}
+
+    def test_matches_set_semantics(self):
+        a, b = Bitmap(self.a), Bitmap(self.b)
+        self.assertEqual(list(a), sorted(self.a))
+        self.assertEqual(len(a), len(self.a))
+        self.assertEqual(set(a & b), self.a & self.b)
+        self.assertEqual(set(a | b), self.a | self.b)
+        self.assertEqual(set(Bitmap.intersect_all([a, b, Bitmap(self.a)])), self.a & self.b)
+        self.assertTrue(all(value in a for value in self.a))
+        self.assertNotIn(1, a)
+        self.assertEqual(len(Bitmap.intersect_all([])), 0)
+
+    def test_add_and_discard_across_representations(self):
+        bitmap = Bitmap()
+        values = list(range(ARRAY_MAX_SIZE + 10))
+        for value in values:
+            bitmap.add(value)
+        bitmap.add(5)
+        self.assertEqual(len(bitmap), len(values))
+        for value in values[:-3]:
+            bitmap.discard(value)
+        bitmap.discard(123456)
+        self.assertEqual(list(bitmap), values[-3:])
+        for value in values[-3:]:
+            bitmap.discard(value)
+        self.assertFalse(bitmap)
+
+    def test_union_does_not_share_containers(self):
+        a = Bitmap([1, 2, 3])
+        union = a | Bitmap()
+        union.add(4)
+        self.assertNotIn(4, a)
+
+
+class FacetIndexTests(DocumentTestCase):
+    def setUp(self):
+        self.documents = [make_document(self.marketing, self.user, f'doc {n}') for n in range(3)]
+        self.documents[0].topics.add(self.topic)
+        self.index = FacetIndex({'REFRESH_INTERVAL': 0, 'MAX_AGE': 3600, 'BACKGROUND_REBUILD': False})
+        self.rebuild = mock.patch.object(self.index, 'rebuild', wraps=self.index.rebuild).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def team_ids(self, team):
+        return set(self.index.candidates({'team': team.id}) or ())
+
+    def change_elsewhere(self, document_ids, **fields):
+        """A write by another process: no in-place update here, only the feed and its token"""
+        Document.objects.filter(pk__in=document_ids).update(**fields)
+        with self.captureOnCommitCallbacks(execute=True):
+            change_feed.record('UPDATED', document_ids)
+
+    def test_candidates_and_counts(self):
+        self.assertEqual(self.team_ids(self.marketing), {document.id for document in self.documents})
+        self.assertEqual(set(self.index.candidates({'topic': self.topic.id})), {self.documents[0].id})
+        self.assertIsNone(self.index.candidates({}))
+        self.assertEqual(self.index.counts('team'), {str(self.marketing.id): 3})
+
+    def test_changes_from_other_processes_are_applied_as_deltas(self):
+        self.team_ids(self.marketing)
+        self.change_elsewhere([self.documents[1].id], team=self.seo)
+        self.assertEqual(self.team_ids(self.seo), {self.documents[1].id})
+        self.assertNotIn(self.documents[1].id, self.team_ids(self.marketing))
+        self.assertEqual(self.rebuild.call_count, 1)
+
+    def test_deleted_documents_leave_the_bitmaps(self):
+        self.team_ids(self.marketing)
+        document_id = self.documents[0].id
+        Document.objects.filter(pk=document_id).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            change_feed.record('DELETED', [document_id])
+        self.assertNotIn(document_id, self.team_ids(self.marketing))
+        self.assertEqual(set(self.index.candidates({'topic': self.topic.id})), set())
+        self.assertEqual(self.rebuild.call_count, 1)
+
+    def test_large_backlog_rebuilds(self):
+        self.index.config['MAX_DELTA'] = 1
+        self.team_ids(self.marketing)
+        self.change_elsewhere([document.id for document in self.documents], team=self.seo)
+        self.assertEqual(len(self.team_ids(self.seo)), 3)
+        self.assertEqual(self.rebuild.call_count, 2)
+
+    def test_invalidate_rebuilds(self):
+        self.team_ids(self.marketing)
+        self.index.invalidate()
+        self.team_ids(self.marketing)
+        self.assertEqual(self.rebuild.call_count, 2)
+
+    def test_expired_bitmaps_are_rebuilt_in_the_background(self):
+        self.index.config['BACKGROUND_REBUILD'] = True
+        marketing = {document.id for document in self.documents}
+        self.assertEqual(self.team_ids(self.marketing), marketing)
+
+        # The thread gets bitmaps without the DB, which it cannot see inside the test transaction
+        release = threading.Event()
+        rebuilt = {facet: {} for facet in FACETS}
+        rebuilt['team'][str(self.seo.id)] = Bitmap([self.documents[0].id])
+
+        def build():
+            release.wait(5)
+            return self.index._seq, rebuilt
+
+        self.index._built_at -= 3600
+        with mock.patch.object(self.index, '_build', side_effect=build) as slow_build:
+            # Served from the old bitmaps while the rebuild runs
+            self.assertEqual(self.team_ids(self.marketing), marketing)
+            self.assertEqual(self.team_ids(self.marketing), marketing)
+            thread = self.index._rebuilding
+            release.set()
+            thread.join(5)
+        self.assertEqual(slow_build.call_count, 1)
+        self.assertEqual(self.team_ids(self.seo), {self.documents[0].id})
+        self.assertEqual(self.team_ids(self.marketing), set())
+
+
+class FacetFilteredSearchTests(DocumentTestCase):
+    def setUp(self):
+        self.search = DocumentSearch()
+        self.search.sharded.config['ENABLED'] = False
+
+    def test_large_candidate_sets_are_filtered_in_sql(self):
+        Document.objects.bulk_create([
+            Document(title=f'report {n}', file=f'documents/{n}.txt', original_filename=f'{n}.txt', file_type='TXT',
+                     team=self.marketing if n % 2 else self.seo, uploaded_by=self.user)
+            for n in range(2 * IN_LIST_MAX + 10)
+        ])
+        candidates = Bitmap(Document.objects.filter(team=self.marketing).values_list('id', flat=True))
+        with mock.patch('search.utils.facet_index.candidates', return_value=candidates), \
+                mock.patch('search.utils.top_rows', wraps=top_rows) as wrapped:
+            results = list(self.search.search_documents('report', {'team': self.marketing.id}))
+        self.assertTrue(results)
+        self.assertTrue(all(document.team_id == self.marketing.id for document in results))
+        # Sent to SQL as the team filter, not as a 1005-id IN list or a Python scan
+        self.assertIsNone(wrapped.call_args.args[2])
+
+
+class CollapsedSearchTests(DocumentTestCase):
+    def test_count_is_not_reduced_by_collapsing(self):
+        documents = [make_document(self.marketing, self.user, f'report {n}') for n in range(3)]
+        signature = near_duplicates.signature('quarterly report for the marketing team')
+        near_duplicates.add_many([(documents[0].id, signature), (documents[1].id, signature)])
+
+        payload = search_payload('report', {}, collapse=True)
+        self.assertEqual(payload['count'], 3)
+        self.assertEqual(payload['collapsed'], 1)
+        self.assertEqual(len(payload['results']), 2)
+        self.assertNotIn('collapsed', search_payload('report', {}))
+
+
+class SearchResultCacheTests(DocumentTestCase):
+    def setUp(self):
+        self.results = SearchResultCache({'ENABLED': True})
+        # Versions roll back between tests, so keys could repeat
+        self.results.cache.clear()
+        self.addCleanup(self.results.cache.clear)
+        self.document = make_document(self.marketing, self.user, 'report')
+
+    def test_views_keep_entries_and_edits_retire_them(self):
+        payload, hit = self.results.results('report', {})
+        self.assertFalse(hit)
+        self.assertEqual(payload['results'][0]['access_count'], 0)
+
+        self.client.get(f'/api/documents/documents/{self.document.id}/')
+        payload, hit = self.results.results('Report ', {})
+        self.assertTrue(hit)
+        self.document.refresh_from_db()
+        expected = DocumentListSerializer(Document.objects.filter(pk=self.document.pk), many=True).data
+        self.assertEqual(JSONRenderer().render(payload['results']), JSONRenderer().render(expected))
+        self.assertEqual(payload['results'][0]['access_count'], 1)
+
+        self.document.title = 'report summary'
+        self.document.save()
+        payload, hit = self.results.results('report', {})
+        self.assertFalse(hit)
+        self.assertEqual(payload['results'][0]['title'], 'report summary')
+
+    def test_cached_rows_hold_no_access_fields(self):
+        self.document.increment_access_count()
+        self.results.results('report', {})
+        with mock.patch.object(self.results.cache, 'set') as cache_set:
+            self.results.cache.clear()
+            self.results.results('report', {})
+        row = cache_set.call_args.args[1]['results'][0]
+        self.assertIsNone(row['access_count'])
+        self.assertIsNone(row['last_accessed'])
+
+    def test_renames_retire_entries(self):
+        self.results.results('report', {})
+        self.seo.name = 'Search'
+        self.seo.save()
+        self.assertFalse(self.results.results('report', {})[1])
+
+    def test_collapsed_entries_follow_clusters(self):
+        duplicate = make_document(self.marketing, self.user, 'report copy')
+        self.assertEqual(self.results.results('report', {}, collapse=True)[0]['collapsed'], 0)
+        self.assertFalse(self.results.results('report', {})[1])
+        signature = near_duplicates.signature('the same text in both documents')
+        near_duplicates.add_many([(self.document.id, signature), (duplicate.id, signature)])
+        payload, hit = self.results.results('report', {}, collapse=True)
+        self.assertFalse(hit)
+        self.assertEqual(payload['collapsed'], 1)
+        # Plain results do not depend on clusters
+        self.assertTrue(self.results.results('report', {})[1])
+
+
+class QueryLogTests(DocumentTestCase):
+    def setUp(self):
+        make_document(self.marketing, self.user, 'report')
+        enabled = mock.patch.dict(query_logger.config, ENABLED=True)
+        enabled.start()
+        self.addCleanup(enabled.stop)
+
+    def test_logged_searches_are_written(self):
+        # Flushed here rather than by the writer thread
+        with mock.patch.object(query_logger, '_start'):
+            response = self.client.get('/api/search/', {'q': 'Report', 'team': self.marketing.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(query_logger.flush(), 1)
+
+        log = QueryLog.objects.get()
+        self.assertEqual((log.event, log.query, log.result_count), ('SEARCH', 'report', 1))
+        self.assertEqual(log.filters, {'team': str(self.marketing.id)})
+        self.assertEqual(str(log.search_id), response.json()['search_id'])
+
+    def test_disabled_logging_queues_nothing(self):
+        with mock.patch.dict(query_logger.config, ENABLED=False), mock.patch.object(query_logger, '_start') as start:
+            query_logger.record('report')
+        start.assert_not_called()
+        self.assertEqual(query_logger.flush(), 0)
+
+
+class AsyncSearchViewTests(DocumentTestCase):
+    def setUp(self):
+        self.report = make_document(self.marketing, self.user, 'Quarterly report', content_extracted=True)
+        make_document(self.seo, self.user, 'Report archive', file_type='PDF')
+        make_document(self.seo, self.user, 'Keywords')
+
+    async def test_search_with_facets(self):
+        response = await self.async_client.get('/api/search/async/', {'q': 'report', 'team': self.marketing.id})
+        self.assertEqual(response.status_code, 200)
+        payload = json.loads(response.content)
+        self.assertEqual(payload['count'], 1)
+        self.assertEqual([row['id'] for row in payload['results']], [self.report.id])
+        self.assertEqual(payload['facets']['teams'], [
+            {'team__id': self.marketing.id, 'team__name': 'Marketing', 'count': 1},
+        ])
+        response = await self.async_client.get('/api/search/async/')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_stats(self):
+        payload = json.loads((await self.async_client.get('/api/search/async/stats/')).content)
+        self.assertEqual((payload['total_documents'], payload['searchable_documents']), (3, 1))
+        teams = {row['team__name']: row['count'] for row in payload['available_filters']['teams']}
+        self.assertEqual(teams, {'Marketing': 1, 'SEO': 2})
+        file_types = {row['file_type']: row['count'] for row in payload['available_filters']['file_types']}
+        self.assertEqual(file_types, {'TXT': 2, 'PDF': 1})
+
+    async def test_suggestions(self):
+        payload = json.loads((await self.async_client.get('/api/search/async/suggestions/', {'q': 'rep'})).content)
+        self.assertTrue(payload['suggestions'])
+
+
+class ShardedSearchTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        user = User.objects.create_user('tester')
+        self.marketing = Team.objects.create(name='Marketing')
+        self.seo = Team.objects.create(name='SEO')
+        self.documents = [
+            make_document(self.marketing if n % 2 else self.seo, user, f'report {n}') for n in range(10)
+        ]
+        self.strategy = Document.objects.filter(title__startswith='report').order_by('-pk')
+
+    def sharded(self, **config):
+        sharded = ShardedSearch({'ENABLED': True, 'LARGE_TEAM_THRESHOLD': 2, 'MAX_BUCKETS_PER_TEAM': 2, **config})
+        self.addCleanup(lambda: sharded._executor and sharded._executor.shutdown())
+        return sharded
+
+    def search_ids(self, sharded, team_id=None):
+        with mock.patch.object(ShardedSearch, '_fan_out', wraps=sharded._fan_out) as fan_out:
+            ids = [document.id for document in sharded.search([self.strategy], team_id, 4)]
+        return ids, fan_out.called
+
+    def test_disabled_by_default(self):
+        self.assertFalse(ShardedSearch().enabled)
+
+    def test_one_database_runs_a_single_query(self):
+        sharded = self.sharded()
+        self.assertEqual(self.search_ids(sharded), ([document.id for document in self.documents[::-1][:4]], False))
+        marketing = [document.id for document in self.documents[::-1] if document.team_id == self.marketing.id]
+        self.assertEqual(self.search_ids(sharded, self.marketing.id), (marketing[:4], False))
+
+    def test_shards_on_several_databases_fan_out_and_merge(self):
+        sharded = self.sharded(DATABASES=['default', 'replica'])
+        self.assertEqual({shard.database for shard in sharded.shard_map.all_shards()}, {'default', 'replica'})
+        self.assertEqual(self.search_ids(sharded), ([document.id for document in self.documents[::-1][:4]], True))
+        seo = [document.id for document in self.documents[::-1] if document.team_id == self.seo.id]
+        self.assertEqual(self.search_ids(sharded, self.seo.id), (seo[:4], True))
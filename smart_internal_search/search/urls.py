@@ -1,8 +1,15 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('search/', views.search_documents, name='search-documents'),
     path('search/suggestions/', views.search_suggestions, name='search-suggestions'),
     path('search/stats/', views.search_stats, name='search-stats'),
+    path('search/click/', views.search_click, name='search-click'),
+    path('search/analytics/', views.search_analytics, name='search-analytics'),
+
+    # Native async variants for the ASGI deployment
+    path('search/async/', async_views.search_documents, name='async-search-documents'),
+    path('search/async/suggestions/', async_views.search_suggestions, name='async-search-suggestions'),
+    path('search/async/stats/', async_views.search_stats, name='async-search-stats'),
 ]
\ No newline at end of file
@@ -1,45 +1,106 @@
-import re
 from typing import List, Dict, Any
-from django.db.models import Q
-from django.db import connection
+from django.conf import settings
 from documents.models import Document
+from .backends import get_search_backend
+from .facets import facet_index
+from .sharding import IN_LIST_MAX, ShardedSearch, top_rows
 
 
 class DocumentSearch:
-    """SQLite-compatible document search with multiple strategies"""
+    """Document search with filters, delegating text matching to the configured backend"""
 
     def __init__(self):
         self.min_search_length = 2
         self.max_results = 100
+        self.sharded = ShardedSearch(getattr(settings, 'SEARCH_CONFIG', {}).get('SHARDS'))
+
+    @property
+    def backend(self):
+        return get_search_backend()
 
     def search_documents(self, query: str, filters: Dict[str, Any] = None) -> List[Document]:
         """
         Perform advanced search on documents (SQLite compatible)
         """
+        filters = filters or {}
         if not query or len(query.strip()) < self.min_search_length:
             return Document.objects.none()
 
+        # Facet filters are bitmap intersections checked against text-match
+        # ids. The ORM filters are used when the facet index is off, and for
+        # candidate sets too large for an IN list.
+        if facet_index.enabled:
+            candidates = facet_index.candidates(filters)
+            if candidates is not None and not candidates:
+                return Document.objects.none()
+            if candidates is not None and len(candidates) > IN_LIST_MAX and not self.backend.uses_index:
+                candidates = None
+                strategies = self._strategy_querysets(query, filters)
+            else:
+                strategies = self._strategy_querysets(query)
+        else:
+            candidates = None
+            strategies = self._strategy_querysets(query, filters)
+
+        if self.backend.uses_index:
+            return self._search_index(query.strip(), filters, candidates)
+
+        if self.sharded.enabled:
+            return self.sharded.search(strategies, filters.get('team'), self.max_results, candidates)
+
+        for results in strategies:
+            top_ids = [row[0] for row in top_rows(results, [], candidates, self.max_results)]
+            if top_ids:
+                return results.filter(pk__in=top_ids)[:self.max_results]
+
+        return Document.objects.none()
+
+    def _search_index(self, query, filters, candidates):
+        """Search a backend that ranks ids itself; only the final page hits the database"""
+        for ids in self.backend.ranked_ids(query):
+            if candidates is not None:
+                ids = [document_id for document_id in ids if document_id in candidates]
+            elif filters:
+                # Facet index disabled: filter the best candidates in SQL
+                matches = self._apply_filters(Document.objects.all(), filters).filter(
+                    pk__in=ids[:self.backend.max_candidates]
+                )
+                ids = list(matches.order_by('-uploaded_at').values_list('pk', flat=True)[:self.max_results])
+            if ids:
+                return Document.objects.filter(pk__in=ids[:self.max_results]).order_by('-uploaded_at')
+
+        return Document.objects.none()
+
+    async def asearch_documents(self, query: str, filters: Dict[str, Any] = None):
+        """
+        Async variant of search_documents for the ASGI endpoints.
+
+        Returns the unsliced matching queryset, from which callers build the
+        result page, count and facet queries. Facets cover the whole match
+        set, so this path does not use the shard fan-out.
+        """
+        for results in self._strategy_querysets(query, filters):
+            if await results.aexists():
+                return results
+
+        return Document.objects.none()
+
+    def _strategy_querysets(self, query: str, filters: Dict[str, Any] = None):
+        """Yield the queryset of each search strategy, best first"""
+        if not query or len(query.strip()) < self.min_search_length:
+            return
+
         query = query.strip()
-        filters = filters or {}
 
         # Start with base queryset
         queryset = Document.objects.all()
 
         # Apply filters
-        queryset = self._apply_filters(queryset, filters)
+        if filters:
+            queryset = self._apply_filters(queryset, filters)
 
-        # Use SQLite-compatible search methods
-        search_methods = [
-            self._weighted_search,
-            self._basic_icontains_search
-        ]
-
-        for method in search_methods:
-            results = method(queryset, query)
-            if results.exists():
-                return results[:self.max_results]
-
-        return Document.objects.none()
+        # Backend strategies, best first
+        yield from self.backend.search_querysets(queryset, query)
 
     def _apply_filters(self, queryset, filters):
         """Apply filters to the queryset"""
@@ -49,85 +110,38 @@ class DocumentSearch:
             queryset = queryset.filter(project_id=filters['project'])
         if filters.get('file_type'):
             queryset = queryset.filter(file_type=filters['file_type'])
-        if filters.get('topic'):
-            queryset = queryset.filter(topics__id=filters['topic'])
         if filters.get('status'):
             queryset = queryset.filter(status=filters['status'])
+        if filters.get('topic'):
+            # Only the topics join can duplicate rows
+            queryset = queryset.filter(topics__id=filters['topic']).distinct()
 
-        return queryset.distinct()
-
-    def _weighted_search(self, queryset, query):
-        """
-        Weighted search that prioritizes different fields
-        """
-        words = self._split_query(query)
-
-        if not words:
-            return Document.objects.none()
-
-        # Build weighted Q objects
-        q_objects = Q()
-        for word in words:
-            # Title matches are most important (weight 4)
-            title_q = Q(title__icontains=word)
-            # Content matches are important (weight 3)
-            content_q = Q(content_text__icontains=word)
-            # Description matches are medium importance (weight 2)
-            desc_q = Q(description__icontains=word)
-            # Filename matches are less important (weight 1)
-            filename_q = Q(original_filename__icontains=word)
-
-            # Combine with OR for this word
-            word_q = title_q | content_q | desc_q | filename_q
-            q_objects &= word_q  # Use AND between words
-
-        if q_objects:
-            # First get exact matches
-            exact_matches = queryset.filter(q_objects)
-
-            # If we have exact matches, return them ordered by relevance
-            if exact_matches.exists():
-                return exact_matches.order_by('-uploaded_at')
-
-        return Document.objects.none()
-
-    def _basic_icontains_search(self, queryset, query):
-        """Fallback to basic case-insensitive search"""
-        words = self._split_query(query)
-
-        # Build Q objects for each word
-        q_objects = Q()
-        for word in words:
-            if len(word) >= self.min_search_length:
-                q_objects |= (
-                        Q(title__icontains=word) |
-                        Q(content_text__icontains=word) |
-                        Q(description__icontains=word) |
-                        Q(original_filename__icontains=word)
-                )
-
-        if q_objects:
-            return queryset.filter(q_objects).order_by('-uploaded_at')
-
-        return Document.objects.none()
-
-    def _split_query(self, query: str) -> List[str]:
-        """Split query into meaningful words"""
-        # Remove special characters and split
-        words = re.findall(r'\b\w+\b', query.lower())
-        return [word for word in words if len(word) >= self.min_search_length]
+        return queryset
 
     def get_search_suggestions(self, query: str, limit: int = 5) -> List[str]:
         """Get search suggestions based on existing documents"""
         if len(query) < 2:
             return []
 
-        suggestions = set()
+        titles = self._suggestion_titles(query, limit)
+        return self._suggestions_from_titles(titles, query, limit)
+
+    async def aget_search_suggestions(self, query: str, limit: int = 5) -> List[str]:
+        """Async variant of get_search_suggestions"""
+        if len(query) < 2:
+            return []
 
-        # Get matching titles
-        titles = Document.objects.filter(
+        titles = [title async for title in self._suggestion_titles(query, limit)]
+        return self._suggestions_from_titles(titles, query, limit)
+
+    def _suggestion_titles(self, query: str, limit: int):
+        # Get more titles than needed to leave room for filtering
+        return Document.objects.filter(
             title__icontains=query
-        ).values_list('title', flat=True)[:limit * 2]  # Get more for filtering
+        ).values_list('title', flat=True)[:limit * 2]
+
+    def _suggestions_from_titles(self, titles, query: str, limit: int) -> List[str]:
+        suggestions = set()
 
         for title in titles:
             # Extract relevant parts of title containing the query
@@ -145,19 +159,29 @@ class DocumentSearch:
 
 
 class SearchIndexer:
-    """Handles indexing for SQLite"""
+    """Routes indexing to the configured search backend"""
 
     @staticmethod
     def index_document(document: Document):
         """Index a single document for search"""
+        get_search_backend().index_document(document)
         print(f"Indexed document: {document.title}")
 
+    @staticmethod
+    def index_documents(documents):
+        """Index a batch of documents with a single index commit"""
+        backend = get_search_backend()
+        for document in documents:
+            backend.index_document(document)
+        backend.flush()
+        print(f"Indexed {len(documents)} documents")
+
     @staticmethod
     def reindex_all():
         """Reindex all documents"""
         documents = Document.objects.all()
-        for doc in documents:
-            SearchIndexer.index_document(doc)
+        get_search_backend().reindex(documents)
+        facet_index.invalidate()
         return f"Reindexed {documents.count()} documents"
 
 
@@ -1,10 +1,15 @@
+import time
+import uuid
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
+from .caching import search_cache
+from .querylog import query_analytics, query_logger
 from .utils import document_search
-from documents.models import Document
-from documents.serializers import DocumentListSerializer
+from documents.conditional import conditional
+from documents.models import Document, Project, Team, Topic
+from documents.taxonomy import taxonomy
 
 
 @api_view(['GET'])
@@ -32,18 +37,18 @@ def search_documents(request):
     filters = {k: v for k, v in filters.items() if v}
 
     try:
-        # Perform search
-        documents = document_search.search_documents(query, filters)
+        # Perform search, or reuse a cached page for the current index
+        started = time.perf_counter()
+        # collapse=1 keeps one document per near-duplicate cluster
+        collapse = request.GET.get('collapse') in ('1', 'true')
+        payload, _ = search_cache.results(query, filters, collapse)
+        latency_ms = (time.perf_counter() - started) * 1000
 
-        # Serialize results
-        serializer = DocumentListSerializer(documents, many=True)
+        # Logged off the request path; clients send search_id back with clicks
+        search_id = uuid.uuid4()
+        query_logger.record(query, filters, latency_ms, payload['count'], search_id=search_id)
 
-        return Response({
-            'query': query,
-            'filters': filters,
-            'count': documents.count(),
-            'results': serializer.data
-        })
+        return Response({**payload, 'search_id': str(search_id)})
 
     except Exception as e:
         return Response({
@@ -62,8 +67,7 @@ def search_suggestions(request):
         return Response({'suggestions': []})
 
     try:
-        suggestions = document_search.get_search_suggestions(query)
-        return Response({'suggestions': suggestions})
+        return Response(search_cache.suggestions(query))
 
     except Exception as e:
         return Response({
@@ -73,39 +77,82 @@ def search_suggestions(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional(Document, Team, Project, Topic, Document.topics.through)
 def search_stats(request):
     """
     Get search statistics and available filters
     """
     from django.db.models import Count
 
-    # Get counts for filters
-    teams = Document.objects.values('team__id', 'team__name').annotate(
-        count=Count('id')
-    ).filter(count__gt=0)
+    # Get counts for filters; names come from the taxonomy cache, not joins
+    teams = taxonomy.with_names(
+        Document.objects.values('team__id').annotate(count=Count('id')).filter(count__gt=0),
+        'team', 'team__id', 'team__name',
+    )
 
-    projects = Document.objects.values('project__id', 'project__name').annotate(
-        count=Count('id')
-    ).filter(count__gt=0)
+    projects = taxonomy.with_names(
+        Document.objects.values('project__id').annotate(count=Count('id')).filter(count__gt=0),
+        'project', 'project__id', 'project__name',
+    )
 
     file_types = Document.objects.values('file_type').annotate(
         count=Count('id')
     ).filter(count__gt=0)
 
-    topics = Document.objects.values('topics__id', 'topics__name').annotate(
-        count=Count('id')
-    ).filter(count__gt=0)
+    topics = taxonomy.with_names(
+        Document.objects.values('topics__id').annotate(count=Count('id')).filter(count__gt=0),
+        'topic', 'topics__id', 'topics__name',
+    )
 
     return Response({
         'available_filters': {
-            'teams': list(teams),
-            'projects': list(projects),
+            'teams': teams,
+            'projects': projects,
             'file_types': list(file_types),
-            'topics': list(topics),
+            'topics': topics,
         },
         'total_documents': Document.objects.count(),
         'searchable_documents': Document.objects.filter(
             content_extracted=True
         ).count(),
-        'search_engine': 'SQLite (Basic Search)'
-    })
\ No newline at end of file
+        'search_engine': document_search.backend.name
+    })
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def search_click(request):
+    """
+    Record a click on a search result
+    """
+    try:
+        document_id = int(request.data.get('document'))
+        search_id = request.data.get('search_id')
+        search_id = uuid.UUID(str(search_id)) if search_id else None
+    except (TypeError, ValueError):
+        return Response({
+            'error': 'A valid document id (and optional search_id) is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if not Document.objects.filter(pk=document_id).exists():
+        return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    query_logger.record_click(request.data.get('q', ''), document_id, search_id=search_id)
+    return Response({'status': 'recorded'}, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def search_analytics(request):
+    """
+    Top, zero-result and slowest queries from the query log
+    """
+    try:
+        days = min(max(int(request.GET.get('days', 7)), 1), 365)
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        return Response({
+            'error': 'days and limit must be integers'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(query_analytics(days=days, limit=limit))